@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Tafsir HTTP API
+A read-only JSON service over the same index, corpus store and translation
+cache the viewer uses, for clients that do not need the Streamlit UI
+
+Endpoints:
+    /authors                               Author folders
+    /surahs?author=<author>                Surahs, for one author or per author
+    /tafsir/<author>/<surah>/<ayah>?lang=  One ayah's tafsir, optionally translated
+
+Responses carry strong ETags and are compressed with brotli (when the
+brotli package is installed) or gzip; a matching If-None-Match gets a 304.
+Requests are served by a fixed pool of worker threads. Only cached
+translations are served unless the service runs with --translate.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import metrics
+from corpus_store import CorpusStore
+from export import METADATA_FIELDS
+from manifest import MANIFEST_PATH, load_index
+from rendering import LRUCache
+from translate import LANGUAGE_CODES, TafsirTranslator
+from translation_cache import TranslationCache, get_or_translate, translation_memory
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_SIZE = 512
+
+# Budget for encoded responses kept in memory
+RESPONSE_CACHE_BYTES = 64 * 1024 * 1024
+
+# Seconds an idle keep-alive connection may hold a worker; a client that
+# keeps its connection open between requests occupies a worker until then
+KEEPALIVE_TIMEOUT = 1
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _encode(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def choose_encoding(accept_encoding: str) -> str:
+    """Pick br, gzip or identity from an Accept-Encoding header"""
+    offered = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            offered[name.lower()] = quality
+    for encoding in (('br', 'gzip') if brotli is not None else ('gzip',)):
+        if offered.get(encoding, offered.get('*', 0.0)) > 0:
+            return encoding
+    return 'identity'
+
+
+class TafsirApi:
+    """
+    Builds JSON responses for API paths
+
+    Finished responses, with their ETag and each encoding sent so far, are
+    kept in a byte-bounded LRU, so a popular ayah is encoded once. Responses
+    holding a failed translation are not kept.
+    """
+
+    def __init__(self, base_folder: str = 'data', packed_folder: str = 'packed',
+                 manifest_path: str = MANIFEST_PATH, cache_db_path: str = os.path.join('cache', 'translations.db'),
+                 legacy_folder: Optional[str] = 'cache', translate_missing: bool = False):
+        self.index = load_index(base_folder, manifest_path)
+        self.corpus = CorpusStore(base_folder, packed_folder)
+        self.cache = TranslationCache(cache_db_path, legacy_folder=legacy_folder)
+        self.cache_db_path = cache_db_path
+        self.translate_missing = translate_missing
+        self.responses = LRUCache(RESPONSE_CACHE_BYTES, name='api')
+        self._translator: Optional[TafsirTranslator] = None
+        self._translator_lock = threading.Lock()
+
+    @property
+    def translator(self) -> TafsirTranslator:
+        # Created on the first translation, so a cache-only service never builds one
+        with self._translator_lock:
+            if self._translator is None:
+                rate = os.environ.get('TAFSIR_REQUESTS_PER_SECOND')
+                self._translator = TafsirTranslator(max_workers=4, requests_per_second=float(rate) if rate else None,
+                                                    memory=translation_memory(self.cache_db_path))
+            return self._translator
+
+    def response(self, path: str, query: Dict[str, str], encoding: str) -> Tuple[str, bytes, str]:
+        """
+        Return (etag, body, encoding actually used) for a path
+
+        Raises:
+            ApiError: For unknown paths and missing resources
+        """
+        key = ('response', path, tuple(sorted(query.items())))
+        entry = self.responses.get(key)
+        cacheable = True
+        if entry is None:
+            payload, cacheable = self._payload(path, query)
+            body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            entry = {'etag': hashlib.blake2b(body, digest_size=16).hexdigest(), 'identity': body}
+
+        if encoding != 'identity' and len(entry['identity']) < MIN_COMPRESS_SIZE:
+            encoding = 'identity'
+        if encoding not in entry:
+            entry = dict(entry, **{encoding: _encode(entry['identity'], encoding)})
+            if cacheable:
+                self.responses.put(key, entry)
+        elif cacheable and key not in self.responses:
+            self.responses.put(key, entry)
+        # Strong validators differ per encoding, since the bytes differ
+        etag = entry['etag'] if encoding == 'identity' else f"{entry['etag']}-{encoding}"
+        return f'"{etag}"', entry[encoding], encoding
+
+    def _payload(self, path: str, query: Dict[str, str]) -> Tuple[object, bool]:
+        parts = [part for part in path.split('/') if part]
+        if parts == ['authors']:
+            return self.index.authors, True
+        if parts == ['surahs']:
+            return self._surahs(query.get('author')), True
+        if len(parts) == 4 and parts[0] == 'tafsir':
+            try:
+                surah, ayah = int(parts[2]), int(parts[3])
+            except ValueError:
+                raise ApiError(400, "Surah and ayah must be numbers")
+            return self._tafsir(parts[1], surah, ayah, query.get('lang'))
+        raise ApiError(404, f"Unknown path: {path}")
+
+    def _surahs(self, author: Optional[str]):
+        def listing(name: str):
+            return [
+                {'surah_number': number, 'surah_name_arabic': name_ar, 'surah_name_english': name_en,
+                 'ayahs': self.index.ayahs(name, number)}
+                for number, name_ar, name_en in self.index.surahs(name)
+            ]
+
+        if author is None:
+            return {name: listing(name) for name in self.index.authors}
+        if author not in self.index.authors:
+            raise ApiError(404, f"Unknown author: {author}")
+        return listing(author)
+
+    def _tafsir(self, author: str, surah: int, ayah: int, lang: Optional[str]) -> Tuple[Dict, bool]:
+        record = self.index.get(author, surah, ayah)
+        if record is None:
+            raise ApiError(404, f"No tafsir for {author} {surah}:{ayah}")
+        if lang and lang not in LANGUAGE_CODES.values():
+            raise ApiError(400, f"Unknown language: {lang}")
+
+        try:
+            with metrics.span('read_text'):
+                text = self.corpus.read(author, surah, ayah)
+        except FileNotFoundError:
+            raise ApiError(404, f"Tafsir text missing for {author} {surah}:{ayah}")
+
+        payload = {field: record[field] for field in METADATA_FIELDS if field != 'source_file'}
+        payload['lang'] = lang or 'ar'
+        cacheable = True
+        if lang:
+            if self.translate_missing:
+                text, result = get_or_translate(self.cache, self.translator, text, lang, author, surah, ayah)
+                cacheable = result is None or not result['failed_chunks']
+            else:
+                text = self.cache.get(lang, author, surah, ayah)
+                if text is None:
+                    raise ApiError(404, f"No cached {lang} translation for {author} {surah}:{ayah}")
+        payload['text'] = text
+        return payload, cacheable
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEPALIVE_TIMEOUT
+    api: TafsirApi = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        endpoint = url.path.strip('/').split('/', 1)[0]
+        if endpoint not in ('authors', 'surahs', 'tafsir'):
+            endpoint = 'other'
+
+        with metrics.span('api_request', endpoint=endpoint):
+            try:
+                etag, body, encoding = self.api.response(url.path, query,
+                                                         choose_encoding(self.headers.get('Accept-Encoding', '')))
+            except ApiError as e:
+                self._send_error(e.status, str(e))
+                status = e.status
+            except Exception as e:
+                self._send_error(500, f"Internal error: {e}")
+                status = 500
+            else:
+                status = self._send(etag, body, encoding)
+        metrics.inc('tafsir_api_requests_total', endpoint=endpoint, status=status)
+
+    def _send(self, etag: str, body: bytes, encoding: str) -> int:
+        if etag in (tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return 304
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Cache-Control', 'no-cache')
+        if encoding != 'identity':
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+        self.wfile.write(body)
+        return 200
+
+    def _send_error(self, status: int, message: str) -> None:
+        body = json.dumps({'error': message}, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer that hands each connection to a fixed pool of worker threads"""
+
+    def __init__(self, address, handler, workers: int = 8):
+        super().__init__(address, handler)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api')
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+def create_server(api: TafsirApi, port: int = 8502, host: str = '127.0.0.1', workers: int = 8) -> PooledHTTPServer:
+    handler = type('TafsirApiHandler', (ApiHandler,), {'api': api})
+    return PooledHTTPServer((host, port), handler, workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve tafsir lookups as a JSON HTTP API")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on")
+    parser.add_argument('--port', type=int, default=8502, help="Port to listen on")
+    parser.add_argument('--workers', type=int, default=8, help="Worker threads serving requests; each open connection holds one, "
+                             f"idle for up to {KEEPALIVE_TIMEOUT} s between requests, so allow at least one per "
+                             "concurrent client")
+    parser.add_argument('--translate', action='store_true',
+                        help="Translate missing translations through the provider instead of returning 404")
+    parser.add_argument('--data', default='data', help="Folder containing the author folders")
+    parser.add_argument('--packed', default='packed', help="Folder containing packed author blobs")
+    parser.add_argument('--manifest', default=MANIFEST_PATH, help="Corpus manifest, used when it has been built")
+    parser.add_argument('--cache-db', default=os.path.join('cache', 'translations.db'), help="Translation cache database")
+    parser.add_argument('--legacy-cache', default='cache', help="Legacy cache/<lang>/<author>/ tree to import from")
+    args = parser.parse_args()
+
+    api = TafsirApi(args.data, args.packed, args.manifest, args.cache_db, args.legacy_cache,
+                    translate_missing=args.translate)
+    server = create_server(api, args.port, args.host, args.workers)
+    print(f"Serving tafsir API on http://{args.host}:{args.port} with {args.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
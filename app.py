@@ -1,11 +1,29 @@
-import json
 import re
 import os
+import html
+import time
+import uuid
 import streamlit as st
-from translate import TafsirTranslator
+from concurrent.futures import ThreadPoolExecutor
+from translate import TafsirTranslator, LANGUAGE_CODES, normalize_translation
+from tafsir_index import TafsirIndex, load_entries
+from manifest import load_manifest
+from corpus_store import CorpusStore
+from translation_cache import TranslationCache, get_or_translate, shared_entry, translate_and_store_batch, translation_memory
+from search_index import SearchIndex
+from citations import CitationGraph, surah_name
+from rendering import split_into_pages, cached_pages, LRUCache, INITIAL_PAGES, RENDER_CACHE_BYTES
+from prefetch import Prefetcher, following_ayahs, PREFETCH_AHEAD
+import metrics
 
 base_folder = "data"
-cache_folder = "cache"
+# Overridable so load tests do not write into the real translation cache
+cache_folder = os.environ.get("TAFSIR_CACHE_FOLDER", "cache")
+packed_folder = "packed"
+manifest_path = os.path.join(packed_folder, "manifest.bin")
+cache_db_path = os.path.join(cache_folder, "translations.db")
+search_index_folder = os.path.join("index", "search")
+citation_index_folder = os.path.join("index", "citations")
 
 # --- App Configuration ---
 st.set_page_config(
@@ -181,6 +199,31 @@ st.markdown("""
         margin-bottom: 0.5rem;
     }
     
+    /* Search Results */
+    .search-hit {
+        font-family: 'Inter', sans-serif;
+        background: rgba(255, 255, 255, 0.9);
+        border-left: 4px solid #764ba2;
+        border-radius: 6px;
+        padding: 0.5rem 1rem;
+        margin-bottom: 0.5rem;
+        box-shadow: 0 2px 5px rgba(0,0,0,0.05);
+    }
+
+    .search-hit .search-snippet {
+        direction: rtl;
+        font-family: 'Amiri', 'Noto Naskh Arabic', serif;
+        font-size: 1.05rem;
+        line-height: 1.7;
+        margin-top: 0.3rem;
+    }
+
+    .search-hit mark {
+        background: #ffe58f;
+        padding: 0 2px;
+        border-radius: 3px;
+    }
+    
     /* Info and Warning Messages */
     .stInfo {
         background: linear-gradient(135deg, #dbe6f6 0%, #c5796d 100%);
@@ -244,52 +287,203 @@ st.markdown('<div class="main-header"><h1>📖 Quran Tafsir Viewer</h1></div>',
 # --- Load JSON from author/surah-structured folder ---
 @st.cache_data
 def load_all_tafsir_data():
-    all_data = []
-    for author_folder in os.listdir(base_folder):
-        author_path = os.path.join(base_folder, author_folder)
-        if os.path.isdir(author_path):
-            for filename in os.listdir(author_path):
-                if filename.endswith(".json"):
-                    file_path = os.path.join(author_path, filename)
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        try:
-                            content = json.load(f)
-                            for entry in content:
-                                entry["source_file"] = filename
-                                entry["author"] = author_folder
-                                all_data.append(entry)
-                        except Exception as e:
-                            st.warning(f"Error reading {file_path}: {e}")
-    return all_data
+    with metrics.span("load_entries"):
+        return load_entries(base_folder, on_error=lambda file_path, e: st.warning(f"Error reading {file_path}: {e}"))
+
+@st.cache_resource
+def load_tafsir_index():
+    # The prebuilt manifest is one read; parsing every JSON file is the fallback
+    if os.path.exists(manifest_path):
+        with metrics.span("load_manifest"):
+            return load_manifest(manifest_path)
+    entries = load_all_tafsir_data()
+    with metrics.span("build_index"):
+        return TafsirIndex.from_entries(entries)
+
+@st.cache_resource
+def get_corpus_store():
+    return CorpusStore(base_folder, packed_folder)
+
+@st.cache_resource
+def get_translation_cache():
+    return TranslationCache(cache_db_path, legacy_folder=cache_folder)
+
+@st.cache_resource
+def get_render_cache():
+    # Cleaned texts and their pages, shared by every session
+    max_bytes = int(os.environ.get("TAFSIR_RENDER_CACHE_BYTES", RENDER_CACHE_BYTES))
+    return LRUCache(max_bytes)
+
+@st.cache_resource
+def get_translation_memory():
+    # None unless TAFSIR_TRANSLATION_MEMORY=1
+    return translation_memory(cache_db_path)
+
+@st.cache_resource
+def start_metrics_server():
+    # Scrape /metrics (Prometheus text) or /metrics.json when TAFSIR_METRICS_PORT is set
+    port = os.environ.get("TAFSIR_METRICS_PORT")
+    host = os.environ.get("TAFSIR_METRICS_HOST", "127.0.0.1")
+    return metrics.serve(int(port), host) if port else None
+
+@st.cache_resource
+def get_translator():
+    # Shared by every session: one pooled HTTP session and one rate limit
+    # for the provider, instead of a new translator per click
+    rate = os.environ.get("TAFSIR_REQUESTS_PER_SECOND")
+    return TafsirTranslator(max_workers=4, requests_per_second=float(rate) if rate else None,
+                            memory=get_translation_memory())
+
+@st.cache_resource
+def get_prefetcher():
+    # One background queue for the process, using part of the shared
+    # translator's rate limit and giving way to foreground requests
+    workers = int(os.environ.get("TAFSIR_PREFETCH_WORKERS", 1))
+    return Prefetcher(get_translation_cache(), get_translator(), get_corpus_store(), workers=workers)
+
+@st.cache_resource
+def get_search_index():
+    if not SearchIndex.exists(search_index_folder):
+        return None
+    return SearchIndex(search_index_folder, get_corpus_store())
+
+@st.cache_resource
+def get_citation_graph():
+    # Loads its arrays on first lookup, not here
+    if not CitationGraph.exists(citation_index_folder):
+        return None
+    return CitationGraph(citation_index_folder)
+
+start_metrics_server()
+index = load_tafsir_index()
+corpus = get_corpus_store()
+translation_cache = get_translation_cache()
+render_cache = get_render_cache()
+
+def show_more_pages(key, count):
+    st.session_state.pages_shown[key] = st.session_state.pages_shown.get(key, INITIAL_PAGES) + count
+
+def render_paged_text(text, css_class, key):
+    # Only the pages the reader has asked for are sent to the browser
+    pages = cached_pages(render_cache, key, text)
+    shown = min(st.session_state.pages_shown.get(key, INITIAL_PAGES), len(pages))
+    page_html = "\n".join(pages[:shown])
+    st.markdown(f'<div class="{css_class} scrollable-text">{page_html}</div>', unsafe_allow_html=True)
+
+    if shown < len(pages):
+        remaining = len(pages) - shown
+        key_text = "_".join(str(part) for part in key)
+        col_info, col_more, col_all = st.columns([2, 1, 1])
+        col_info.caption(f"Showing {shown} of {len(pages)} pages")
+        col_more.button("Load more", key=f"more_{key_text}", on_click=show_more_pages, args=(key, 1))
+        col_all.button("Show all", key=f"all_{key_text}", on_click=show_more_pages, args=(key, remaining))
 
-data = load_all_tafsir_data()
+def read_texts(author, surah, ayahs):
+    # Cleaned source texts, served from the render cache where possible;
+    # missing files are left out
+    texts = {}
+    missing = []
+    for ayah in ayahs:
+        text = render_cache.get(("text", author, surah, ayah, None))
+        if text is None:
+            missing.append(ayah)
+        else:
+            texts[ayah] = text
+    if missing:
+        with metrics.span("read_text"):
+            loaded = corpus.read_range(author, surah, missing)
+        for ayah, text in loaded.items():
+            render_cache.put(("text", author, surah, ayah, None), text)
+        texts.update(loaded)
+    return texts
+
+def cached_translations(lang_code, author, surah, ayahs):
+    # Cached translations, from the render cache before the translation cache
+    texts = {}
+    missing = []
+    for ayah in ayahs:
+        text = render_cache.get(("text", author, surah, ayah, lang_code))
+        if text is None:
+            missing.append(ayah)
+        else:
+            texts[ayah] = text
+    if missing:
+        loaded = translation_cache.get_many(lang_code, author, surah, missing)
+        for ayah, text in loaded.items():
+            render_cache.put(("text", author, surah, ayah, lang_code), text)
+        texts.update(loaded)
+    return texts
+
+def remember_translation(lang_code, author, surah, ayah, result, stored):
+    # Only translations that reached the translation cache are kept in memory
+    if stored:
+        render_cache.put(("text", author, surah, ayah, lang_code), result["translated_text"])
+
+def warm_neighbours(author, surah, ayahs, selected_lang):
+    # Loads the ayahs either side of those shown, so stepping to them skips
+    # the reads and the page split
+    available = index.ayahs(author, surah)
+    neighbours = [ayah for ayah in available if ayah < ayahs[0]][-1:] + following_ayahs(available, ayahs[-1], 1)
+    texts = read_texts(author, surah, neighbours)
+    if selected_lang != "None":
+        texts = cached_translations(language_codes[selected_lang], author, surah, neighbours)
+    for ayah, text in texts.items():
+        cached_pages(render_cache, (author, surah, ayah, selected_lang), text)
+
+def text_class(selected_lang):
+    if selected_lang == "None":
+        return "arabic-text"
+    if selected_lang == "Urdu":
+        return "urdu-text"
+    return "translated-text"
+
+def load_comparison_entry(author, surah, ayah, lang_code, translator):
+    # Runs in a worker thread, so it must not call Streamlit
+    entry = {"author": author, "record": index.get(author, surah, ayah), "text": None, "error": None, "warning": None}
+    if entry["record"] is None:
+        return entry
+    try:
+        text = read_texts(author, surah, [ayah]).get(ayah)
+        if text is None:
+            raise FileNotFoundError(corpus.text_path(author, surah, ayah))
+        if lang_code:
+            cached_text = cached_translations(lang_code, author, surah, [ayah]).get(ayah)
+            if cached_text is not None:
+                text = cached_text
+            else:
+                text, result = get_or_translate(translation_cache, translator, text, lang_code, author, surah, ayah)
+                if result is not None:
+                    remember_translation(lang_code, author, surah, ayah, result, not result["failed_chunks"])
+                if result is not None and result["failed_chunks"]:
+                    entry["warning"] = f"{len(result['failed_chunks'])} of {result['total_chunks']} chunks failed to translate; this translation was not cached."
+        entry["text"] = text
+    except FileNotFoundError:
+        entry["error"] = f"Tafsir file not found: {corpus.text_path(author, surah, ayah)}"
+    except Exception as e:
+        entry["error"] = f"Error reading tafsir: {str(e)}"
+    return entry
+
+if "pages_shown" not in st.session_state:
+    st.session_state.pages_shown = {}
+if "reader_id" not in st.session_state:
+    st.session_state.reader_id = uuid.uuid4().hex
+
+# Ayahs translated in the background after the ones shown; 0 turns prefetch off
+prefetch_ahead = int(os.environ.get("TAFSIR_PREFETCH_AHEAD", PREFETCH_AHEAD))
 
 # --- Sidebar Filters ---
 st.sidebar.markdown('<div class="sidebar-header"><h2>🔍 Filter Options</h2></div>', unsafe_allow_html=True)
 
-authors = sorted(set(entry["author"] for entry in data))
+authors = index.authors
 author = st.sidebar.selectbox("📚 Select Author", authors)
+compare_mode = st.sidebar.toggle("🆚 Compare authors")
+compare_authors = st.sidebar.multiselect("📚 Authors to compare", authors, default=[author]) if compare_mode else []
 
 # Select translation language
-language_codes = {
-    "Bengali": "bn",
-    "English": "en",
-    "French": "fr",
-    "German": "de",
-    "Hindi": "hi",
-    "Indonesian": "id",
-    "Malay": "ms",
-    "Spanish": "es",
-    "Swahili": "sw",
-    "Turkish": "tr",
-    "Urdu": "ur"
-}
-
-# Filter data by selected author
-filtered_data = [entry for entry in data if entry.get("author") == author]
-
-# Extract surah info
-surahs = sorted(set((item["surah_number"], item["surah_name_arabic"], item["surah_name_english"]) for item in filtered_data))
+language_codes = LANGUAGE_CODES
+
+# Extract surah info for the selected author
+surahs = index.surahs(author)
 surah_dict = {f"{num} - {name_ar} ({name_en})": num for num, name_ar, name_en in surahs}
 
 surah_display = st.sidebar.selectbox("📖 Select Surah", ["-- Select Surah --"] + list(surah_dict.keys()))
@@ -299,68 +493,190 @@ ayah_range = []
 
 if selected_surah:
     # Get ayahs for the selected surah
-    available_ayahs = sorted([item["ayah_number"] for item in filtered_data if item["surah_number"] == selected_surah])
+    available_ayahs = index.ayahs(author, selected_surah)
     selected_ayah = st.sidebar.selectbox("📝 Select Ayah", available_ayahs)
     ayah_range = [selected_ayah]
+    if not compare_mode:
+        last_ayah = st.sidebar.selectbox("📝 Through Ayah", [ayah for ayah in available_ayahs if ayah >= selected_ayah])
+        ayah_range = [ayah for ayah in available_ayahs if selected_ayah <= ayah <= last_ayah]
 
 selected_lang = st.sidebar.selectbox("🌐 Translate Tafsir To", ["None"] + list(language_codes.keys()))
 
+search_query = st.sidebar.text_input("🔎 Search Tafsir", placeholder='e.g. "بسم الله" or رحم*')
+
+# --- Search Results ---
+if search_query.strip():
+    search_index = get_search_index()
+    if search_index is None:
+        st.info("The search index has not been built yet. Run `python search_index.py build` to enable search.")
+    else:
+        started = time.perf_counter()
+        hits = search_index.search(search_query, limit=20)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        with st.expander(f"🔎 {len(hits)} results for {search_query} ({elapsed_ms:.0f} ms)", expanded=True):
+            for hit in hits:
+                record = index.get(hit["author"], hit["surah"], hit["ayah"])
+                title = f"{record['tafsir_author']} — {record['surah_name_english']} {hit['surah']}:{hit['ayah']}" if record else f"{hit['author']} — {hit['surah']}:{hit['ayah']}"
+                st.markdown(f'''
+                <div class="search-hit">
+                    <strong>{html.escape(title)}</strong>
+                    <div class="search-snippet">{hit['snippet']}</div>
+                </div>
+                ''', unsafe_allow_html=True)
+            if not hits:
+                st.write("No matches found.")
+
+# --- Compare Authors ---
+if compare_mode and selected_surah and ayah_range and compare_authors:
+    lang_code = language_codes[selected_lang] if selected_lang != "None" else None
+    selected_record = index.get(author, selected_surah, selected_ayah)
+    st.markdown(f'''
+    <div class="surah-ayah-info">Surah {selected_record['surah_name_arabic']} ({selected_record['surah_name_english']}) - Ayah {selected_ayah}</div>
+    ''', unsafe_allow_html=True)
+
+    # Authors load side by side, so the wait is the slowest author rather than the sum
+    with st.spinner("Loading tafsir... Please wait."):
+        translator = get_translator()
+        with ThreadPoolExecutor(max_workers=len(compare_authors)) as executor:
+            entries = list(executor.map(
+                lambda compare_author: load_comparison_entry(compare_author, selected_surah, selected_ayah, lang_code, translator),
+                compare_authors
+            ))
+
+    for column, entry in zip(st.columns(len(entries)), entries):
+        with column:
+            record = entry["record"]
+            st.markdown(f'<div class="author-heading">{record["tafsir_author"] if record else entry["author"]}</div>', unsafe_allow_html=True)
+            if record is None:
+                st.info("No tafsir for this ayah.")
+            elif entry["error"]:
+                st.error(entry["error"])
+            else:
+                if entry["warning"]:
+                    st.warning(entry["warning"])
+                render_paged_text(entry["text"], text_class(selected_lang), (entry["author"], selected_surah, selected_ayah, selected_lang))
+
 # --- Display Tafsir ---
-if selected_surah and ayah_range:
-    matching_tafsirs = [entry for entry in filtered_data if entry["surah_number"] == selected_surah and entry["ayah_number"] in ayah_range]
+elif selected_surah and ayah_range:
+    matching_tafsirs = [record for record in (index.get(author, selected_surah, ayah) for ayah in ayah_range) if record]
 
     if matching_tafsirs:
+        # Served from the render cache, or read with one slice of the packed blob
+        range_texts = read_texts(author, selected_surah, [tafsir['ayah_number'] for tafsir in matching_tafsirs])
+        lang_class = text_class(selected_lang)
+
+        # Ranges are translated together so short ayahs share requests; a
+        # single ayah is streamed below instead
+        range_translations = {}
+        range_warnings = {}
+        if selected_lang != "None" and len(matching_tafsirs) > 1:
+            lang_code = language_codes[selected_lang]
+            range_translations = cached_translations(lang_code, author, selected_surah, range_texts)
+            missing = {ayah: text for ayah, text in range_texts.items() if ayah not in range_translations}
+            if missing:
+                with st.spinner(f"Translating {len(missing)} ayahs... Please wait."):
+                    translator = get_translator()
+                    batch = translate_and_store_batch(translation_cache, translator, missing, lang_code, author, selected_surah)
+                for ayah, (result, stored) in batch.items():
+                    range_translations[ayah] = result["translated_text"]
+                    remember_translation(lang_code, author, selected_surah, ayah, result, stored)
+                    if not stored:
+                        range_warnings[ayah] = f"{len(result['failed_chunks'])} of {result['total_chunks']} chunks failed to translate; this translation was not cached."
         
         for tafsir in matching_tafsirs:
+            ayah = tafsir['ayah_number']
+
             # Header with Surah and Ayah info
             st.markdown(f'''
             <div>
                 <div class="author-heading">Tafsir by {tafsir['tafsir_author']}</div>
-                <div class="surah-ayah-info">Surah {tafsir['surah_name_arabic']} ({tafsir['surah_name_english']}) - Ayah {tafsir['ayah_number']}</div>
+                <div class="surah-ayah-info">Surah {tafsir['surah_name_arabic']} ({tafsir['surah_name_english']}) - Ayah {ayah}</div>
             </div>
             ''', unsafe_allow_html=True)
         
-            file_path = os.path.join(base_folder, author, f"{selected_surah}_{selected_ayah}.txt")
+            file_path = corpus.text_path(author, selected_surah, ayah)
             
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    tafsir_text = f.read()
-                
-                # data cleaning
-                tafsir_text = tafsir_text.replace('الباحث القرآني', '')
-                
+                # Cleaned text, from the packed store when available
+                if ayah not in range_texts:
+                    raise FileNotFoundError(file_path)
+                tafsir_text = range_texts[ayah]
+
                 if selected_lang != "None":
-                    cache_file_path = os.path.join(cache_folder, language_codes[selected_lang], author, f"{selected_surah}_{selected_ayah}.txt")
+                    lang_code = language_codes[selected_lang]
+                    cached_text = range_translations.get(ayah)
+                    if cached_text is None:
+                        cached_text = cached_translations(lang_code, author, selected_surah, [ayah]).get(ayah)
+                    if ayah in range_warnings:
+                        st.warning(range_warnings[ayah])
                     
-                    if os.path.exists(cache_file_path):
-                        with open(cache_file_path, 'r', encoding='utf-8') as f:
-                            tafsir_text = f.read()
+                    if cached_text is not None:
+                        tafsir_text = cached_text
                     else:
-                        # Show loading spinner
-                        with st.spinner("Translating ayah... Please wait."):
-                            translator = TafsirTranslator()
-                            result = translator.translate_tafsir(tafsir_text, "ar", language_codes[selected_lang])
-                            tafsir_text = result["translated_text"]
+                        # Single flight: another session translating this ayah
+                        # is waited for, and its cached result used
+                        flight = (lang_code, author, selected_surah, ayah)
+                        held = None
+                        try:
+                            held = translation_cache.locks.acquire([flight], blocking=False)
+                            if held is None:
+                                with st.spinner("This ayah is being translated in another session... Please wait."):
+                                    held = translation_cache.locks.acquire([flight])
+                            entry = shared_entry(translation_cache, *flight)
+                            if entry is not None:
+                                tafsir_text = entry["translated_text"]
+                                remember_translation(lang_code, author, selected_surah, ayah, entry, True)
+                            else:
+                                # Show chunks as they arrive instead of a spinner for the whole run
+                                translator = get_translator()
+                                started = time.perf_counter()
+                                stream = translator.translate_tafsir_stream(tafsir_text, 'ar', lang_code)
+                                progress = st.progress(0.0, text=f"Translating ayah... 0 of {stream.total_chunks} chunks")
+                                preview = st.empty()
+                                translated_parts = []
+                                for chunk in stream:
+                                    translated_parts.append(chunk["translated"])
+                                    progress.progress(chunk["chunk_id"] / chunk["total_chunks"],
+                                                      text=f"Translating ayah... {chunk['chunk_id']} of {chunk['total_chunks']} chunks")
+                                    preview_html = "\n".join(split_into_pages(normalize_translation(" ".join(translated_parts)))[:INITIAL_PAGES])
+                                    preview.markdown(f'<div class="{lang_class} scrollable-text">{preview_html}</div>', unsafe_allow_html=True)
+                                progress.empty()
+                                preview.empty()
 
-                            # Create directories and save translation
-                            lang_dir = os.path.join(cache_folder, language_codes[selected_lang])
-                            os.makedirs(lang_dir, exist_ok=True)
-                            auth_dir = os.path.join(lang_dir, author)
-                            os.makedirs(auth_dir, exist_ok=True)
+                                # Only a completed stream reaches the cache
+                                result = stream.result
+                                metrics.observe("tafsir_translation_seconds", time.perf_counter() - started, lang=lang_code, author=author)
+                                stored = translation_cache.put(lang_code, author, selected_surah, ayah, result)
+                                remember_translation(lang_code, author, selected_surah, ayah, result, stored)
+                                tafsir_text = result["translated_text"]
 
-                            with open(cache_file_path, 'w', encoding='utf-8') as f:
-                                f.write(tafsir_text)
+                                # Partial failures are shown but not cached, so they are retried next time
+                                if not stored:
+                                    st.warning(f"{len(result['failed_chunks'])} of {result['total_chunks']} chunks failed to translate; this translation was not cached.")
+                        finally:
+                            if held is not None:
+                                translation_cache.locks.release(held)
 
                 # Display the tafsir text with appropriate styling
-                if selected_lang != "None":
-                    if selected_lang == "Urdu":
-                        lang_class = "urdu-text"
-                    else:
-                        lang_class = "translated-text"
+                render_paged_text(tafsir_text, lang_class, (author, selected_surah, ayah, selected_lang))
 
-                    st.markdown(f'<div class="{lang_class} scrollable-text">{tafsir_text}</div>', unsafe_allow_html=True)
-                else:
-                    st.markdown(f'<div class="arabic-text scrollable-text">{tafsir_text}</div>', unsafe_allow_html=True)
+                citation_graph = get_citation_graph()
+                if citation_graph is not None:
+                    cited = citation_graph.cited_by_entry(author, selected_surah, ayah)
+                    citing = citation_graph.citing_entries(selected_surah, ayah)
+                    with st.expander(f"🔗 Qur'anic cross-references ({len(cited)} cited, cited by {len(citing)})"):
+                        if cited:
+                            st.markdown("**This commentary cites:** " + "، ".join(f"{surah_name(s)} {s}:{a}" for s, a in cited))
+                        if citing:
+                            by_author = {}
+                            for citing_author, s, a in citing:
+                                by_author.setdefault(citing_author, []).append(f"{s}:{a}")
+                            st.markdown("**Cited in the commentaries on:**")
+                            for citing_author, refs in sorted(by_author.items()):
+                                st.markdown(f"- {citing_author}: {', '.join(refs)}")
+                        if not cited and not citing:
+                            st.write("No cross-references found for this ayah.")
 
             except FileNotFoundError:
                 st.error(f"Tafsir file not found: {file_path}")
@@ -375,4 +691,25 @@ else:
         <h3 style="margin: 0 0 0.5rem 0;">Welcome to Quran Tafsir Viewer</h3>
         <p style="font-size: 1rem; opacity: 0.9; margin: 0;">Please select a Surah and Ayah from the sidebar to view tafsir.</p>
     </div>
-    ''', unsafe_allow_html=True)
\ No newline at end of file
+    ''', unsafe_allow_html=True)
+
+# --- Prefetch ---
+# Queued once the page is rendered, so it never delays what the reader asked
+# for; every rerun replaces this reader's earlier lookahead
+if prefetch_ahead > 0:
+    prefetcher = get_prefetcher()
+    if selected_surah and ayah_range and selected_lang != "None":
+        prefetch_authors = compare_authors if compare_mode else [author]
+        prefetcher.prefetch(st.session_state.reader_id, language_codes[selected_lang], selected_surah, {
+            prefetch_author: following_ayahs(index.ayahs(prefetch_author, selected_surah), ayah_range[-1], prefetch_ahead)
+            for prefetch_author in prefetch_authors
+        })
+    else:
+        prefetcher.cancel(st.session_state.reader_id)
+
+# --- Warm Neighbours ---
+# The ayahs either side of the ones shown are the likeliest next requests
+# from any session, so their texts and pages are loaded ahead of time
+if selected_surah and ayah_range:
+    for warm_author in (compare_authors if compare_mode else [author]):
+        warm_neighbours(warm_author, selected_surah, ayah_range, selected_lang)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Chunking Benchmark
+Times TafsirTranslator.split_text_intelligently on the largest tafsir files
+in data/, and on growing prefixes of the largest one to show how it scales
+with input size. The previous word-joining implementation is kept here as a
+baseline for comparison.
+
+Usage:
+    python benchmarks/bench_chunking.py [--files 5] [--repeat 3]
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from translate import TafsirTranslator, OfflineBackend
+
+
+def legacy_split(text: str, max_length: int = 3500) -> List[str]:
+    """The original quadratic chunker, for comparison"""
+    if len(text) <= max_length:
+        return [text]
+
+    words = text.split()
+    sentences = []
+    i = 0
+    while i < len(words):
+        sentence = []
+        while i < len(words) and len(' '.join(sentence + [words[i]])) <= 3000:
+            sentence.append(words[i])
+            i += 1
+        if sentence:
+            sentences.append(' '.join(sentence))
+
+    chunks = []
+    current_chunk = ""
+    for sentence in sentences:
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        potential_chunk = current_chunk + " " + sentence if current_chunk else sentence
+        if len(potential_chunk) > max_length and current_chunk:
+            chunks.append(current_chunk.strip())
+            current_chunk = sentence
+        else:
+            current_chunk = potential_chunk
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+    return chunks
+
+
+def largest_files(data_folder: str, count: int) -> List[str]:
+    paths = glob.glob(os.path.join(data_folder, '*', '*.txt'))
+    return sorted(paths, key=os.path.getsize, reverse=True)[:count]
+
+
+def best_of(repeat: int, func, *args) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark split_text_intelligently")
+    parser.add_argument('--data', default='data', help="Folder containing the author folders")
+    parser.add_argument('--files', type=int, default=5, help="Number of largest files to time")
+    parser.add_argument('--repeat', type=int, default=3, help="Repetitions per measurement (best is kept)")
+    args = parser.parse_args()
+
+    translator = TafsirTranslator(backend=OfflineBackend())
+    max_length = translator.backend.max_request_size
+
+    print(f"{'file':<32} {'chars':>8} {'chunks':>7} {'legacy ms':>10} {'current ms':>11} {'speedup':>8}")
+    texts = []
+    for path in largest_files(args.data, args.files):
+        # Chunked as translate_tafsir_stream chunks it: whitespace collapsed,
+        # before normalization removes the quote marks it cuts at
+        with open(path, 'r', encoding='utf-8') as f:
+            text = ' '.join(f.read().split())
+        texts.append(text)
+
+        legacy = best_of(args.repeat, legacy_split, text, max_length)
+        current = best_of(args.repeat, translator.split_text_intelligently, text, 'ar', max_length)
+        chunks = translator.split_text_intelligently(text, 'ar', max_length)
+        name = os.path.relpath(path, args.data)
+        print(f"{name:<32} {len(text):>8} {len(chunks):>7} {legacy * 1000:>10.2f} {current * 1000:>11.2f} {legacy / current:>7.1f}x")
+
+    if not texts:
+        return
+
+    print()
+    print("Scaling on prefixes of the largest file:")
+    print(f"{'chars':>8} {'current ms':>11} {'us/KB':>8}")
+    largest = texts[0]
+    size = 8192
+    while True:
+        prefix = largest[:size]
+        current = best_of(args.repeat, translator.split_text_intelligently, prefix, 'ar', max_length)
+        print(f"{len(prefix):>8} {current * 1000:>11.3f} {current * 1e6 / (len(prefix) / 1024):>8.1f}")
+        if size >= len(largest):
+            break
+        size *= 2
+
+
+if __name__ == '__main__':
+    main()
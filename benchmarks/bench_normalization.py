@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Normalization Benchmark
+Checks that the compiled normalization pipeline in translate.py produces
+byte-identical output to the original preprocess_text and
+_post_process_translation implementations over the whole corpus, then
+reports throughput in MB/s for both.
+
+Source normalization is checked on every data/<author>/*.txt file;
+translation post-processing on every cached translation under cache/.
+The script exits non-zero if any output differs.
+
+Usage:
+    python benchmarks/bench_normalization.py [--no-verify] [--repeat 3]
+"""
+
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from translate import (
+    normalize_source_text,
+    normalize_source_batch,
+    normalize_translation,
+    normalize_translation_batch,
+)
+
+
+def legacy_preprocess(text: str, language: str) -> str:
+    """The original TafsirTranslator.preprocess_text"""
+    text = re.sub(r'\s+', ' ', text.strip())
+    if language in ['ar', 'ur']:
+        text = re.sub(r'[«»]', '"', text)
+        text = re.sub(r'[،]', ',', text)
+        text = re.sub(r'[؛]', ';', text)
+        text = re.sub(r'[؟]', '?', text)
+        text = re.sub(r'[﴾﴿]', '', text)
+        text = re.sub(r'[۞]', '', text)
+        arabic_nums = '٠١٢٣٤٥٦٧٨٩'
+        english_nums = '0123456789'
+        for ar_num, en_num in zip(arabic_nums, english_nums):
+            text = text.replace(ar_num, en_num)
+        if language == 'ur':
+            text = re.sub(r'[۔]+', '۔', text)
+    return text
+
+
+def legacy_post_process(text: str) -> str:
+    """The original TafsirTranslator._post_process_translation"""
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s+([.!?,:;])', r'\1', text)
+    text = re.sub(r'([.!?])\s*([A-Z])', r'\1 \2', text)
+    sentences = re.split(r'([.!?]+)', text)
+    processed_sentences = []
+    for i, sentence in enumerate(sentences):
+        if i % 2 == 0 and sentence.strip():
+            sentence = sentence.strip()
+            if sentence:
+                sentence = sentence[0].upper() + sentence[1:] if len(sentence) > 1 else sentence.upper()
+            processed_sentences.append(sentence)
+        else:
+            processed_sentences.append(sentence)
+    return ''.join(processed_sentences).strip()
+
+
+def read_texts(pattern: str) -> List[str]:
+    texts = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, 'r', encoding='utf-8') as f:
+            texts.append(f.read())
+    return texts
+
+
+def verify(name: str, texts: List[str], legacy: Callable, current: Callable, batch: Callable) -> bool:
+    expected = [legacy(text) for text in texts]
+    mismatches = sum(1 for text, want in zip(texts, expected) if current(text) != want)
+    batch_ok = batch(texts) == expected
+    status = "OK" if not mismatches and batch_ok else "MISMATCH"
+    print(f"{name}: {len(texts)} texts, {mismatches} single-call mismatches, batch {'identical' if batch_ok else 'differs'} -> {status}")
+    return status == "OK"
+
+
+def throughput(texts: List[str], func: Callable, repeat: int, per_text: bool = True) -> float:
+    size_mb = sum(len(text.encode('utf-8')) for text in texts) / (1024 * 1024)
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        if per_text:
+            for text in texts:
+                func(text)
+        else:
+            func(texts)
+        best = min(best, time.perf_counter() - started)
+    return size_mb / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify and benchmark text normalization")
+    parser.add_argument('--data', default='data', help="Folder containing the author folders")
+    parser.add_argument('--cache', default='cache', help="Folder containing cached translations")
+    parser.add_argument('--repeat', type=int, default=3, help="Repetitions per measurement (best is kept)")
+    parser.add_argument('--no-verify', action='store_true', help="Skip the equivalence check")
+    args = parser.parse_args()
+
+    sources = read_texts(os.path.join(args.data, '*', '*.txt'))
+    translations = read_texts(os.path.join(args.cache, '*', '*', '*.txt'))
+
+    ok = True
+    if not args.no_verify:
+        for language in ('ar', 'ur'):
+            ok &= verify(
+                f"preprocess [{language}]", sources,
+                lambda text: legacy_preprocess(text, language),
+                lambda text: normalize_source_text(text, language),
+                lambda texts: normalize_source_batch(texts, language),
+            )
+        ok &= verify(
+            "post-process", translations,
+            legacy_post_process, normalize_translation, normalize_translation_batch,
+        )
+        print()
+
+    print(f"{'stage':<28} {'legacy MB/s':>12} {'current MB/s':>13} {'batch MB/s':>11}")
+    # Sentence-sized pieces show the batch API on many small inputs
+    sentences = [piece for text in sources for piece in text.split('.')]
+    rows = [
+        ("preprocess [ar]", sources,
+         lambda text: legacy_preprocess(text, 'ar'),
+         lambda text: normalize_source_text(text, 'ar'),
+         lambda texts: normalize_source_batch(texts, 'ar')),
+        ("preprocess [ar] sentences", sentences,
+         lambda text: legacy_preprocess(text, 'ar'),
+         lambda text: normalize_source_text(text, 'ar'),
+         lambda texts: normalize_source_batch(texts, 'ar')),
+        ("post-process", translations,
+         legacy_post_process, normalize_translation, normalize_translation_batch),
+    ]
+    for name, texts, legacy, current, batch in rows:
+        if not texts:
+            continue
+        print(
+            f"{name:<28} {throughput(texts, legacy, args.repeat):>12.1f} "
+            f"{throughput(texts, current, args.repeat):>13.1f} "
+            f"{throughput(texts, batch, args.repeat, per_text=False):>11.1f}"
+        )
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+"""
+Benchmark Suite
+Times the viewer's hot paths against the real data/ corpus and the offline
+translation backend: startup load, ayah lookup and reads, normalization,
+chunking, cache-miss and cache-hit translation, per-ayah translation locks
+contended by several processes, and a multi-session load test that drives
+app.py headlessly with concurrent simulated users.
+
+Results are written as JSON so runs from different commits can be compared;
+pass an earlier results file as --baseline to print the change per metric.
+
+Usage:
+    python benchmarks/run.py [--groups startup lookup ...] [--output results.json]
+    python benchmarks/run.py --groups sessions --users 8 --interactions 10
+    python benchmarks/run.py --output new.json --baseline old.json
+"""
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from corpus_store import CorpusStore, list_authors
+from rendering import LRUCache, cached_pages, split_into_pages
+from tafsir_index import TafsirIndex, load_entries
+from translate import (
+    TafsirTranslator, OfflineBackend, detect_script_language, normalize_source_batch,
+    normalize_translation_batch, split_into_chunks,
+)
+from translation_cache import TranslationCache, TranslationLocks, TranslationMemory, translate_and_store
+
+GROUPS = ('startup', 'lookup', 'normalization', 'chunking', 'translation', 'locks', 'sessions')
+
+# Units where a larger value is better; every other unit is a duration
+HIGHER_IS_BETTER = {'MB/s', 'ops/s', '%'}
+
+
+class Results:
+    """Collects metrics as {group, name, value, unit} records"""
+
+    def __init__(self):
+        self.metrics: List[Dict] = []
+
+    def add(self, group: str, name: str, value: float, unit: str) -> None:
+        self.metrics.append({'group': group, 'name': name, 'value': round(value, 6), 'unit': unit})
+        print(f"  {name:<40} {value:>12.3f} {unit}", flush=True)
+
+
+def best_of(repeat: int, func: Callable, *args) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def cold_process_time(statement: str, repeat: int) -> float:
+    """Best time of a statement in fresh interpreters, imports included"""
+    script = f"import time; started = time.perf_counter(); {statement}; print(time.perf_counter() - started)"
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', script], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout
+        times.append(float(output.strip()))
+    return min(times)
+
+
+def bench_startup(results: Results, args) -> None:
+    # A fresh interpreter pays for imports and a cold index build
+    results.add('startup', 'cold_process_load', cold_process_time(
+        "from tafsir_index import TafsirIndex, load_entries; "
+        f"TafsirIndex.from_entries(load_entries({args.data!r}))", args.repeat), 's')
+
+    manifest_path = os.path.join(args.packed, 'manifest.bin')
+    if os.path.exists(manifest_path):
+        results.add('startup', 'cold_process_manifest', cold_process_time(
+            f"from manifest import load_manifest; load_manifest({manifest_path!r})", args.repeat), 's')
+
+    results.add('startup', 'warm_load_entries', best_of(args.repeat, load_entries, args.data), 's')
+    entries = load_entries(args.data)
+    results.add('startup', 'warm_build_index', best_of(args.repeat, TafsirIndex.from_entries, entries), 's')
+
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        print("  (streamlit not installed; skipping app startup)")
+        return
+
+    previous = os.environ.get('TAFSIR_CACHE_FOLDER')
+    with tempfile.TemporaryDirectory() as folder:
+        # The app opens its translation cache on startup; keep it off the repo's cache/
+        os.environ['TAFSIR_CACHE_FOLDER'] = folder
+        try:
+            app = AppTest.from_file(os.path.join(ROOT, 'app.py'), default_timeout=args.timeout)
+            started = time.perf_counter()
+            app.run()
+            results.add('startup', 'app_first_run', time.perf_counter() - started, 's')
+            started = time.perf_counter()
+            app.run()
+            results.add('startup', 'app_rerun', time.perf_counter() - started, 's')
+        finally:
+            if previous is None:
+                del os.environ['TAFSIR_CACHE_FOLDER']
+            else:
+                os.environ['TAFSIR_CACHE_FOLDER'] = previous
+
+
+def bench_lookup(results: Results, args) -> None:
+    index = TafsirIndex.from_entries(load_entries(args.data))
+    keys = [(author, surah, ayah)
+            for author in index.authors
+            for surah, _, _ in index.surahs(author)
+            for ayah in index.ayahs(author, surah)]
+    rng = random.Random(args.seed)
+    sample = [rng.choice(keys) for _ in range(100000)]
+
+    def lookups():
+        for key in sample:
+            index.get(*key)
+
+    results.add('lookup', 'index_get', best_of(args.repeat, lookups) / len(sample) * 1e6, 'us')
+
+    stores = {'read_loose': CorpusStore(args.data, os.path.join(args.data, '.no-packs'))}
+    if glob.glob(os.path.join(args.packed, '*.idx')):
+        stores['read_packed'] = CorpusStore(args.data, args.packed)
+
+    text_keys = [(author, surah, ayah) for author in list_authors(args.data)
+                 for surah, ayah in stores['read_loose'].keys(author)]
+    reads = [rng.choice(text_keys) for _ in range(2000)]
+    for name, store in stores.items():
+        def read_all():
+            for key in reads:
+                store.read(*key)
+
+        results.add('lookup', name, best_of(args.repeat, read_all) / len(reads) * 1e6, 'us')
+
+        author, surah = 'tabari', 2
+        results.add('lookup', f"{name}_range_20",
+                    best_of(args.repeat, store.read_range, author, surah, range(1, 21)) * 1e3, 'ms')
+        store.close()
+
+    # Serving an entry's pages: read and split on every request, or from a
+    # warm render cache as popular ayahs are
+    store = CorpusStore(args.data, args.packed)
+    popular = reads[:200]
+    cache = LRUCache()
+
+    def render_uncached():
+        for key in popular:
+            split_into_pages(store.read(*key))
+
+    def render_cached():
+        for key in popular:
+            text = cache.get_or_load(('text', *key, None), lambda: store.read(*key))
+            cached_pages(cache, (*key, None), text)
+
+    render_cached()
+    results.add('lookup', 'render_uncached', best_of(args.repeat, render_uncached) / len(popular) * 1e6, 'us')
+    results.add('lookup', 'render_cached', best_of(args.repeat, render_cached) / len(popular) * 1e6, 'us')
+    store.close()
+
+
+def corpus_texts(store: CorpusStore, data: str) -> List[str]:
+    return [text for author in list_authors(data) for _, _, text in store.iter_author(author)]
+
+
+def bench_normalization(results: Results, args) -> None:
+    store = CorpusStore(args.data, args.packed)
+    sources = corpus_texts(store, args.data)
+    store.close()
+    size_mb = sum(len(text.encode('utf-8')) for text in sources) / (1024 * 1024)
+    for language in ('ar', 'ur'):
+        elapsed = best_of(args.repeat, normalize_source_batch, sources, language)
+        results.add('normalization', f"source_{language}", size_mb / elapsed, 'MB/s')
+
+    # Local language detection; texts under the default threshold would go to the provider
+    elapsed = best_of(args.repeat, lambda: [detect_script_language(text) for text in sources])
+    results.add('normalization', 'detect_language', len(sources) / elapsed, 'ops/s')
+    confident = sum(detect_script_language(text)[1] >= 0.8 for text in sources)
+    results.add('normalization', 'detect_language_local', confident / len(sources) * 100, '%')
+
+    translations = []
+    for path in sorted(glob.glob(os.path.join(args.legacy_cache, '*', '*', '*.txt'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            translations.append(f.read())
+    if translations:
+        size_mb = sum(len(text.encode('utf-8')) for text in translations) / (1024 * 1024)
+        elapsed = best_of(args.repeat, normalize_translation_batch, translations)
+        results.add('normalization', 'translation', size_mb / elapsed, 'MB/s')
+
+
+def bench_chunking(results: Results, args) -> None:
+    paths = sorted(glob.glob(os.path.join(args.data, '*', '*.txt')), key=os.path.getsize, reverse=True)[:5]
+    translator = TafsirTranslator(backend=OfflineBackend())
+    total = 0.0
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            # Chunked as translate_tafsir does: whitespace collapsed, quote marks kept
+            text = ' '.join(f.read().split())
+        elapsed = best_of(args.repeat, split_into_chunks, text, translator.backend.max_request_size)
+        total += elapsed
+        name = os.path.relpath(path, args.data).replace(os.sep, '/')
+        results.add('chunking', f"split {name}", elapsed * 1e3, 'ms')
+    results.add('chunking', 'split_largest_5_total', total * 1e3, 'ms')
+
+
+def bench_translation(results: Results, args) -> None:
+    store = CorpusStore(args.data, args.packed)
+    rng = random.Random(args.seed)
+    keys = [(author, surah, ayah) for author in list_authors(args.data) for surah, ayah in store.keys(author)]
+    sample = rng.sample(keys, min(args.translations, len(keys)))
+    backend = OfflineBackend(latency=args.latency, latency_per_char=args.latency_per_char)
+    translator = TafsirTranslator(backend=backend, requests_per_second=float('inf'), max_workers=4)
+
+    with tempfile.TemporaryDirectory() as folder:
+        cache = TranslationCache(os.path.join(folder, 'translations.db'), legacy_folder=None)
+        misses = []
+        requests = 0
+        for author, surah, ayah in sample:
+            started = time.perf_counter()
+            text = store.read(author, surah, ayah)
+            result, _ = translate_and_store(cache, translator, text, 'en', author, surah, ayah)
+            misses.append(time.perf_counter() - started)
+            requests += sum(chunk['attempts'] for chunk in result['chunks_detail'])
+
+        # The same sample through the segment translation memory, starting empty
+        memory = TranslationMemory(os.path.join(folder, 'translations.db'))
+        memory_translator = TafsirTranslator(backend=backend, requests_per_second=float('inf'),
+                                             max_workers=4, memory=memory)
+        memory_requests = 0
+        for author, surah, ayah in sample:
+            result = memory_translator.translate_tafsir(store.read(author, surah, ayah), 'ar', 'en')
+            memory_requests += sum(chunk['attempts'] for chunk in result['chunks_detail'])
+        memory_stats = memory.stats()
+        memory.close()
+
+        hits = []
+        for author, surah, ayah in sample:
+            started = time.perf_counter()
+            cache.get('en', author, surah, ayah)
+            hits.append(time.perf_counter() - started)
+        cache.close()
+    store.close()
+
+    results.add('translation', 'cache_miss_p50', statistics.median(misses) * 1e3, 'ms')
+    results.add('translation', 'cache_miss_p95', percentile(misses, 0.95) * 1e3, 'ms')
+    results.add('translation', 'cache_hit_p50', statistics.median(hits) * 1e3, 'ms')
+    results.add('translation', 'cache_hit_p95', percentile(hits, 0.95) * 1e3, 'ms')
+    results.add('translation', 'memory_hit_rate', memory_stats['hit_rate'] * 100, '%')
+    if requests:
+        results.add('translation', 'memory_requests_saved', (1 - memory_requests / requests) * 100, '%')
+
+
+# Keys, threads per process and acquisitions per thread in the locks group
+LOCK_KEYS = 6
+LOCK_THREADS = 12
+LOCK_ROUNDS = 50
+
+
+def _lock_contender(path: str, holders, overlaps, errors, seed: int) -> None:
+    """Take random sets of keys from several threads of one process"""
+    locks = TranslationLocks.for_path(path)
+
+    def worker(n: int) -> None:
+        rng = random.Random(seed * 1000 + n)
+        for _ in range(LOCK_ROUNDS):
+            keys = sorted({rng.randrange(LOCK_KEYS) for _ in range(rng.randint(1, 3))})
+            try:
+                with locks.hold([('en', 'bench', 1, key) for key in keys]):
+                    for key in keys:
+                        with holders.get_lock():
+                            holders[key] += 1
+                            if holders[key] > 1:
+                                overlaps.value += 1
+                    time.sleep(rng.random() * 0.001)
+                    for key in keys:
+                        with holders.get_lock():
+                            holders[key] -= 1
+            except OSError:
+                with errors.get_lock():
+                    errors.value += 1
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(LOCK_THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def bench_locks(results: Results, args) -> None:
+    # Threads of several processes contend on a few keys, as bursts of
+    # sessions, prefetch workers and API requests for one ayah do. Every
+    # acquisition must succeed, and no key may have two holders at once.
+    context = multiprocessing.get_context('spawn')
+    holders = context.Array('i', LOCK_KEYS)
+    overlaps = context.Value('i', 0)
+    errors = context.Value('i', 0)
+    processes = max(2, args.users)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'translations.db.lock')
+        workers = [
+            context.Process(target=_lock_contender, args=(path, holders, overlaps, errors, args.seed + n))
+            for n in range(processes)
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+    results.add('locks', f"processes_{processes}_acquisitions", processes * LOCK_THREADS * LOCK_ROUNDS / elapsed, 'ops/s')
+    results.add('locks', 'errors', errors.value, 'count')
+    results.add('locks', 'overlapping_holders', overlaps.value, 'count')
+
+
+def _simulated_user(task) -> Tuple[float, List[float], List[str]]:
+    """Drive app.py through one session; returns (first run, later interactions, errors)"""
+    from streamlit.testing.v1 import AppTest
+
+    user, args = task
+    rng = random.Random(args.seed + user)
+    app = AppTest.from_file(os.path.join(ROOT, 'app.py'), default_timeout=args.timeout)
+    latencies = []
+    errors = []
+
+    def timed(action: Callable) -> float:
+        started = time.perf_counter()
+        action()
+        elapsed = time.perf_counter() - started
+        errors.extend(str(exception.value) for exception in app.exception)
+        return elapsed
+
+    def sidebar_select(label: str):
+        return next(box for box in app.sidebar.selectbox if box.label.endswith(label))
+
+    first_run = timed(app.run)
+    try:
+        for _ in range(args.interactions):
+            authors = sidebar_select("Select Author").options
+            latencies.append(timed(lambda: sidebar_select("Select Author").set_value(rng.choice(authors)).run()))
+            surahs = sidebar_select("Select Surah").options[1:]
+            latencies.append(timed(lambda: sidebar_select("Select Surah").set_value(rng.choice(surahs)).run()))
+            ayahs = sidebar_select("Select Ayah").options
+            latencies.append(timed(lambda: sidebar_select("Select Ayah").set_value(int(rng.choice(ayahs))).run()))
+            if rng.random() < args.translate_ratio:
+                languages = sidebar_select("Translate Tafsir To").options[1:]
+                latencies.append(timed(lambda: sidebar_select("Translate Tafsir To").set_value(rng.choice(languages)).run()))
+                latencies.append(timed(lambda: sidebar_select("Translate Tafsir To").set_value("None").run()))
+    except Exception as e:
+        errors.append(f"user {user}: {e!r}")
+    return first_run, latencies, errors
+
+
+def bench_sessions(results: Results, args) -> None:
+    try:
+        from streamlit.testing.v1 import AppTest  # noqa: F401
+    except ImportError:
+        print("  (streamlit not installed; skipping the session load test)")
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        # Translations go to a throwaway cache through the offline backend
+        os.environ['TAFSIR_CACHE_FOLDER'] = folder
+        os.environ['TAFSIR_TRANSLATION_BACKEND'] = 'offline'
+        os.environ['TAFSIR_OFFLINE_LATENCY'] = str(args.latency)
+        os.environ['TAFSIR_OFFLINE_LATENCY_PER_CHAR'] = str(args.latency_per_char)
+        os.environ['TAFSIR_REQUESTS_PER_SECOND'] = str(args.rate)
+
+        # AppTest is not safe to run from several threads of one process, so
+        # each simulated user gets its own process. They share the packed
+        # corpus through the page cache and the translation cache database.
+        context = multiprocessing.get_context('spawn')
+        started = time.perf_counter()
+        with context.Pool(args.users) as pool:
+            sessions = pool.map(_simulated_user, [(user, args) for user in range(args.users)])
+        elapsed = time.perf_counter() - started
+
+    first_runs = [first_run for first_run, _, _ in sessions]
+    latencies = [latency for _, session, _ in sessions for latency in session]
+    errors = [error for _, _, session in sessions for error in session]
+
+    prefix = f"users_{args.users}"
+    results.add('sessions', f"{prefix}_first_run_p50", statistics.median(first_runs) * 1e3, 'ms')
+    if latencies:
+        results.add('sessions', f"{prefix}_interaction_p50", statistics.median(latencies) * 1e3, 'ms')
+        results.add('sessions', f"{prefix}_interaction_p95", percentile(latencies, 0.95) * 1e3, 'ms')
+        results.add('sessions', f"{prefix}_interaction_max", max(latencies) * 1e3, 'ms')
+    results.add('sessions', f"{prefix}_throughput", (len(latencies) + len(first_runs)) / elapsed, 'ops/s')
+    results.add('sessions', f"{prefix}_errors", len(errors), 'count')
+    for error in errors[:5]:
+        print(f"    error: {error}")
+
+
+BENCHMARKS = {
+    'startup': bench_startup,
+    'lookup': bench_lookup,
+    'normalization': bench_normalization,
+    'chunking': bench_chunking,
+    'translation': bench_translation,
+    'locks': bench_locks,
+    'sessions': bench_sessions,
+}
+
+
+def compare(baseline_path: str, metrics: List[Dict], threshold: float) -> int:
+    """Print the change per metric against a baseline; return the number of regressions"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(m['group'], m['name']): m for m in json.load(f)['metrics']}
+
+    regressions = 0
+    print()
+    print(f"Compared with {baseline_path}:")
+    print(f"  {'metric':<52} {'baseline':>12} {'current':>12} {'change':>8}")
+    for metric in metrics:
+        old = baseline.get((metric['group'], metric['name']))
+        if old is None or not old['value'] or metric['unit'] == 'count':
+            continue
+        change = metric['value'] / old['value'] - 1
+        worse = -change if metric['unit'] in HIGHER_IS_BETTER else change
+        flag = ''
+        if worse > threshold:
+            flag = '  slower'
+            regressions += 1
+        elif worse < -threshold:
+            flag = '  faster'
+        name = f"{metric['group']}.{metric['name']}"
+        print(f"  {name:<52} {old['value']:>12.3f} {metric['value']:>12.3f} {change:>+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the tafsir viewer benchmark suite")
+    parser.add_argument('--groups', nargs='*', choices=GROUPS, help="Benchmark groups to run (default: all)")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    parser.add_argument('--baseline', help="Earlier results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1, help="Relative change reported as a regression")
+    parser.add_argument('--data', default=os.path.join(ROOT, 'data'), help="Folder containing the author folders")
+    parser.add_argument('--packed', default=os.path.join(ROOT, 'packed'), help="Folder containing packed author blobs")
+    parser.add_argument('--legacy-cache', default=os.path.join(ROOT, 'cache'), help="Legacy translation tree used as post-processing input")
+    parser.add_argument('--repeat', type=int, default=3, help="Repetitions per measurement (best is kept)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for sampled ayahs and simulated users")
+    parser.add_argument('--translations', type=int, default=20, help="Entries translated in the translation group")
+    parser.add_argument('--latency', type=float, default=0.05, help="Offline backend latency per request, seconds")
+    parser.add_argument('--latency-per-char', type=float, default=0.0, help="Offline backend latency per character, seconds")
+    parser.add_argument('--rate', type=float, default=50.0, help="Provider requests per second allowed to the app in the sessions group")
+    parser.add_argument('--users', type=int, default=4, help="Concurrent simulated users in the sessions group, and processes in the locks group")
+    parser.add_argument('--interactions', type=int, default=5, help="Author/surah/ayah selections per simulated user")
+    parser.add_argument('--translate-ratio', type=float, default=0.5, help="Share of selections that also pick a language")
+    parser.add_argument('--timeout', type=float, default=120, help="Seconds allowed for one script run of app.py")
+    args = parser.parse_args()
+
+    # app.py resolves data/, packed/ and index/ relative to the working directory
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    os.chdir(ROOT)
+
+    results = Results()
+    for group in args.groups or GROUPS:
+        print(f"{group}:", flush=True)
+        BENCHMARKS[group](results, args)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'arguments': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'metrics': results.metrics,
+    }
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {len(results.metrics)} metrics to {args.output}")
+
+    if baseline:
+        regressions = compare(baseline, results.metrics, args.threshold)
+        if regressions:
+            print(f"\n{regressions} metrics regressed by more than {args.threshold:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Qur'anic Citation Cross-References
+An offline pass that resolves the verse citations in every tafsir text to
+(surah, ayah) pairs and stores them as a compact adjacency index in CSR form,
+so the viewer can list which ayahs a commentary cites and which commentaries
+cite an ayah without scanning the corpus
+
+Citations are bracketed references such as [الشَّرْحِ: 1] or [البقرة: ٢٥٥-٢٥٦].
+A ﴿...﴾ quotation is resolved when a citation follows it directly; the text
+of every resolved quotation is remembered, so the same quotation elsewhere in
+the corpus resolves without a citation.
+
+Build the index (and again after the corpus changes):
+    python citations.py build
+"""
+
+import argparse
+import array
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from corpus_store import CorpusStore, list_authors
+from search_index import normalize_arabic
+
+# (name, ayah count) for every surah, in order
+SURAHS = (
+    ('الفاتحة', 7), ('البقرة', 286), ('آل عمران', 200), ('النساء', 176), ('المائدة', 120),
+    ('الأنعام', 165), ('الأعراف', 206), ('الأنفال', 75), ('التوبة', 129), ('يونس', 109),
+    ('هود', 123), ('يوسف', 111), ('الرعد', 43), ('إبراهيم', 52), ('الحجر', 99),
+    ('النحل', 128), ('الإسراء', 111), ('الكهف', 110), ('مريم', 98), ('طه', 135),
+    ('الأنبياء', 112), ('الحج', 78), ('المؤمنون', 118), ('النور', 64), ('الفرقان', 77),
+    ('الشعراء', 227), ('النمل', 93), ('القصص', 88), ('العنكبوت', 69), ('الروم', 60),
+    ('لقمان', 34), ('السجدة', 30), ('الأحزاب', 73), ('سبأ', 54), ('فاطر', 45),
+    ('يس', 83), ('الصافات', 182), ('ص', 88), ('الزمر', 75), ('غافر', 85),
+    ('فصلت', 54), ('الشورى', 53), ('الزخرف', 89), ('الدخان', 59), ('الجاثية', 37),
+    ('الأحقاف', 35), ('محمد', 38), ('الفتح', 29), ('الحجرات', 18), ('ق', 45),
+    ('الذاريات', 60), ('الطور', 49), ('النجم', 62), ('القمر', 55), ('الرحمن', 78),
+    ('الواقعة', 96), ('الحديد', 29), ('المجادلة', 22), ('الحشر', 24), ('الممتحنة', 13),
+    ('الصف', 14), ('الجمعة', 11), ('المنافقون', 11), ('التغابن', 18), ('الطلاق', 12),
+    ('التحريم', 12), ('الملك', 30), ('القلم', 52), ('الحاقة', 52), ('المعارج', 44),
+    ('نوح', 28), ('الجن', 28), ('المزمل', 20), ('المدثر', 56), ('القيامة', 40),
+    ('الإنسان', 31), ('المرسلات', 50), ('النبأ', 40), ('النازعات', 46), ('عبس', 42),
+    ('التكوير', 29), ('الانفطار', 19), ('المطففين', 36), ('الانشقاق', 25), ('البروج', 22),
+    ('الطارق', 17), ('الأعلى', 19), ('الغاشية', 26), ('الفجر', 30), ('البلد', 20),
+    ('الشمس', 15), ('الليل', 21), ('الضحى', 11), ('الشرح', 8), ('التين', 8),
+    ('العلق', 19), ('القدر', 5), ('البينة', 8), ('الزلزلة', 8), ('العاديات', 11),
+    ('القارعة', 11), ('التكاثر', 8), ('العصر', 3), ('الهمزة', 9), ('الفيل', 5),
+    ('قريش', 4), ('الماعون', 7), ('الكوثر', 3), ('الكافرون', 6), ('النصر', 3),
+    ('المسد', 5), ('الإخلاص', 4), ('الفلق', 5), ('الناس', 6),
+)
+
+# Other names the commentators use for some surahs, and genitive forms
+SURAH_ALIASES = {
+    9: ('براءة',),
+    17: ('بني إسرائيل', 'سبحان'),
+    23: ('المؤمنين',),
+    32: ('الم السجدة', 'تنزيل السجدة'),
+    35: ('الملائكة',),
+    40: ('المؤمن',),
+    41: ('حم السجدة', 'السجدة فصلت'),
+    45: ('الشريعة',),
+    47: ('القتال',),
+    60: ('الامتحان',),
+    63: ('المنافقين',),
+    76: ('الدهر', 'هل أتى'),
+    83: ('التطفيف',),
+    94: ('الانشراح', 'ألم نشرح'),
+    96: ('اقرأ',),
+    98: ('لم يكن',),
+    109: ('الكافرين',),
+    111: ('تبت', 'اللهب'),
+    112: ('التوحيد',),
+}
+
+TOTAL_AYAHS = sum(count for _, count in SURAHS)
+
+# First global ayah id of each surah; index 0 is unused
+_SURAH_START = [0, 0]
+for _, _count in SURAHS:
+    _SURAH_START.append(_SURAH_START[-1] + _count)
+
+_DIGITS = str.maketrans('٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹', '01234567890123456789')
+
+_CITATION = re.compile(
+    r'\[\s*([^\[\]:\d٠-٩]{1,40}?)\s*:\s*([0-9٠-٩]{1,3})(?:\s*[-–]\s*([0-9٠-٩]{1,3}))?\s*\]'
+)
+_QUOTE = re.compile(r'﴿([^﴿﴾]{1,2000})﴾')
+_QUOTE_VERSE_NUMBER = re.compile(r'\(\s*[0-9٠-٩]+\s*\)')
+_NON_LETTER = re.compile(r'[^\w]|[0-9٠-٩_]')
+
+# A citation belongs to the quote before it if only this much text separates them
+QUOTE_CITATION_GAP = 6
+
+# Shorter quotations are too ambiguous to resolve from the remembered quotes
+MIN_QUOTE_WORDS = 3
+
+
+def _name_key(name: str) -> str:
+    key = _NON_LETTER.sub('', normalize_arabic(name))
+    if key.startswith('سوره'):
+        key = key[4:]
+    return key
+
+
+def _build_name_table() -> Dict[str, int]:
+    table = {}
+    for number, (name, _) in enumerate(SURAHS, 1):
+        for variant in (name,) + SURAH_ALIASES.get(number, ()):
+            key = _name_key(variant)
+            table[key] = number
+            # Commentators drop or add the article inconsistently
+            if key.startswith('ال'):
+                table.setdefault(key[2:], number)
+            else:
+                table.setdefault('ال' + key, number)
+    return table
+
+
+_SURAH_NAMES = _build_name_table()
+
+
+def resolve_surah(name: str) -> Optional[int]:
+    """Surah number for a surah name as written in a citation, or None"""
+    return _SURAH_NAMES.get(_name_key(name))
+
+
+def ayah_id(surah: int, ayah: int) -> Optional[int]:
+    """Global 0-based ayah id, or None if the ayah does not exist"""
+    if not 1 <= surah <= len(SURAHS) or not 1 <= ayah <= SURAHS[surah - 1][1]:
+        return None
+    return _SURAH_START[surah] + ayah - 1
+
+
+def ayah_from_id(ayah_id_: int) -> Tuple[int, int]:
+    """(surah, ayah) for a global ayah id"""
+    low, high = 1, len(SURAHS)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if _SURAH_START[middle] <= ayah_id_:
+            low = middle
+        else:
+            high = middle - 1
+    return low, ayah_id_ - _SURAH_START[low] + 1
+
+
+def _quote_key(quote: str) -> str:
+    return ' '.join(_QUOTE_VERSE_NUMBER.sub(' ', normalize_arabic(quote)).split())
+
+
+def extract_citations(text: str) -> Tuple[List[int], Dict[str, Set[int]]]:
+    """
+    Resolve the bracketed citations in a text
+
+    Returns:
+        Tuple of (cited ayah ids, {normalized quote: ayah ids} for quotes
+        that a citation directly follows)
+    """
+    cited = []
+    quotes: Dict[str, Set[int]] = {}
+    quote_ends = {match.end(): match.group(1) for match in _QUOTE.finditer(text)}
+
+    for match in _CITATION.finditer(text):
+        surah = resolve_surah(match.group(1))
+        if surah is None:
+            continue
+        first = int(match.group(2).translate(_DIGITS))
+        last = int(match.group(3).translate(_DIGITS)) if match.group(3) else first
+        if last < first or last - first > 20:
+            last = first
+
+        ids = [i for i in (ayah_id(surah, ayah) for ayah in range(first, last + 1)) if i is not None]
+        cited.extend(ids)
+
+        # Attach the citation to a quote that ends just before it
+        start = match.start()
+        for end in range(start, max(start - QUOTE_CITATION_GAP, 0) - 1, -1):
+            quote = quote_ends.get(end)
+            if quote is not None and not text[end:start].strip():
+                if ids:
+                    quotes.setdefault(_quote_key(quote), set()).update(ids)
+                break
+    return cited, quotes
+
+
+def build_citation_index(corpus: CorpusStore, authors: Iterable[str],
+                         index_folder: str = 'index/citations') -> Tuple[int, int]:
+    """
+    Extract citations from every text and write the CSR index
+
+    Returns:
+        Tuple of (number of documents, number of edges)
+    """
+    docs: List[Tuple[str, int, int]] = []
+    doc_citations: List[Set[int]] = []
+    doc_quotes: List[List[str]] = []
+    lexicon: Dict[str, Set[int]] = defaultdict(set)
+
+    for author in authors:
+        for surah, ayah, text in corpus.iter_author(author):
+            cited, quotes = extract_citations(text)
+            for key, ids in quotes.items():
+                lexicon[key].update(ids)
+            docs.append((author, surah, ayah))
+            doc_citations.append(set(cited))
+            doc_quotes.append([_quote_key(match.group(1)) for match in _QUOTE.finditer(text)])
+
+    # Second pass: uncited quotes that match a remembered, unambiguous quote
+    for citations, quotes in zip(doc_citations, doc_quotes):
+        for key in quotes:
+            ids = lexicon.get(key)
+            if ids and len(ids) == 1 and len(key.split()) >= MIN_QUOTE_WORDS:
+                citations.update(ids)
+
+    forward_indptr = array.array('I', [0])
+    forward_targets = array.array('H')
+    reverse: List[List[int]] = [[] for _ in range(TOTAL_AYAHS)]
+
+    for doc_id, ((author, surah, ayah), citations) in enumerate(zip(docs, doc_citations)):
+        own = ayah_id(surah, ayah)
+        targets = sorted(target for target in citations if target != own)
+        forward_targets.extend(targets)
+        forward_indptr.append(len(forward_targets))
+        for target in targets:
+            reverse[target].append(doc_id)
+
+    reverse_indptr = array.array('I', [0])
+    reverse_sources = array.array('I')
+    for sources in reverse:
+        reverse_sources.extend(sources)
+        reverse_indptr.append(len(reverse_sources))
+
+    os.makedirs(index_folder, exist_ok=True)
+    graph_path = os.path.join(index_folder, 'graph.bin')
+    with open(graph_path + '.tmp', 'wb') as f:
+        for values in (forward_indptr, forward_targets, reverse_indptr, reverse_sources):
+            values.tofile(f)
+
+    meta_path = os.path.join(index_folder, 'meta.json')
+    with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({
+            'docs': docs,
+            'edges': len(forward_targets),
+            'total_ayahs': TOTAL_AYAHS,
+        }, f, ensure_ascii=False)
+
+    os.replace(graph_path + '.tmp', graph_path)
+    os.replace(meta_path + '.tmp', meta_path)
+    return len(docs), len(forward_targets)
+
+
+class CitationGraph:
+    """
+    Read side of the citation index
+
+    Nothing is read until the first lookup, so holding a CitationGraph costs
+    nothing for sessions that never ask for cross-references.
+    """
+
+    def __init__(self, index_folder: str = 'index/citations'):
+        self.index_folder = index_folder
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    @classmethod
+    def exists(cls, index_folder: str = 'index/citations') -> bool:
+        return os.path.exists(os.path.join(index_folder, 'meta.json'))
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+
+            with open(os.path.join(self.index_folder, 'meta.json'), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            self._docs = [tuple(doc) for doc in meta['docs']]
+            self._doc_ids = {doc: i for i, doc in enumerate(self._docs)}
+
+            with open(os.path.join(self.index_folder, 'graph.bin'), 'rb') as f:
+                self._forward_indptr = array.array('I')
+                self._forward_indptr.fromfile(f, len(self._docs) + 1)
+                self._forward_targets = array.array('H')
+                self._forward_targets.fromfile(f, meta['edges'])
+                self._reverse_indptr = array.array('I')
+                self._reverse_indptr.fromfile(f, meta['total_ayahs'] + 1)
+                self._reverse_sources = array.array('I')
+                self._reverse_sources.fromfile(f, meta['edges'])
+
+            self._loaded = True
+
+    def cited_by_entry(self, author: str, surah: int, ayah: int) -> List[Tuple[int, int]]:
+        """(surah, ayah) pairs that an author's commentary on an ayah cites"""
+        self._load()
+        doc_id = self._doc_ids.get((author, surah, ayah))
+        if doc_id is None:
+            return []
+        start, end = self._forward_indptr[doc_id], self._forward_indptr[doc_id + 1]
+        return [ayah_from_id(target) for target in self._forward_targets[start:end]]
+
+    def citing_entries(self, surah: int, ayah: int) -> List[Tuple[str, int, int]]:
+        """(author, surah, ayah) of the commentaries that cite an ayah"""
+        self._load()
+        target = ayah_id(surah, ayah)
+        if target is None:
+            return []
+        start, end = self._reverse_indptr[target], self._reverse_indptr[target + 1]
+        return [self._docs[source] for source in self._reverse_sources[start:end]]
+
+
+def surah_name(surah: int) -> str:
+    """Arabic name of a surah"""
+    return SURAHS[surah - 1][0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the Qur'anic citation index")
+    parser.add_argument('--data', default='data', help="Folder containing the author folders")
+    parser.add_argument('--packed', default='packed', help="Folder containing packed author blobs")
+    parser.add_argument('--index', default=os.path.join('index', 'citations'), help="Index folder")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="Build the index")
+    build.add_argument('authors', nargs='*', help="Authors to index (default: all)")
+
+    show = commands.add_parser('show', help="Show cross-references for an ayah")
+    show.add_argument('surah', type=int)
+    show.add_argument('ayah', type=int)
+    show.add_argument('--author', help="Only show what this author's commentary cites")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        started = time.monotonic()
+        corpus = CorpusStore(args.data, args.packed)
+        docs, edges = build_citation_index(corpus, args.authors or list_authors(args.data), args.index)
+        print(f"Indexed {edges} citations from {docs} documents in {time.monotonic() - started:.1f}s")
+        return
+
+    graph = CitationGraph(args.index)
+    authors = [args.author] if args.author else list_authors(args.data)
+    for author in authors:
+        cited = graph.cited_by_entry(author, args.surah, args.ayah)
+        if cited:
+            print(f"{author} cites: " + ', '.join(f"{s}:{a}" for s, a in cited))
+    citing = graph.citing_entries(args.surah, args.ayah)
+    print(f"Cited by {len(citing)} commentaries: " + ', '.join(f"{au} {s}:{a}" for au, s, a in citing))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Packed Tafsir Corpus Store
+Packs each author's loose {surah}_{ayah}.txt files into a single blob plus an
+offset table, and serves ayah texts by slicing the blob through mmap
+"""
+
+import argparse
+import mmap
+import os
+import re
+import struct
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+BLOB_SUFFIX = '.bin'
+INDEX_SUFFIX = '.idx'
+
+# Index layout: magic, entry count, then (surah, ayah, offset, length) records
+INDEX_MAGIC = b'TAFSIDX1'
+INDEX_HEADER = struct.Struct('<8sI')
+INDEX_RECORD = struct.Struct('<HHQI')
+
+TEXT_FILE_PATTERN = re.compile(r'^(\d+)_(\d+)\.txt$')
+
+
+def clean_tafsir_text(text: str) -> str:
+    """Remove the scraping artifacts that are not part of the commentary"""
+    return text.replace('الباحث القرآني', '')
+
+
+def list_text_files(author_path: str) -> List[Tuple[int, int, str]]:
+    """List (surah, ayah, filename) for the ayah text files in an author folder"""
+    files = []
+    for filename in os.listdir(author_path):
+        match = TEXT_FILE_PATTERN.match(filename)
+        if match:
+            files.append((int(match.group(1)), int(match.group(2)), filename))
+    files.sort()
+    return files
+
+
+def pack_author(author: str, base_folder: str = 'data', packed_folder: str = 'packed') -> int:
+    """
+    Pack one author's text files into a blob and offset table
+
+    Both files are written to temporaries and renamed into place, so readers
+    never observe a half-written pack.
+
+    Returns:
+        Number of ayah texts packed
+    """
+    author_path = os.path.join(base_folder, author)
+    os.makedirs(packed_folder, exist_ok=True)
+
+    blob_path = os.path.join(packed_folder, author + BLOB_SUFFIX)
+    index_path = os.path.join(packed_folder, author + INDEX_SUFFIX)
+    blob_tmp = blob_path + '.tmp'
+    index_tmp = index_path + '.tmp'
+
+    records = []
+    offset = 0
+    with open(blob_tmp, 'wb') as blob:
+        for surah, ayah, filename in list_text_files(author_path):
+            with open(os.path.join(author_path, filename), 'r', encoding='utf-8') as f:
+                data = clean_tafsir_text(f.read()).encode('utf-8')
+            blob.write(data)
+            records.append(INDEX_RECORD.pack(surah, ayah, offset, len(data)))
+            offset += len(data)
+
+    with open(index_tmp, 'wb') as index:
+        index.write(INDEX_HEADER.pack(INDEX_MAGIC, len(records)))
+        index.write(b''.join(records))
+
+    os.replace(blob_tmp, blob_path)
+    os.replace(index_tmp, index_path)
+    return len(records)
+
+
+def read_index(index_path: str) -> Dict[Tuple[int, int], Tuple[int, int]]:
+    """Read an offset table into {(surah, ayah): (offset, length)}"""
+    with open(index_path, 'rb') as f:
+        data = f.read()
+
+    magic, count = INDEX_HEADER.unpack_from(data, 0)
+    if magic != INDEX_MAGIC:
+        raise ValueError(f"Not a packed tafsir index: {index_path}")
+
+    offsets = {}
+    for surah, ayah, offset, length in INDEX_RECORD.iter_unpack(data[INDEX_HEADER.size:INDEX_HEADER.size + count * INDEX_RECORD.size]):
+        offsets[(surah, ayah)] = (offset, length)
+    return offsets
+
+
+class _PackedAuthor:
+    """Open mmap and offset table for a single packed author"""
+
+    def __init__(self, blob_path: str, index_path: str):
+        self.offsets = read_index(index_path)
+        self._file = open(blob_path, 'rb')
+        if os.fstat(self._file.fileno()).st_size:
+            self.blob = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.blob = b''
+
+    def read(self, surah: int, ayah: int) -> Optional[str]:
+        location = self.offsets.get((surah, ayah))
+        if location is None:
+            return None
+        offset, length = location
+        return self.blob[offset:offset + length].decode('utf-8')
+
+    def read_many(self, keys: List[Tuple[int, int]]) -> Dict[Tuple[int, int], str]:
+        """Read several ayahs with one slice spanning all of them"""
+        locations = {key: self.offsets[key] for key in keys if key in self.offsets}
+        if not locations:
+            return {}
+        start = min(offset for offset, _ in locations.values())
+        end = max(offset + length for offset, length in locations.values())
+        span = self.blob[start:end]
+        return {
+            key: span[offset - start:offset - start + length].decode('utf-8')
+            for key, (offset, length) in locations.items()
+        }
+
+    def close(self) -> None:
+        if isinstance(self.blob, mmap.mmap):
+            self.blob.close()
+        self._file.close()
+
+
+class CorpusStore:
+    """
+    Read access to cleaned ayah texts
+
+    Authors that have been packed are served from their mmap'd blob; the
+    page cache is shared by every process mapping the same file. Authors
+    without a pack fall back to reading the loose .txt file.
+    """
+
+    def __init__(self, base_folder: str = 'data', packed_folder: str = 'packed'):
+        self.base_folder = base_folder
+        self.packed_folder = packed_folder
+        self._authors: Dict[str, Optional[_PackedAuthor]] = {}
+        self._lock = threading.Lock()
+
+    def _packed(self, author: str) -> Optional[_PackedAuthor]:
+        if author in self._authors:
+            return self._authors[author]
+
+        with self._lock:
+            if author not in self._authors:
+                blob_path = os.path.join(self.packed_folder, author + BLOB_SUFFIX)
+                index_path = os.path.join(self.packed_folder, author + INDEX_SUFFIX)
+                packed = None
+                if os.path.exists(blob_path) and os.path.exists(index_path):
+                    packed = _PackedAuthor(blob_path, index_path)
+                self._authors[author] = packed
+            return self._authors[author]
+
+    def text_path(self, author: str, surah: int, ayah: int) -> str:
+        """Path of the loose text file for an ayah"""
+        return os.path.join(self.base_folder, author, f"{surah}_{ayah}.txt")
+
+    def read(self, author: str, surah: int, ayah: int) -> str:
+        """
+        Return the cleaned tafsir text for an ayah
+
+        Raises:
+            FileNotFoundError: If the ayah has no text for this author
+        """
+        packed = self._packed(author)
+        if packed is not None:
+            text = packed.read(surah, ayah)
+            if text is not None:
+                return text
+
+        with open(self.text_path(author, surah, ayah), 'r', encoding='utf-8') as f:
+            return clean_tafsir_text(f.read())
+
+    def read_range(self, author: str, surah: int, ayahs: Iterable[int]) -> Dict[int, str]:
+        """
+        Return {ayah: cleaned text} for several ayahs of one surah
+
+        Consecutive ayahs are adjacent in a packed blob, so a range is served
+        by a single read. Ayahs without text are left out of the result.
+        """
+        keys = [(surah, ayah) for ayah in ayahs]
+        texts = {}
+        packed = self._packed(author)
+        if packed is not None:
+            texts = {ayah: text for (_, ayah), text in packed.read_many(keys).items()}
+
+        for _, ayah in keys:
+            if ayah not in texts:
+                try:
+                    with open(self.text_path(author, surah, ayah), 'r', encoding='utf-8') as f:
+                        texts[ayah] = clean_tafsir_text(f.read())
+                except FileNotFoundError:
+                    pass
+        return texts
+
+    def keys(self, author: str) -> List[Tuple[int, int]]:
+        """Sorted (surah, ayah) pairs that have text for an author"""
+        packed = self._packed(author)
+        if packed is not None:
+            return sorted(packed.offsets)
+        return [(surah, ayah) for surah, ayah, _ in list_text_files(os.path.join(self.base_folder, author))]
+
+    def iter_author(self, author: str) -> Iterator[Tuple[int, int, str]]:
+        """Yield (surah, ayah, text) for every ayah of an author in order"""
+        for surah, ayah in self.keys(author):
+            yield surah, ayah, self.read(author, surah, ayah)
+
+    def close(self) -> None:
+        with self._lock:
+            for packed in self._authors.values():
+                if packed is not None:
+                    packed.close()
+            self._authors.clear()
+
+
+def list_authors(base_folder: str = 'data') -> List[str]:
+    """Sorted author folder names under the data folder"""
+    return sorted(
+        name for name in os.listdir(base_folder)
+        if os.path.isdir(os.path.join(base_folder, name))
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack tafsir text files into per-author blobs")
+    parser.add_argument('authors', nargs='*', help="Authors to pack (default: all)")
+    parser.add_argument('--data', default='data', help="Folder containing the author folders")
+    parser.add_argument('--out', default='packed', help="Folder to write the packed files to")
+    args = parser.parse_args()
+
+    authors = args.authors or list_authors(args.data)
+    for author in authors:
+        count = pack_author(author, args.data, args.out)
+        print(f"{author}: packed {count} ayahs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Tafsir Export
+Streams an author/surah/language slice of the corpus to compressed JSON
+lines or a Parquet file, joining each ayah's metadata with its text and
+its cached translations
+
+Records are produced by a generator and written in fixed-size batches, so
+memory use depends on the batch size rather than on the size of the slice.
+"""
+
+import argparse
+import gzip
+import io
+import json
+import os
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from corpus_store import CorpusStore
+from manifest import MANIFEST_PATH, load_index
+from pretranslate import parse_languages, parse_surahs
+from tafsir_index import TafsirIndex
+from translation_cache import TranslationCache
+
+# Ayahs read and looked up per batch; also the Parquet row group size
+BATCH_SIZE = 256
+
+METADATA_FIELDS = ('author', 'surah_number', 'surah_name_arabic', 'surah_name_english',
+                   'ayah_number', 'tafsir_author', 'url', 'source_file')
+
+COMPRESSIONS = ('gzip', 'zstd', 'none')
+
+# Default levels: gzip level 1 writes the whole corpus about three times
+# faster than level 6 for a file about two thirds larger
+GZIP_LEVEL = 1
+ZSTD_LEVEL = 3
+
+
+def iter_records(index: TafsirIndex, corpus: CorpusStore, cache: Optional[TranslationCache],
+                 authors: Iterable[str], surahs: Optional[Iterable[int]] = None,
+                 languages: Iterable[str] = (), batch_size: int = BATCH_SIZE) -> Iterator[Dict]:
+    """
+    Yield one record per indexed ayah of the slice, in author, surah, ayah order
+
+    A record holds the metadata fields, 'text' (None if the text file is
+    missing) and 'translations' mapping each language to its cached
+    translation or None. Texts and translations are fetched a batch of
+    ayahs at a time.
+    """
+    languages = list(languages)
+    wanted = set(surahs) if surahs is not None else None
+    for author in authors:
+        for surah, _, _ in index.surahs(author):
+            if wanted is not None and surah not in wanted:
+                continue
+            ayahs = index.ayahs(author, surah)
+            for start in range(0, len(ayahs), batch_size):
+                batch = ayahs[start:start + batch_size]
+                texts = corpus.read_range(author, surah, batch)
+                translations = {
+                    lang: cache.get_many(lang, author, surah, batch) if cache is not None else {}
+                    for lang in languages
+                }
+                for ayah in batch:
+                    record = index.get(author, surah, ayah)
+                    yield {
+                        **{field: record[field] for field in METADATA_FIELDS},
+                        'text': texts.get(ayah),
+                        'translations': {lang: translations[lang].get(ayah) for lang in languages},
+                    }
+
+
+def _batches(records: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _open_compressed(path: str, compression: str, level: Optional[int]):
+    if compression == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=GZIP_LEVEL if level is None else level)
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("zstd output needs the zstandard package; use --compression gzip") from None
+        raw = open(path, 'wb')
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL if level is None else level).stream_writer(raw, closefd=True)
+    return open(path, 'wb')
+
+
+def write_jsonl(records: Iterable[Dict], path: str, compression: str = 'gzip',
+                level: Optional[int] = None, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Write records as JSON lines through gzip, zstd or no compression
+
+    Each batch is encoded into one buffer and handed to the compressor in a
+    single write.
+
+    Returns:
+        Number of records written
+    """
+    count = 0
+    with _open_compressed(path, compression, level) as out:
+        for batch in _batches(records, batch_size):
+            buffer = io.StringIO()
+            for record in batch:
+                buffer.write(json.dumps(record, ensure_ascii=False))
+                buffer.write('\n')
+            out.write(buffer.getvalue().encode('utf-8'))
+            count += len(batch)
+    return count
+
+
+def write_parquet(records: Iterable[Dict], path: str, languages: Iterable[str],
+                  compression: str = 'zstd', batch_size: int = BATCH_SIZE) -> int:
+    """
+    Write records to a Parquet file, one row group per batch
+
+    Translations become one translation_<lang> column per language. Needs
+    pyarrow.
+
+    Returns:
+        Number of records written
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet output needs the pyarrow package; use --format jsonl") from None
+
+    languages = list(languages)
+    schema = pa.schema(
+        [(field, pa.int32() if field in ('surah_number', 'ayah_number') else pa.string())
+         for field in METADATA_FIELDS]
+        + [('text', pa.string())]
+        + [(f'translation_{lang}', pa.string()) for lang in languages]
+    )
+
+    count = 0
+    with pq.ParquetWriter(path, schema, compression=compression if compression != 'none' else None) as writer:
+        for batch in _batches(records, batch_size):
+            columns = {field: [record[field] for record in batch] for field in METADATA_FIELDS}
+            columns['text'] = [record['text'] for record in batch]
+            for lang in languages:
+                columns[f'translation_{lang}'] = [record['translations'][lang] for record in batch]
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            count += len(batch)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export an author/surah/language slice of the tafsir corpus")
+    parser.add_argument('output', help="File to write, e.g. qurtubi-2.jsonl.gz or qurtubi-2.parquet")
+    parser.add_argument('--authors', nargs='*', help="Author folders to export (default: all)")
+    parser.add_argument('--surahs', help="Surah selection, e.g. '1-3,18' (default: all)")
+    parser.add_argument('--languages', nargs='*', default=[], help="Cached translations to include, by name or code")
+    parser.add_argument('--format', choices=('jsonl', 'parquet'),
+                        help="Output format (default: parquet for .parquet files, otherwise jsonl)")
+    parser.add_argument('--compression', choices=COMPRESSIONS,
+                        help="Compression (default: zstd for .zst and Parquet, none for .jsonl, otherwise gzip)")
+    parser.add_argument('--level', type=int, help="Compression level for JSON lines")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Ayahs read and written per batch")
+    parser.add_argument('--data', default='data', help="Folder containing the author folders")
+    parser.add_argument('--packed', default='packed', help="Folder containing packed author blobs")
+    parser.add_argument('--manifest', default=MANIFEST_PATH, help="Corpus manifest, used when it has been built")
+    parser.add_argument('--cache-db', default=os.path.join('cache', 'translations.db'), help="Translation cache database")
+    parser.add_argument('--legacy-cache', default='cache', help="Legacy cache/<lang>/<author>/ tree to read translations from")
+    args = parser.parse_args()
+
+    output_format = args.format or ('parquet' if args.output.endswith('.parquet') else 'jsonl')
+    compression = args.compression
+    if compression is None:
+        if output_format == 'parquet' or args.output.endswith('.zst'):
+            compression = 'zstd'
+        elif args.output.endswith('.jsonl'):
+            compression = 'none'
+        else:
+            compression = 'gzip'
+
+    index = load_index(args.data, args.manifest)
+    authors = args.authors or index.authors
+    unknown = [author for author in authors if author not in index.authors]
+    if unknown:
+        parser.error(f"unknown authors: {', '.join(unknown)}")
+    try:
+        surahs = parse_surahs(args.surahs)
+        languages = parse_languages(args.languages) if args.languages else []
+    except ValueError as e:
+        parser.error(str(e))
+
+    corpus = CorpusStore(args.data, args.packed)
+    # Legacy translations are read but not imported: an export only reads
+    cache = TranslationCache(args.cache_db, legacy_folder=args.legacy_cache, store_legacy=False) if languages else None
+    records = iter_records(index, corpus, cache, authors, surahs, languages, args.batch_size)
+
+    started = time.monotonic()
+    try:
+        if output_format == 'parquet':
+            count = write_parquet(records, args.output, languages, compression, args.batch_size)
+        else:
+            count = write_jsonl(records, args.output, compression, args.level, args.batch_size)
+    except RuntimeError as e:
+        parser.error(str(e))
+    elapsed = time.monotonic() - started
+
+    corpus.close()
+    if cache is not None:
+        cache.close()
+    size_mb = os.path.getsize(args.output) / (1024 * 1024)
+    print(f"{args.output}: {count} records, {size_mb:.1f} MB in {elapsed:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Corpus Manifest
+Compiles the JSON and CSV metadata under data/ into one binary file that
+the viewer loads with a single read, instead of listing and parsing every
+metadata file on each cold start
+
+Each source file is recorded with its mtime, size and content hash, so a
+rebuild only re-parses the files that actually changed.
+"""
+
+import argparse
+import hashlib
+import os
+import struct
+from typing import Callable, Dict, List, Optional, Tuple
+
+from corpus_store import list_authors
+from tafsir_index import AyahRecord, TafsirIndex, list_metadata_files, load_entries, parse_metadata
+
+MANIFEST_PATH = os.path.join('packed', 'manifest.bin')
+
+# Layout: header, file table, record table, then a NUL-separated string
+# table that the file and record tables index into
+MANIFEST_MAGIC = b'TAFSMAN1'
+MANIFEST_HEADER = struct.Struct('<8sIII')       # magic, files, records, string bytes
+FILE_RECORD = struct.Struct('<IIqQ16sII')       # author, filename, mtime_ns, size, digest, first record, record count
+AYAH_RECORD = struct.Struct('<IHIIHIII')        # author, surah, name ar, name en, ayah, tafsir author, url, source file
+
+# (surah, surah name arabic, surah name english, ayah, tafsir author, url)
+Row = Tuple[int, str, str, int, str, str]
+
+
+class _SourceFile:
+    __slots__ = ('author', 'filename', 'mtime_ns', 'size', 'digest', 'rows')
+
+    def __init__(self, author: str, filename: str, mtime_ns: int, size: int, digest: bytes, rows: List[Row]):
+        self.author = author
+        self.filename = filename
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.digest = digest
+        self.rows = rows
+
+
+def _digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def _rows(entries: List[Dict]) -> List[Row]:
+    return [
+        (
+            int(entry['surah_number']),
+            entry.get('surah_name_arabic') or '',
+            entry.get('surah_name_english') or '',
+            int(entry['ayah_number']),
+            entry.get('tafsir_author') or '',
+            entry.get('url') or '',
+        )
+        for entry in entries
+    ]
+
+
+def _read_manifest(data: bytes) -> Tuple[List[_SourceFile], List[str]]:
+    magic, file_count, record_count, strings_size = MANIFEST_HEADER.unpack_from(data, 0)
+    if magic != MANIFEST_MAGIC:
+        raise ValueError("Not a tafsir corpus manifest")
+
+    files_start = MANIFEST_HEADER.size
+    records_start = files_start + file_count * FILE_RECORD.size
+    strings_start = records_start + record_count * AYAH_RECORD.size
+    strings = data[strings_start:strings_start + strings_size].decode('utf-8').split('\x00')
+
+    records = list(AYAH_RECORD.iter_unpack(data[records_start:strings_start]))
+    files = []
+    for author, filename, mtime_ns, size, digest, first, count in FILE_RECORD.iter_unpack(data[files_start:records_start]):
+        rows = [
+            (surah, strings[name_ar], strings[name_en], ayah, strings[tafsir_author], strings[url])
+            for _, surah, name_ar, name_en, ayah, tafsir_author, url, _ in records[first:first + count]
+        ]
+        files.append(_SourceFile(strings[author], strings[filename], mtime_ns, size, digest, rows))
+    return files, strings
+
+
+def _write_manifest(path: str, files: List[_SourceFile]) -> None:
+    strings: Dict[str, int] = {}
+
+    def string_id(value: str) -> int:
+        if value not in strings:
+            strings[value] = len(strings)
+        return strings[value]
+
+    file_table = []
+    record_table = []
+    for source in files:
+        author = string_id(source.author)
+        filename = string_id(source.filename)
+        file_table.append(FILE_RECORD.pack(author, filename, source.mtime_ns, source.size,
+                                           source.digest, len(record_table), len(source.rows)))
+        for surah, name_ar, name_en, ayah, tafsir_author, url in source.rows:
+            record_table.append(AYAH_RECORD.pack(
+                author, surah, string_id(name_ar), string_id(name_en), ayah,
+                string_id(tafsir_author), string_id(url), filename
+            ))
+
+    string_block = '\x00'.join(strings).encode('utf-8')
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MANIFEST_HEADER.pack(MANIFEST_MAGIC, len(file_table), len(record_table), len(string_block)))
+        f.write(b''.join(file_table))
+        f.write(b''.join(record_table))
+        f.write(string_block)
+    os.replace(tmp_path, path)
+
+
+def build_manifest(base_folder: str = 'data', manifest_path: str = MANIFEST_PATH,
+                   on_error: Optional[Callable[[str, Exception], None]] = None) -> Dict[str, int]:
+    """
+    Build or incrementally update the manifest
+
+    Files whose mtime and size match the previous manifest are reused without
+    being read; files that were touched but hash the same are reused without
+    being parsed. Files that fail to parse are left out and reported through
+    on_error(path, error).
+
+    Returns:
+        Counts of 'reused', 'parsed', 'removed' and 'failed' files and of 'records'
+    """
+    previous = {}
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, 'rb') as f:
+                old_files, _ = _read_manifest(f.read())
+            previous = {(source.author, source.filename): source for source in old_files}
+        except (ValueError, struct.error, UnicodeDecodeError):
+            previous = {}
+
+    stats = {'reused': 0, 'parsed': 0, 'removed': 0, 'failed': 0, 'records': 0}
+    files = []
+    for author in list_authors(base_folder):
+        author_path = os.path.join(base_folder, author)
+        for filename in list_metadata_files(author_path):
+            file_path = os.path.join(author_path, filename)
+            stat = os.stat(file_path)
+            old = previous.pop((author, filename), None)
+
+            if old is not None and old.mtime_ns == stat.st_mtime_ns and old.size == stat.st_size:
+                files.append(old)
+                stats['reused'] += 1
+                continue
+
+            with open(file_path, 'rb') as f:
+                data = f.read()
+            digest = _digest(data)
+            if old is not None and old.digest == digest:
+                rows = old.rows
+                stats['reused'] += 1
+            else:
+                try:
+                    rows = _rows(parse_metadata(data, os.path.splitext(filename)[1]))
+                except Exception as e:
+                    stats['failed'] += 1
+                    if on_error is not None:
+                        on_error(file_path, e)
+                    continue
+                stats['parsed'] += 1
+            files.append(_SourceFile(author, filename, stat.st_mtime_ns, len(data), digest, rows))
+
+    stats['removed'] = len(previous)
+    stats['records'] = sum(len(source.rows) for source in files)
+    _write_manifest(manifest_path, files)
+    return stats
+
+
+def load_manifest(manifest_path: str = MANIFEST_PATH) -> TafsirIndex:
+    """
+    Build a TafsirIndex from the manifest with one file read
+
+    Raises:
+        FileNotFoundError: If the manifest has not been built
+        ValueError: If the file is not a manifest
+    """
+    with open(manifest_path, 'rb') as f:
+        data = f.read()
+
+    magic, file_count, record_count, strings_size = MANIFEST_HEADER.unpack_from(data, 0)
+    if magic != MANIFEST_MAGIC:
+        raise ValueError(f"Not a tafsir corpus manifest: {manifest_path}")
+
+    records_start = MANIFEST_HEADER.size + file_count * FILE_RECORD.size
+    strings_start = records_start + record_count * AYAH_RECORD.size
+    # Equal strings share one object, since each is decoded once here
+    strings = data[strings_start:strings_start + strings_size].decode('utf-8').split('\x00')
+
+    index = TafsirIndex()
+    for author, surah, name_ar, name_en, ayah, tafsir_author, url, source_file in \
+            AYAH_RECORD.iter_unpack(data[records_start:strings_start]):
+        index.add_record(AyahRecord(
+            strings[author], surah, strings[name_ar], strings[name_en], ayah,
+            strings[tafsir_author], strings[url], strings[source_file]
+        ))
+    index.finalize()
+    return index
+
+
+def load_index(base_folder: str = 'data', manifest_path: str = MANIFEST_PATH) -> TafsirIndex:
+    """The index from the manifest when it has been built, otherwise from the metadata files"""
+    if os.path.exists(manifest_path):
+        return load_manifest(manifest_path)
+    return TafsirIndex.from_entries(load_entries(base_folder))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the corpus metadata manifest")
+    parser.add_argument('--data', default='data', help="Folder containing the author folders")
+    parser.add_argument('--out', default=MANIFEST_PATH, help="Manifest file to write")
+    args = parser.parse_args()
+
+    stats = build_manifest(args.data, args.out, on_error=lambda path, e: print(f"{path}: {e}"))
+    print(f"{args.out}: {stats['records']} records from {stats['reused'] + stats['parsed']} files "
+          f"({stats['parsed']} parsed, {stats['reused']} reused, {stats['removed']} removed, {stats['failed']} failed)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Tafsir Metrics
+Timing spans, counters, gauges and histograms for the viewer's stages, exported in
+the Prometheus text format and as a JSON snapshot, with an optional JSON
+lines log of every span
+
+Set TAFSIR_METRICS_LOG to a file path to log spans, and TAFSIR_METRICS_PORT
+(with TAFSIR_METRICS_HOST, 127.0.0.1 by default) to serve /metrics and
+/metrics.json from the viewer process.
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Seconds; spans range from a cached read to a long multi-chunk translation
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+# name: (type, help, buckets)
+METRICS = {
+    'tafsir_stage_seconds': ('histogram', "Time spent in each pipeline stage", LATENCY_BUCKETS),
+    'tafsir_translation_seconds': ('histogram', "End-to-end translation time of one entry", LATENCY_BUCKETS),
+    'tafsir_chunks_per_request': ('histogram', "Chunks a translation request was split into", COUNT_BUCKETS),
+    'tafsir_cache_requests_total': ('counter', "Translation cache lookups by result", None),
+    'tafsir_memory_requests_total': ('counter', "Translation memory segment lookups by result", None),
+    'tafsir_prefetch_jobs_total': ('counter', "Background prefetch jobs by outcome", None),
+    'tafsir_render_cache_requests_total': ('counter', "Render cache lookups by kind and result", None),
+    'tafsir_render_cache_evictions_total': ('counter', "Entries evicted from a render or response cache", None),
+    'tafsir_render_cache_bytes': ('gauge', "Bytes held by a render or response cache", None),
+    'tafsir_api_requests_total': ('counter', "HTTP API requests by endpoint and status", None),
+    'tafsir_memory_pack_mismatches_total': ('counter', "Packed segment requests whose markers came back altered", None),
+    'tafsir_language_detections_total': ('counter', "Source language detections by method", None),
+    'tafsir_translation_lock_waits_total': ('counter', "Translations that waited for another translation of the same ayah", None),
+    'tafsir_translations_shared_total': ('counter', "Translations found in the cache once the ayah's lock was taken", None),
+    'tafsir_chunk_attempts_total': ('counter', "Provider requests made for chunks, including retries", None),
+    'tafsir_chunk_retries_total': ('counter', "Chunk requests that were retries", None),
+    'tafsir_chunk_failures_total': ('counter', "Chunks that failed after all retries", None),
+}
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict) -> LabelSet:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """
+    Thread-safe store of counters, gauges and histograms keyed by name and labels
+
+    Buckets hold per-bucket counts and are made cumulative only on export,
+    so an observation costs one short scan and a lock.
+    """
+
+    def __init__(self, log_path: Optional[str] = None):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelSet, float]] = {}
+        self._gauges: Dict[str, Dict[LabelSet, float]] = {}
+        self._histograms: Dict[str, Dict[LabelSet, _Histogram]] = {}
+        self.log_path = log_path
+        self._log_lock = threading.Lock()
+        self._log_file = None
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                buckets = METRICS.get(name, ('histogram', '', LATENCY_BUCKETS))[2]
+                histogram = series[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def span(self, stage: str, **labels) -> Iterator[None]:
+        """Time a block as tafsir_stage_seconds{stage=...} and log it"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe('tafsir_stage_seconds', elapsed, stage=stage, **labels)
+            if self.log_path:
+                self.log({'event': 'span', 'stage': stage, 'seconds': round(elapsed, 6), **labels})
+
+    def log(self, record: Dict) -> None:
+        """Append one record to the JSON lines log"""
+        line = json.dumps({'time': datetime.now().isoformat(), **record}, ensure_ascii=False) + '\n'
+        with self._log_lock:
+            # Opened once and line buffered, so each record reaches the file
+            # without reopening it for every span
+            if self._log_file is None:
+                self._log_file = open(self.log_path, 'a', encoding='utf-8', buffering=1)
+            self._log_file.write(line)
+
+    def snapshot(self) -> Dict:
+        """All series as a JSON-serializable dict"""
+        with self._lock:
+            counters = {
+                name: [{'labels': dict(key), 'value': value} for key, value in series.items()]
+                for name, series in self._counters.items()
+            }
+            gauges = {
+                name: [{'labels': dict(key), 'value': value} for key, value in series.items()]
+                for name, series in self._gauges.items()
+            }
+            histograms = {
+                name: [
+                    {
+                        'labels': dict(key),
+                        'count': histogram.count,
+                        'sum': histogram.sum,
+                        'buckets': dict(zip(map(str, histogram.buckets), _cumulative(histogram.counts))),
+                    }
+                    for key, histogram in series.items()
+                ]
+                for name, series in self._histograms.items()
+            }
+        return {'time': datetime.now().isoformat(), 'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+    def render_prometheus(self) -> str:
+        """All series in the Prometheus text exposition format"""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                _header(lines, name, 'counter')
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_number(value)}")
+
+            for name, series in sorted(self._gauges.items()):
+                _header(lines, name, 'gauge')
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_number(value)}")
+
+            for name, series in sorted(self._histograms.items()):
+                _header(lines, name, 'histogram')
+                for key, histogram in sorted(series.items()):
+                    for bound, count in zip(histogram.buckets, _cumulative(histogram.counts)):
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', _format_number(bound)),))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_number(histogram.sum)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+def _cumulative(counts: List[int]) -> List[int]:
+    total = 0
+    result = []
+    for count in counts:
+        total += count
+        result.append(total)
+    return result
+
+
+def _header(lines: List[str], name: str, metric_type: str) -> None:
+    help_text = METRICS.get(name, (metric_type, name, None))[1]
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {metric_type}")
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key: LabelSet) -> str:
+    if not key:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in key) + '}'
+
+
+def _format_number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+# Process-wide registry used by the module functions below
+REGISTRY = Registry(log_path=os.environ.get('TAFSIR_METRICS_LOG') or None)
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    REGISTRY.inc(name, value, **labels)
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    REGISTRY.set_gauge(name, value, **labels)
+
+
+def observe(name: str, value: float, **labels) -> None:
+    REGISTRY.observe(name, value, **labels)
+
+
+def span(stage: str, **labels):
+    return REGISTRY.span(stage, **labels)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            body = self.registry.render_prometheus().encode('utf-8')
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        elif self.path == '/metrics.json':
+            body = json.dumps(self.registry.snapshot(), ensure_ascii=False).encode('utf-8')
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int, host: str = '127.0.0.1', registry: Registry = REGISTRY) -> ThreadingHTTPServer:
+    """Serve /metrics and /metrics.json from a daemon thread"""
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
+
+
+def summarize_log(path: str) -> Dict[str, Dict[str, float]]:
+    """Count, total and maximum seconds per stage from a JSON lines span log"""
+    stages: Dict[str, Dict[str, float]] = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # torn final line
+            if record.get('event') != 'span':
+                continue
+            stats = stages.setdefault(record['stage'], {'count': 0, 'total': 0.0, 'max': 0.0})
+            stats['count'] += 1
+            stats['total'] += record['seconds']
+            stats['max'] = max(stats['max'], record['seconds'])
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a tafsir metrics span log")
+    parser.add_argument('log', nargs='?', default=os.environ.get('TAFSIR_METRICS_LOG'), help="JSON lines span log")
+    args = parser.parse_args()
+    if not args.log:
+        parser.error("no log file given and TAFSIR_METRICS_LOG is not set")
+
+    print(f"{'stage':<20} {'count':>8} {'total s':>10} {'mean ms':>10} {'max ms':>10}")
+    for stage, stats in sorted(summarize_log(args.log).items(), key=lambda item: -item[1]['total']):
+        print(f"{stage:<20} {stats['count']:>8} {stats['total']:>10.3f} "
+              f"{stats['total'] / stats['count'] * 1000:>10.2f} {stats['max'] * 1000:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
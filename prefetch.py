@@ -0,0 +1,188 @@
+"""
+Translation Prefetch
+Background queue that translates the ayahs following the one being read,
+so that in sequential reading the next ayah is already in the translation
+cache when the reader gets to it
+
+Jobs are keyed by (lang, author, surah, ayah), so a job queued by several
+readers runs once, and they run on a small fixed pool of daemon threads.
+Every reader has a generation number that each new request bumps; a job
+whose reader has moved on is dropped when it reaches a worker, or between
+two chunks if it is already being translated.
+"""
+
+import itertools
+import queue
+import sys
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+import metrics
+from translation_cache import TranslationCache, translate_and_store
+
+# Ayahs translated ahead of the last one shown
+PREFETCH_AHEAD = 3
+
+# Share of the foreground translator's request rate prefetching may use
+PREFETCH_RATE_SHARE = 0.5
+
+JobKey = Tuple[str, str, int, int]  # (lang, author, surah, ayah)
+
+
+class Prefetcher:
+    """
+    Deduplicated, bounded background translation queue
+
+    Nearer ayahs are translated first: a job's priority is its distance from
+    the ayah the reader is on. Translations go through translate_and_store,
+    so they reach the cache exactly as a foreground translation would, and
+    through a background view of the shared translator (see
+    TafsirTranslator.background), which uses at most rate_share of its
+    request rate and gives way to foreground requests.
+    """
+
+    def __init__(self, cache: TranslationCache, translator, corpus,
+                 workers: int = 1, max_pending: int = 256, rate_share: float = PREFETCH_RATE_SHARE):
+        self.cache = cache
+        self.translator = translator.background(rate_share)
+        self.corpus = corpus
+        self.max_pending = max_pending
+        self._queue: 'queue.PriorityQueue' = queue.PriorityQueue()
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        # Queued or running jobs, with the (reader, generation) that wants them
+        self._pending: Dict[JobKey, Tuple[str, int]] = {}
+        # Generations of readers with pending jobs, and how many jobs each has
+        self._generations: Dict[str, int] = {}
+        self._reader_jobs: Dict[str, int] = {}
+        self._counts = {'queued': 0, 'deduplicated': 0, 'cancelled': 0,
+                        'cached': 0, 'translated': 0, 'failed': 0}
+        self._workers = [
+            threading.Thread(target=self._run, name=f'prefetch-{i}', daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def prefetch(self, reader: str, lang: str, surah: int, ayahs_by_author: Dict[str, Iterable[int]]) -> int:
+        """
+        Queue translations of each author's ayahs, nearest first, for a reader
+
+        The reader's earlier jobs that have not started yet are cancelled,
+        unless this request asks for them again.
+
+        Returns:
+            Number of jobs added to the queue
+        """
+        added = 0
+        jobs = [
+            (priority, (lang, author, surah, ayah))
+            for author, ayahs in ayahs_by_author.items()
+            for priority, ayah in enumerate(ayahs)
+        ]
+        with self._lock:
+            generation = self._generations.get(reader, 0) + 1
+            self._generations[reader] = generation
+            for priority, key in sorted(jobs):
+                if key in self._pending:
+                    # Already queued or running; the newest request keeps it alive
+                    self._unassign(key)
+                    self._assign(key, reader, generation)
+                    self._count('deduplicated')
+                    continue
+                if len(self._pending) >= self.max_pending:
+                    break
+                self._assign(key, reader, generation)
+                self._queue.put((priority, next(self._sequence), key))
+                self._count('queued')
+                added += 1
+            if reader not in self._reader_jobs:
+                del self._generations[reader]
+        return added
+
+    def cancel(self, reader: str) -> None:
+        """Drop a reader's queued jobs and stop its running ones after their current chunk"""
+        with self._lock:
+            if reader in self._generations:
+                self._generations[reader] += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Job counts by outcome, plus the jobs currently pending"""
+        with self._lock:
+            return dict(self._counts, pending=len(self._pending))
+
+    def close(self) -> None:
+        """Stop the workers, once running jobs reach the end of their current chunk"""
+        with self._lock:
+            for reader in self._generations:
+                self._generations[reader] += 1
+        for _ in self._workers:
+            self._queue.put((float('inf'), next(self._sequence), None))
+        for worker in self._workers:
+            worker.join()
+
+    def _count(self, outcome: str) -> None:
+        # Called with the lock held
+        self._counts[outcome] += 1
+        metrics.inc('tafsir_prefetch_jobs_total', result=outcome)
+
+    def _assign(self, key: JobKey, reader: str, generation: int) -> None:
+        # Called with the lock held
+        self._pending[key] = (reader, generation)
+        self._reader_jobs[reader] = self._reader_jobs.get(reader, 0) + 1
+
+    def _unassign(self, key: JobKey) -> None:
+        # Called with the lock held; a reader with no jobs left is forgotten
+        reader, _ = self._pending.pop(key)
+        self._reader_jobs[reader] -= 1
+        if not self._reader_jobs[reader]:
+            del self._reader_jobs[reader]
+            del self._generations[reader]
+
+    def _is_stale(self, key: JobKey) -> bool:
+        # Called with the lock held
+        reader, generation = self._pending[key]
+        return self._generations.get(reader) != generation
+
+    def _run(self) -> None:
+        while True:
+            _, _, key = self._queue.get()
+            if key is None:
+                return
+            with self._lock:
+                if self._is_stale(key):
+                    self._unassign(key)
+                    self._count('cancelled')
+                    continue
+            outcome = 'failed'
+            try:
+                outcome = self._translate(key)
+            except Exception as e:
+                print(f"prefetch {'/'.join(map(str, key))}: {e}", file=sys.stderr)
+            finally:
+                with self._lock:
+                    self._unassign(key)
+                    self._count(outcome)
+
+    def _translate(self, key: JobKey) -> str:
+        lang, author, surah, ayah = key
+        if self.cache.contains(lang, author, surah, ayah):
+            return 'cached'
+        text = self.corpus.read(author, surah, ayah)
+
+        def cancelled() -> bool:
+            with self._lock:
+                return self._is_stale(key)
+
+        with metrics.span('prefetch', lang=lang):
+            result, stored = translate_and_store(self.cache, self.translator, text, lang, author, surah, ayah,
+                                                 cancelled=cancelled)
+        if result is None:
+            return 'cancelled'
+        return 'translated' if stored else 'failed'
+
+
+def following_ayahs(available_ayahs: Iterable[int], last_ayah: int,
+                    count: int = PREFETCH_AHEAD) -> List[int]:
+    """The next count ayahs after last_ayah, in reading order"""
+    return [ayah for ayah in available_ayahs if ayah > last_ayah][:count]
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Bulk Tafsir Pre-Translation
+Fills the translation cache offline for a set of authors, surahs and target
+languages, so readers in the viewer get cache hits instead of waiting on
+translate_tafsir
+
+Work is sharded across processes and every finished item is appended to a
+checkpoint file, so a killed run resumes where it stopped.
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from typing import Iterable, List, Optional, Set, Tuple
+
+from corpus_store import CorpusStore, list_authors
+from translate import TafsirTranslator, LANGUAGE_CODES
+from translation_cache import TranslationCache, TranslationMemory, translate_and_store
+
+WorkItem = Tuple[str, str, int, int]  # (lang, author, surah, ayah)
+
+# Per-process resources, created by _init_worker
+_worker = {}
+
+
+def parse_surahs(spec: Optional[str]) -> Optional[Set[int]]:
+    """Parse a surah selection such as '1-3,18,36' into a set of numbers"""
+    if not spec:
+        return None
+
+    surahs = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if '-' in part:
+                start, end = part.split('-', 1)
+                start, end = int(start), int(end)
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise ValueError(f"Invalid surah selection: {part}") from None
+        if start > end:
+            raise ValueError(f"Invalid surah range: {part}")
+        surahs.update(range(start, end + 1))
+    return surahs
+
+
+def parse_languages(values: Optional[List[str]]) -> List[str]:
+    """Accept language names or codes from LANGUAGE_CODES; default to all"""
+    if not values:
+        return list(LANGUAGE_CODES.values())
+
+    by_name = {name.lower(): code for name, code in LANGUAGE_CODES.items()}
+    codes = set(LANGUAGE_CODES.values())
+    languages = []
+    for value in values:
+        code = by_name.get(value.lower(), value.lower())
+        if code not in codes:
+            raise ValueError(f"Unknown language: {value}")
+        languages.append(code)
+    return languages
+
+
+def read_checkpoint(path: str) -> Tuple[Set[WorkItem], Set[WorkItem]]:
+    """Return the (done, failed) items recorded in a checkpoint file"""
+    done, failed = set(), set()
+    if not os.path.exists(path):
+        return done, failed
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.rstrip('\n').split('\t')
+            if len(parts) != 5:
+                continue  # torn final line from a killed run
+            lang, author, surah, ayah, status = parts
+            item = (lang, author, int(surah), int(ayah))
+            if status == 'ok':
+                done.add(item)
+                failed.discard(item)
+            else:
+                failed.add(item)
+    return done, failed
+
+
+def plan_work(corpus: CorpusStore, cache: TranslationCache, authors: Iterable[str],
+              surahs: Optional[Set[int]], languages: Iterable[str],
+              done: Set[WorkItem], skip: Set[WorkItem]) -> Tuple[List[WorkItem], int]:
+    """
+    List the items still to translate
+
+    Returns:
+        Tuple of (pending items, number of items skipped as already done)
+    """
+    pending = []
+    skipped = 0
+    for author in authors:
+        keys = [key for key in corpus.keys(author) if surahs is None or key[0] in surahs]
+        for lang in languages:
+            for surah, ayah in keys:
+                item = (lang, author, surah, ayah)
+                if item in done or item in skip or cache.contains(*item):
+                    skipped += 1
+                else:
+                    pending.append(item)
+    return pending, skipped
+
+
+def _init_worker(data_folder: str, packed_folder: str, db_path: str, legacy_folder: str,
+                 requests_per_second: float, chunk_workers: int, backend: Optional[str],
+                 use_memory: bool) -> None:
+    _worker['corpus'] = CorpusStore(data_folder, packed_folder)
+    _worker['cache'] = TranslationCache(db_path, legacy_folder=legacy_folder)
+    _worker['memory'] = TranslationMemory(db_path) if use_memory else None
+    _worker['translator'] = TafsirTranslator(
+        max_workers=chunk_workers,
+        requests_per_second=requests_per_second,
+        backend=backend,
+        memory=_worker['memory'],
+    )
+
+
+def _memory_counts() -> Tuple[int, int]:
+    memory = _worker['memory']
+    return (memory.hits, memory.misses) if memory is not None else (0, 0)
+
+
+def _translate_item(item: WorkItem) -> Tuple[WorkItem, bool, int, float, int, int]:
+    """Returns (item, stored, characters, seconds, memory hits, memory misses)"""
+    lang, author, surah, ayah = item
+    started = time.monotonic()
+    hits, misses = _memory_counts()
+    try:
+        text = _worker['corpus'].read(author, surah, ayah)
+        _, stored = translate_and_store(
+            _worker['cache'], _worker['translator'], text, lang, author, surah, ayah
+        )
+    except Exception as e:
+        print(f"{lang}/{author}/{surah}_{ayah}: {e}", file=sys.stderr)
+        stored, text = False, ''
+    after_hits, after_misses = _memory_counts()
+    return item, stored, len(text), time.monotonic() - started, after_hits - hits, after_misses - misses
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours:d}:{minutes:02d}:{seconds:02d}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-translate tafsir entries into the translation cache")
+    parser.add_argument('--authors', nargs='*', help="Author folders to translate (default: all)")
+    parser.add_argument('--surahs', help="Surah selection, e.g. '1-3,18' (default: all)")
+    parser.add_argument('--languages', nargs='*', help="Target language names or codes (default: all)")
+    parser.add_argument('--processes', type=int, default=2, help="Number of worker processes")
+    parser.add_argument('--chunk-workers', type=int, default=2, help="Concurrent chunks per entry within a process")
+    parser.add_argument('--rate', type=float, default=1.0, help="Total provider requests per second across all processes")
+    parser.add_argument('--backend', help="Translation backend name (default: TAFSIR_TRANSLATION_BACKEND or google)")
+    parser.add_argument('--data', default='data', help="Folder containing the author folders")
+    parser.add_argument('--packed', default='packed', help="Folder containing packed author blobs")
+    parser.add_argument('--cache-db', default=os.path.join('cache', 'translations.db'), help="Translation cache database")
+    parser.add_argument('--legacy-cache', default='cache', help="Legacy cache/<lang>/<author>/ tree to import from")
+    parser.add_argument('--checkpoint', default=os.path.join('cache', 'pretranslate.checkpoint'), help="Checkpoint file")
+    parser.add_argument('--memory', action='store_true', help="Reuse and store segment translations")
+    parser.add_argument('--skip-failed', action='store_true', help="Do not retry items that failed in an earlier run")
+    args = parser.parse_args()
+
+    authors = args.authors or list_authors(args.data)
+    try:
+        surahs = parse_surahs(args.surahs)
+        languages = parse_languages(args.languages)
+    except ValueError as e:
+        parser.error(str(e))
+    processes = max(1, args.processes)
+
+    corpus = CorpusStore(args.data, args.packed)
+    cache = TranslationCache(args.cache_db, legacy_folder=args.legacy_cache)
+    done, failed = read_checkpoint(args.checkpoint)
+    pending, skipped = plan_work(corpus, cache, authors, surahs, languages, done,
+                                 failed if args.skip_failed else set())
+    cache.close()
+    corpus.close()
+
+    total = len(pending)
+    print(f"{total} entries to translate, {skipped} already done")
+    if not total:
+        return
+
+    initargs = (args.data, args.packed, args.cache_db, args.legacy_cache,
+                args.rate / processes, args.chunk_workers, args.backend, args.memory)
+
+    started = time.monotonic()
+    completed = failures = chars = memory_hits = memory_lookups = 0
+
+    with open(args.checkpoint, 'a', encoding='utf-8') as checkpoint, \
+            multiprocessing.Pool(processes, initializer=_init_worker, initargs=initargs) as pool:
+        for item, stored, length, _, hits, misses in pool.imap_unordered(_translate_item, pending):
+            completed += 1
+            chars += length
+            memory_hits += hits
+            memory_lookups += hits + misses
+            if not stored:
+                failures += 1
+
+            lang, author, surah, ayah = item
+            checkpoint.write(f"{lang}\t{author}\t{surah}\t{ayah}\t{'ok' if stored else 'failed'}\n")
+            checkpoint.flush()
+
+            elapsed = time.monotonic() - started
+            rate = completed / elapsed if elapsed else 0.0
+            eta = (total - completed) / rate if rate else 0.0
+            print(
+                f"[{completed}/{total}] {lang}/{author}/{surah}_{ayah} "
+                f"{'ok' if stored else 'FAILED'} | {rate:.2f} entries/s, "
+                f"{chars / elapsed / 1024 if elapsed else 0:.1f} KB/s | "
+                f"elapsed {_format_duration(elapsed)}, ETA {_format_duration(eta)}",
+                flush=True
+            )
+
+    print(f"Finished {completed} entries in {_format_duration(time.monotonic() - started)}, {failures} failed")
+    if memory_lookups:
+        print(f"Translation memory: {memory_hits}/{memory_lookups} segments reused "
+              f"({memory_hits / memory_lookups:.1%} hit rate)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Tafsir Rendering
+Splits long tafsir entries into pages so the viewer only sends the part of
+an entry the reader is looking at, and keeps recently served texts and
+pages in a process-wide cache bounded in bytes
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+import metrics
+from translate import split_into_chunks
+
+# Characters per page; about one screen of the scrollable text box
+PAGE_SIZE = 6000
+
+# Pages sent on first display: the visible page plus the next one
+INITIAL_PAGES = 2
+
+# Default budget of the render cache
+RENDER_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def split_into_pages(text: str, page_size: int = PAGE_SIZE) -> List[str]:
+    """
+    Split an entry into pages of roughly page_size characters
+
+    Pages are built from whole paragraphs where possible, so the line breaks
+    of the source text are kept. A paragraph longer than a page is cut at
+    sentence boundaries with the same chunker used for translation.
+    """
+    if len(text) <= page_size:
+        return [text]
+
+    pages = []
+    current = []
+    current_length = 0
+
+    for paragraph in text.split('\n'):
+        pieces = split_into_chunks(paragraph, page_size) if len(paragraph) > page_size else [paragraph]
+        for piece in pieces:
+            if current and current_length + len(piece) > page_size:
+                pages.append('\n'.join(current))
+                current = []
+                current_length = 0
+            current.append(piece)
+            current_length += len(piece) + 1
+
+    if current:
+        pages.append('\n'.join(current))
+
+    return pages
+
+
+def _size_of(value: Any) -> int:
+    """Approximate memory held by a cached value"""
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_size_of(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_size_of(item) for item in value.values())
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by the bytes its values hold
+
+    Keys are tuples whose first item names the kind of value ('text',
+    'pages'); hits and misses are counted per kind. The bytes held and the
+    evictions are exported under the cache's name. A value larger than the
+    whole budget is returned to the caller but not stored.
+    """
+
+    def __init__(self, max_bytes: int = RENDER_CACHE_BYTES, name: str = 'render'):
+        self.max_bytes = max_bytes
+        self.name = name
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        metrics.inc('tafsir_render_cache_requests_total', kind=key[0], result='miss' if entry is None else 'hit')
+        return entry[0] if entry is not None else None
+
+    def put(self, key: tuple, value: Any) -> None:
+        size = _size_of(value)
+        if size > self.max_bytes:
+            return
+        evicted = 0
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                evicted += 1
+            self.evictions += evicted
+            held = self._bytes
+        metrics.set_gauge('tafsir_render_cache_bytes', held, cache=self.name)
+        if evicted:
+            metrics.inc('tafsir_render_cache_evictions_total', evicted, cache=self.name)
+
+    def get_or_load(self, key: tuple, load: Callable[[], Any]) -> Any:
+        """Return the cached value, or load and cache it; None from load is not cached"""
+        value = self.get(key)
+        if value is None:
+            value = load()
+            if value is not None:
+                self.put(key, value)
+        return value
+
+    def __contains__(self, key: tuple) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        metrics.set_gauge('tafsir_render_cache_bytes', 0, cache=self.name)
+
+
+def cached_pages(cache: LRUCache, key: tuple, text: str, page_size: int = PAGE_SIZE) -> List[str]:
+    """
+    split_into_pages through the cache, under ('pages', *key)
+
+    The text's hash is stored with its pages, so a key whose text changed,
+    such as a translation that failed and was retried, is split again.
+    """
+    cache_key = ('pages',) + tuple(key)
+    text_hash = hash(text)
+    entry = cache.get(cache_key)
+    if entry is not None and entry[0] == text_hash:
+        return entry[1]
+    pages = split_into_pages(text, page_size)
+    cache.put(cache_key, (text_hash, pages))
+    return pages
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Tafsir Full-Text Search
+A prebuilt inverted index over every data/<author>/{surah}_{ayah}.txt text,
+with diacritic-insensitive Arabic normalization, BM25 ranking, phrase and
+prefix queries, and highlighted snippets
+
+Build the index once (and again after the corpus changes):
+    python search_index.py build
+
+Query it from the command line:
+    python search_index.py query '"بسم الله" رحم*'
+"""
+
+import argparse
+import array
+import html
+import json
+import math
+import mmap
+import os
+import re
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from corpus_store import CorpusStore, list_authors
+
+# Harakat, superscript alef, Quranic annotation marks and tatweel
+DIACRITICS = '\u064B-\u065F\u0670\u06D6-\u06ED\u0640'
+_DIACRITICS = re.compile(f'[{DIACRITICS}]+')
+
+# Letter variants folded onto one form
+LETTER_FOLDS = (
+    ('أ', 'ا'), ('إ', 'ا'), ('آ', 'ا'), ('ٱ', 'ا'),
+    ('ؤ', 'و'), ('ئ', 'ي'), ('ى', 'ي'), ('ة', 'ه'),
+)
+
+_TOKEN = re.compile(r'\w+')
+_QUERY_PART = re.compile(r'"([^"]*)"|(\S+)')
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Prefix queries expand to at most this many of the most frequent terms
+MAX_PREFIX_EXPANSIONS = 100
+
+# Phrase queries confirm at most this many candidate texts
+MAX_PHRASE_CHECKS = 1000
+
+
+def normalize_arabic(text: str) -> str:
+    """Strip diacritics and tatweel and unify alef, hamza, ya and ta marbuta forms"""
+    text = _DIACRITICS.sub('', text)
+    for old, new in LETTER_FOLDS:
+        if old in text:
+            text = text.replace(old, new)
+    return text
+
+
+def tokenize(text: str) -> List[str]:
+    """Normalized search terms of a text"""
+    return _TOKEN.findall(normalize_arabic(text))
+
+
+def _letter_pattern(letter: str) -> str:
+    variants = [letter] + [old for old, new in LETTER_FOLDS if new == letter]
+    letters = re.escape(letter) if len(variants) == 1 else '[' + ''.join(variants) + ']'
+    return letters + f'[{DIACRITICS}]*'
+
+
+def term_pattern(term: str, prefix: bool = False) -> str:
+    """Regex matching a normalized term in the original, vocalized text"""
+    pattern = r'(?<!\w)' + ''.join(_letter_pattern(letter) for letter in term)
+    if prefix:
+        return pattern + rf'[\w{DIACRITICS}]*'
+    return pattern + r'(?!\w)'
+
+
+def parse_query(query: str) -> List[Tuple[str, List[str]]]:
+    """
+    Split a query into parts
+
+    Returns:
+        List of (kind, terms) where kind is 'phrase', 'prefix' or 'term'
+    """
+    parts = []
+    for match in _QUERY_PART.finditer(query):
+        phrase, word = match.groups()
+        if phrase is not None:
+            terms = tokenize(phrase)
+            if len(terms) > 1:
+                parts.append(('phrase', terms))
+            elif terms:
+                parts.append(('term', terms))
+        elif word.endswith('*'):
+            terms = tokenize(word[:-1])
+            if terms:
+                parts.append(('prefix', terms[-1:]))
+                parts.extend(('term', [term]) for term in terms[:-1])
+        else:
+            parts.extend(('term', [term]) for term in tokenize(word))
+    return parts
+
+
+def build_index(corpus: CorpusStore, authors: Iterable[str], index_folder: str = 'index/search') -> int:
+    """
+    Build the inverted index for the given authors
+
+    Returns:
+        Number of documents indexed
+    """
+    docs = []
+    postings: Dict[str, Tuple[array.array, array.array]] = {}
+
+    for author in authors:
+        for surah, ayah, text in corpus.iter_author(author):
+            doc_id = len(docs)
+            counts = Counter(tokenize(text))
+            docs.append([author, surah, ayah, sum(counts.values())])
+            for term, tf in counts.items():
+                entry = postings.get(term)
+                if entry is None:
+                    entry = postings[term] = (array.array('I'), array.array('H'))
+                entry[0].append(doc_id)
+                entry[1].append(min(tf, 0xFFFF))
+
+    os.makedirs(index_folder, exist_ok=True)
+    terms = sorted(postings)
+
+    term_offsets = array.array('I', [0])
+    posting_offsets = array.array('I', [0])
+    with open(os.path.join(index_folder, 'terms.bin.tmp'), 'wb') as term_file, \
+            open(os.path.join(index_folder, 'docs.bin.tmp'), 'wb') as doc_file, \
+            open(os.path.join(index_folder, 'tf.bin.tmp'), 'wb') as tf_file:
+        for term in terms:
+            encoded = term.encode('utf-8')
+            term_file.write(encoded)
+            term_offsets.append(term_offsets[-1] + len(encoded))
+
+            doc_ids, tfs = postings[term]
+            doc_ids.tofile(doc_file)
+            tfs.tofile(tf_file)
+            posting_offsets.append(posting_offsets[-1] + len(doc_ids))
+
+    with open(os.path.join(index_folder, 'offsets.bin.tmp'), 'wb') as f:
+        term_offsets.tofile(f)
+        posting_offsets.tofile(f)
+
+    total_length = sum(doc[3] for doc in docs)
+    with open(os.path.join(index_folder, 'meta.json.tmp'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'term_count': len(terms),
+            'avg_length': total_length / len(docs) if docs else 0.0,
+            'docs': docs,
+        }, f, ensure_ascii=False)
+
+    for name in ('terms.bin', 'docs.bin', 'tf.bin', 'offsets.bin', 'meta.json'):
+        path = os.path.join(index_folder, name)
+        os.replace(path + '.tmp', path)
+
+    return len(docs)
+
+
+def _map(path: str):
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class SearchIndex:
+    """
+    Read side of the inverted index
+
+    Terms and postings stay in mmap'd files; looking a term up is a binary
+    search over the sorted term blob. Phrases are answered by intersecting
+    the postings of their terms and confirming the phrase in the candidate
+    texts with a diacritic-tolerant regex, which also locates the snippet.
+    """
+
+    def __init__(self, index_folder: str = 'index/search', corpus: Optional[CorpusStore] = None):
+        self.index_folder = index_folder
+        self.corpus = corpus or CorpusStore()
+
+        with open(os.path.join(index_folder, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.docs = [tuple(doc) for doc in meta['docs']]
+        self.avg_length = meta['avg_length'] or 1.0
+        term_count = meta['term_count']
+
+        with open(os.path.join(index_folder, 'offsets.bin'), 'rb') as f:
+            self._term_offsets = array.array('I')
+            self._term_offsets.fromfile(f, term_count + 1)
+            self._posting_offsets = array.array('I')
+            self._posting_offsets.fromfile(f, term_count + 1)
+
+        self._terms = _map(os.path.join(index_folder, 'terms.bin'))
+        self._doc_ids = memoryview(_map(os.path.join(index_folder, 'docs.bin'))).cast('I')
+        self._tfs = memoryview(_map(os.path.join(index_folder, 'tf.bin'))).cast('H')
+        self._term_count = term_count
+
+    @classmethod
+    def exists(cls, index_folder: str = 'index/search') -> bool:
+        return os.path.exists(os.path.join(index_folder, 'meta.json'))
+
+    def _term(self, i: int) -> bytes:
+        return self._terms[self._term_offsets[i]:self._term_offsets[i + 1]]
+
+    def _bisect(self, key: bytes) -> int:
+        low, high = 0, self._term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _lookup(self, term: str) -> Optional[int]:
+        key = term.encode('utf-8')
+        i = self._bisect(key)
+        if i < self._term_count and self._term(i) == key:
+            return i
+        return None
+
+    def _postings(self, i: int) -> Dict[int, int]:
+        start, end = self._posting_offsets[i], self._posting_offsets[i + 1]
+        return dict(zip(self._doc_ids[start:end], self._tfs[start:end]))
+
+    def _expand_prefix(self, prefix: str) -> List[int]:
+        key = prefix.encode('utf-8')
+        i = self._bisect(key)
+        matches = []
+        while i < self._term_count and self._term(i).startswith(key):
+            matches.append(i)
+            i += 1
+        if len(matches) > MAX_PREFIX_EXPANSIONS:
+            matches.sort(key=lambda t: self._posting_offsets[t] - self._posting_offsets[t + 1])
+            matches = matches[:MAX_PREFIX_EXPANSIONS]
+        return matches
+
+    def _idf(self, df: int) -> float:
+        n = len(self.docs)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def _score(self, postings: Dict[int, int], candidates: Iterable[int], scores: Dict[int, float]) -> None:
+        idf = self._idf(len(postings))
+        for doc_id in candidates:
+            tf = postings.get(doc_id)
+            if tf:
+                length = self.docs[doc_id][3]
+                norm = K1 * (1 - B + B * length / self.avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+
+    def search(self, query: str, limit: int = 20, authors: Optional[Iterable[str]] = None,
+               snippet_chars: int = 90) -> List[Dict]:
+        """
+        Search the corpus
+
+        Plain words must all occur; "quoted words" must occur as a phrase;
+        word* matches any term starting with word.
+
+        Returns:
+            Hits ordered by score, each a dict with author, surah, ayah,
+            score and an HTML snippet with the matches in <mark>
+        """
+        parts = parse_query(query)
+        if not parts:
+            return []
+
+        # One postings map per required part; prefix parts merge their expansions
+        required = []
+        for kind, terms in parts:
+            if kind == 'prefix':
+                merged: Dict[int, int] = {}
+                for i in self._expand_prefix(terms[0]):
+                    for doc_id, tf in self._postings(i).items():
+                        merged[doc_id] = merged.get(doc_id, 0) + tf
+                required.append(merged)
+            else:
+                for term in terms:
+                    i = self._lookup(term)
+                    required.append(self._postings(i) if i is not None else {})
+
+        required.sort(key=len)
+        candidates = set(required[0])
+        for postings in required[1:]:
+            candidates.intersection_update(postings)
+            if not candidates:
+                return []
+
+        if authors is not None:
+            allowed = set(authors)
+            candidates = {doc_id for doc_id in candidates if self.docs[doc_id][0] in allowed}
+
+        scores: Dict[int, float] = {}
+        for postings in required:
+            self._score(postings, candidates, scores)
+        ranked = sorted(candidates, key=lambda doc_id: (-scores.get(doc_id, 0.0), doc_id))
+
+        phrases = [re.compile(r'\W+'.join(term_pattern(term) for term in terms))
+                   for kind, terms in parts if kind == 'phrase']
+        highlight = re.compile('|'.join(
+            r'\W+'.join(term_pattern(term) for term in terms) if kind == 'phrase'
+            else term_pattern(terms[0], prefix=(kind == 'prefix'))
+            for kind, terms in parts
+        ))
+
+        hits = []
+        for doc_id in ranked[:MAX_PHRASE_CHECKS] if phrases else ranked[:limit]:
+            author, surah, ayah, _ = self.docs[doc_id]
+            text = self.corpus.read(author, surah, ayah)
+            if any(phrase.search(text) is None for phrase in phrases):
+                continue
+            hits.append({
+                'author': author,
+                'surah': surah,
+                'ayah': ayah,
+                'score': scores.get(doc_id, 0.0),
+                'snippet': make_snippet(text, highlight, snippet_chars),
+            })
+            if len(hits) >= limit:
+                break
+        return hits
+
+
+def make_snippet(text: str, pattern: 're.Pattern', width: int = 90) -> str:
+    """HTML snippet around the first match, with matches wrapped in <mark>"""
+    match = pattern.search(text)
+    if match is None:
+        return html.escape(text[:width * 2])
+
+    start = max(0, match.start() - width)
+    end = min(len(text), match.end() + width)
+    window = text[start:end]
+
+    pieces = []
+    position = 0
+    for found in pattern.finditer(window):
+        pieces.append(html.escape(window[position:found.start()]))
+        pieces.append(f'<mark>{html.escape(found.group())}</mark>')
+        position = found.end()
+    pieces.append(html.escape(window[position:]))
+
+    prefix = '… ' if start > 0 else ''
+    suffix = ' …' if end < len(text) else ''
+    return prefix + ''.join(pieces).replace('\n', ' ') + suffix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the tafsir full-text index")
+    parser.add_argument('--data', default='data', help="Folder containing the author folders")
+    parser.add_argument('--packed', default='packed', help="Folder containing packed author blobs")
+    parser.add_argument('--index', default=os.path.join('index', 'search'), help="Index folder")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="Build the index")
+    build.add_argument('authors', nargs='*', help="Authors to index (default: all)")
+
+    query = commands.add_parser('query', help="Run a query")
+    query.add_argument('query', help='Query text; use "..." for phrases and word* for prefixes')
+    query.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    corpus = CorpusStore(args.data, args.packed)
+    if args.command == 'build':
+        started = time.monotonic()
+        count = build_index(corpus, args.authors or list_authors(args.data), args.index)
+        print(f"Indexed {count} documents in {time.monotonic() - started:.1f}s")
+    else:
+        index = SearchIndex(args.index, corpus)
+        started = time.perf_counter()
+        hits = index.search(args.query, limit=args.limit)
+        elapsed = (time.perf_counter() - started) * 1000
+        for hit in hits:
+            snippet = re.sub(r'</?mark>', '**', html.unescape(hit['snippet']))
+            print(f"{hit['author']} {hit['surah']}:{hit['ayah']} ({hit['score']:.2f})  {snippet}")
+        print(f"{len(hits)} hits in {elapsed:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Tafsir Index
+An in-memory author -> surah -> ayah index over the tafsir metadata entries,
+so the viewer can answer sidebar lookups without rescanning the flat list
+"""
+
+import csv
+import io
+import json
+import os
+import sys
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class AyahRecord:
+    """Compact metadata record for a single tafsir entry"""
+
+    __slots__ = (
+        'author',
+        'surah_number',
+        'surah_name_arabic',
+        'surah_name_english',
+        'ayah_number',
+        'tafsir_author',
+        'url',
+        'source_file',
+    )
+
+    def __init__(self, author: str, surah_number: int, surah_name_arabic: str,
+                 surah_name_english: str, ayah_number: int, tafsir_author: str,
+                 url: str, source_file: str):
+        self.author = author
+        self.surah_number = surah_number
+        self.surah_name_arabic = surah_name_arabic
+        self.surah_name_english = surah_name_english
+        self.ayah_number = ayah_number
+        self.tafsir_author = tafsir_author
+        self.url = url
+        self.source_file = source_file
+
+    def __getitem__(self, key: str):
+        # Allows records to be used where the old entry dicts were expected
+        return getattr(self, key)
+
+    def __repr__(self) -> str:
+        return f"AyahRecord({self.author!r}, {self.surah_number}, {self.ayah_number})"
+
+
+# Metadata file types; for the same ayah an entry from JSON wins over CSV
+METADATA_SUFFIXES = ('.json', '.csv')
+
+
+def list_metadata_files(author_path: str) -> List[str]:
+    """Metadata filenames in an author folder, in the order they are loaded"""
+    files = []
+    for filename in os.listdir(author_path):
+        stem, suffix = os.path.splitext(filename)
+        if suffix in METADATA_SUFFIXES:
+            files.append((stem, METADATA_SUFFIXES.index(suffix), filename))
+    return [filename for _, _, filename in sorted(files)]
+
+
+def parse_metadata(data: bytes, suffix: str) -> List[Dict]:
+    """Parse the contents of a JSON or CSV metadata file into entry dicts"""
+    text = data.decode('utf-8-sig')
+    if suffix == '.csv':
+        return list(csv.DictReader(io.StringIO(text)))
+    return json.loads(text)
+
+
+def read_metadata_file(file_path: str) -> List[Dict]:
+    with open(file_path, 'rb') as f:
+        return parse_metadata(f.read(), os.path.splitext(file_path)[1])
+
+
+def load_entries(base_folder: str = 'data',
+                 on_error: Optional[Callable[[str, Exception], None]] = None) -> List[Dict]:
+    """
+    Read every metadata entry from the author folders' JSON and CSV files
+
+    Each entry is tagged with its author folder and source file. Files that
+    fail to parse are skipped and reported through on_error(path, error).
+    """
+    all_data = []
+    for author_folder in sorted(os.listdir(base_folder)):
+        author_path = os.path.join(base_folder, author_folder)
+        if os.path.isdir(author_path):
+            for filename in list_metadata_files(author_path):
+                file_path = os.path.join(author_path, filename)
+                try:
+                    content = read_metadata_file(file_path)
+                    for entry in content:
+                        entry["source_file"] = filename
+                        entry["author"] = author_folder
+                        all_data.append(entry)
+                except Exception as e:
+                    if on_error is not None:
+                        on_error(file_path, e)
+    return all_data
+
+
+def _intern(value) -> str:
+    return sys.intern(str(value)) if value is not None else ''
+
+
+class TafsirIndex:
+    """
+    Hierarchical index keyed author -> surah -> ayah
+
+    Sorted key lists are computed once at build time, so the sidebar reads
+    them directly and an ayah lookup is a constant-time dict access.
+    """
+
+    def __init__(self):
+        self._tree: Dict[str, Dict[int, Dict[int, AyahRecord]]] = {}
+        self._authors: List[str] = []
+        self._surahs: Dict[str, List[Tuple[int, str, str]]] = {}
+        self._ayahs: Dict[Tuple[str, int], List[int]] = {}
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Dict]) -> 'TafsirIndex':
+        """
+        Build the index from the flat entry dicts produced by the loader
+
+        Args:
+            entries: Entry dicts tagged with 'author' and 'source_file'
+        """
+        index = cls()
+        for entry in entries:
+            index.add(entry)
+        index.finalize()
+        return index
+
+    def add(self, entry: Dict) -> None:
+        """Insert one entry; the first entry seen for an ayah wins"""
+        self.add_record(AyahRecord(
+            author=_intern(entry['author']),
+            surah_number=int(entry['surah_number']),
+            surah_name_arabic=_intern(entry.get('surah_name_arabic')),
+            surah_name_english=_intern(entry.get('surah_name_english')),
+            ayah_number=int(entry['ayah_number']),
+            tafsir_author=_intern(entry.get('tafsir_author')),
+            url=_intern(entry.get('url')),
+            source_file=_intern(entry.get('source_file')),
+        ))
+
+    def add_record(self, record: AyahRecord) -> None:
+        """Insert a prebuilt record; the first record seen for an ayah wins"""
+        ayahs = self._tree.setdefault(record.author, {}).setdefault(record.surah_number, {})
+        if record.ayah_number not in ayahs:
+            ayahs[record.ayah_number] = record
+
+    def finalize(self) -> None:
+        """Precompute the sorted key lists used by the sidebar"""
+        self._authors = sorted(self._tree)
+        self._surahs = {}
+        self._ayahs = {}
+
+        for author, surahs in self._tree.items():
+            surah_list = []
+            for surah_number, ayahs in surahs.items():
+                first = ayahs[min(ayahs)]
+                surah_list.append((surah_number, first.surah_name_arabic, first.surah_name_english))
+                self._ayahs[(author, surah_number)] = sorted(ayahs)
+            self._surahs[author] = sorted(surah_list)
+
+    @property
+    def authors(self) -> List[str]:
+        """Sorted author folder names"""
+        return self._authors
+
+    def surahs(self, author: str) -> List[Tuple[int, str, str]]:
+        """Sorted (surah_number, surah_name_arabic, surah_name_english) for an author"""
+        return self._surahs.get(author, [])
+
+    def ayahs(self, author: str, surah_number: int) -> List[int]:
+        """Sorted ayah numbers available for an author's surah"""
+        return self._ayahs.get((author, surah_number), [])
+
+    def get(self, author: str, surah_number: int, ayah_number: int) -> Optional[AyahRecord]:
+        """Fetch the record for a single ayah, or None if it is not indexed"""
+        return self._tree.get(author, {}).get(surah_number, {}).get(ayah_number)
+
+    def __len__(self) -> int:
+        return sum(len(ayahs) for surahs in self._tree.values() for ayahs in surahs.values())
@@ -5,42 +5,671 @@ A Python script to translate Arabic or Urdu Quranic commentary (tafsir) to Engli
 Automatically detects source language and translates using deep-translator
 """
 
+import copy
+import itertools
+import os
+import random
 import time
 import re
-from typing import List, Dict, Optional, Union, Tuple
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Iterator, List, Dict, Optional, Union, Tuple
 from datetime import datetime
 
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
 # Deep-translator imports
-from deep_translator import GoogleTranslator, single_detection
+from deep_translator import single_detection
+from deep_translator.constants import BASE_URLS
+
+import metrics
+
+# Target languages offered by the viewer, by display name
+LANGUAGE_CODES = {
+    "Bengali": "bn",
+    "English": "en",
+    "French": "fr",
+    "German": "de",
+    "Hindi": "hi",
+    "Indonesian": "id",
+    "Malay": "ms",
+    "Spanish": "es",
+    "Swahili": "sw",
+    "Turkish": "tr",
+    "Urdu": "ur"
+}
+
+# Sentence ends in Arabic, Urdu and Latin text, plus the edges of ﴿...﴾ quotes
+_SENTENCE_BOUNDARY = re.compile(r'[.!?؟۔]+(?=\s|$)|﴾|(?=﴿)')
+
+# Precompiled normalization patterns and tables
+_SENTENCE_BODY = re.compile(r'[^.!?]+')
+_BATCH_SENTENCE_BODY = re.compile(r'[^.!?\x00]+')
+_URDU_FULL_STOPS = re.compile(r'۔+')
+_WHITESPACE = re.compile(r'\s+')
+_DIGITS = re.compile(r'[0-9]+')
+_DETECTION_NOISE = re.compile(r'[^\w\s\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF]')
+_ARABIC_SCRIPT = re.compile(r'[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF]')
+_WORD_CHAR = re.compile(r'\w')
+_URDU_SPECIFIC = re.compile(r'[\u0679\u067E\u0686\u0688\u0691\u06BA\u06BE\u06C1\u06C3\u06CC\u06D2]')
+
+# Local language detection: letters by script, and the marks stripped before
+# matching the n-gram profiles
+_LETTER = re.compile(r'[^\W\d_]')
+_ARABIC_LETTER = re.compile(r'[\u0621-\u064A\u066E-\u06D3\u06D5\u06EE-\u06FF\u0750-\u077F]')
+_LATIN_LETTER = re.compile(r'[A-Za-z\u00C0-\u024F]')
+_ARABIC_MARKS = re.compile(r'[\u064B-\u065F\u0670\u06D6-\u06ED\u0640]+')
+
+# Frequent character n-grams, mostly short function words padded with spaces.
+# Urdu also counts each letter Arabic does not use (_URDU_SPECIFIC).
+_NGRAM_PROFILES = {
+    'ar': (' في ', ' من ', ' على ', ' عن ', ' إلى ', ' أن ', ' الذي ', ' قال ', ' ال', 'ة ', 'ون ', 'ين '),
+    'ur': (' کے ', ' کی ', ' کا ', ' ہے', ' ہیں', ' میں ', ' اور ', ' سے ', ' کو ', ' نے ', 'ے ', 'ں '),
+    'en': (' the ', ' and ', ' of ', ' to ', ' in ', ' is ', ' that ', ' for ', ' with ', ' his '),
+}
+
+# Letters needed for a fully confident local guess
+_DETECTION_MIN_LETTERS = 40
+_DETECTION_SAMPLE = 1000
+
+# Arabic/Urdu punctuation to Latin, Quranic markers dropped, Arabic-Indic digits
+# to Western. Applied with str.replace: on this non-ASCII text it measures an
+# order of magnitude faster than str.translate or a single regex with a callback.
+_ARABIC_PUNCTUATION = (
+    ('«', '"'), ('»', '"'), ('،', ','), ('؛', ';'), ('؟', '?'),
+    ('﴾', ''), ('﴿', ''), ('۞', ''),
+) + tuple(zip('٠١٢٣٤٥٦٧٨٩', '0123456789'))
+
+# Spaces removed before punctuation in translations
+_SPACED_PUNCTUATION = tuple((' ' + mark, mark) for mark in '.!?,:;')
+
+# Separates texts joined for the batch functions; never produced by the pipeline
+_BATCH_SEPARATOR = '\x00'
+_BATCH_BLOCK_SIZE = 64 * 1024
+
+# Precedes each text packed into a shared request by translate_tafsir_batch;
+# tolerant of the spacing providers add inside brackets
+_PACK_MARKER = '[[#{}]]'
+_PACK_MARKER_PATTERN = re.compile(r'\[\[\s*#\s*(\d+)\s*\]\]')
+
+
+def normalize_source_text(text: str, language: str) -> str:
+    """
+    Normalize source text before chunking
+    
+    str.split() and the regex whitespace class agree on what counts as
+    whitespace, so splitting and re-joining collapses runs exactly like the
+    previous regex substitution on stripped text, at a fraction of the cost.
+    """
+    text = ' '.join(text.split())
+    
+    if language in ('ar', 'ur'):
+        for old, new in _ARABIC_PUNCTUATION:
+            if old in text:
+                text = text.replace(old, new)
+        if language == 'ur':
+            text = _URDU_FULL_STOPS.sub('۔', text)
+    
+    return text
+
+
+def _capitalize_sentence(match: 're.Match') -> str:
+    sentence = match.group()
+    stripped = sentence.strip()
+    if not stripped:
+        return sentence
+    return stripped[0].upper() + stripped[1:]
+
+
+def normalize_translation(text: str, _sentence_body: 're.Pattern' = _SENTENCE_BODY) -> str:
+    """
+    Tidy a joined translation: collapse whitespace, drop spaces before
+    punctuation and capitalize each sentence
+    
+    Every sentence is stripped before it is capitalized, so a space after
+    sentence punctuation never survives; the separate pass that inserted one
+    before capital letters is therefore not needed.
+    """
+    text = ' '.join(text.split())
+    for old, new in _SPACED_PUNCTUATION:
+        if old in text:
+            text = text.replace(old, new)
+    return _sentence_body.sub(_capitalize_sentence, text).strip()
+
+
+def _normalize_grouped(texts: List[str], normalize_one, normalize_joined) -> List[str]:
+    # Small texts are joined into blocks so the per-call overhead is paid once
+    # per block; blocks stay small because one huge string is slower again
+    if any(_BATCH_SEPARATOR in text for text in texts):
+        return [normalize_one(text) for text in texts]
+    
+    results = []
+    block = []
+    block_size = 0
+    for text in texts:
+        block.append(text)
+        block_size += len(text)
+        if block_size >= _BATCH_BLOCK_SIZE:
+            results.extend(normalize_joined(block))
+            block = []
+            block_size = 0
+    if block:
+        results.extend(normalize_joined(block))
+    return results
+
+
+def normalize_source_batch(texts: List[str], language: str) -> List[str]:
+    """normalize_source_text over many texts, joined into blocks"""
+    def normalize_joined(block: List[str]) -> List[str]:
+        # Stripping first keeps whitespace from merging across separators
+        joined = _BATCH_SEPARATOR.join(text.strip() for text in block)
+        return normalize_source_text(joined, language).split(_BATCH_SEPARATOR)
+    
+    return _normalize_grouped(texts, lambda text: normalize_source_text(text, language), normalize_joined)
+
+
+def normalize_translation_batch(texts: List[str]) -> List[str]:
+    """normalize_translation over many texts, joined into blocks"""
+    def normalize_joined(block: List[str]) -> List[str]:
+        joined = normalize_translation(_BATCH_SEPARATOR.join(block), _BATCH_SENTENCE_BODY)
+        return [text.strip() for text in joined.split(_BATCH_SEPARATOR)]
+    
+    return _normalize_grouped(texts, normalize_translation, normalize_joined)
+
+
+def split_into_chunks(text: str, max_length: int = 3500) -> List[str]:
+    """
+    Split text into chunks of at most max_length characters
+    
+    Chunks are cut at the last sentence boundary (. ! ? ؟ ۔ or a ﴿﴾ quote
+    edge) that fits, falling back to the last space when that boundary
+    would leave the chunk less than half full, and to a hard cut for a
+    single over-long word. Boundaries are found in one regex pass and
+    consumed with a forward-only pointer, so the cost is linear in the
+    text length.
+    """
+    if len(text) <= max_length:
+        return [text]
+    
+    boundaries = [match.end() for match in _SENTENCE_BOUNDARY.finditer(text)]
+    chunks = []
+    text_length = len(text)
+    start = 0
+    next_boundary = 0
+    
+    while start < text_length:
+        # Chunks never begin with whitespace
+        while start < text_length and text[start].isspace():
+            start += 1
+        if start >= text_length:
+            break
+        
+        limit = start + max_length
+        if limit >= text_length:
+            chunks.append(text[start:].rstrip())
+            break
+        
+        while next_boundary < len(boundaries) and boundaries[next_boundary] <= limit:
+            next_boundary += 1
+        cut = boundaries[next_boundary - 1] if next_boundary else start
+        
+        if cut - start < max_length // 2:
+            space = max(text.rfind(' ', start, limit + 1), text.rfind('\n', start, limit + 1))
+            cut = space if space > cut else cut
+        if cut <= start:
+            cut = limit
+        
+        chunk = text[start:cut].rstrip()
+        if chunk:
+            chunks.append(chunk)
+        start = cut
+    
+    return chunks
+
+
+def split_into_segments(text: str, language: str, max_length: int = 3500) -> List[str]:
+    """
+    Split raw source text into normalized, reusable segments
+    
+    The text is cut at the boundaries split_into_chunks uses, sentence ends
+    and ﴿﴾ quote edges, before normalization removes the quote marks, so
+    every quotation becomes a segment of its own. Segments longer than
+    max_length are chunked.
+    """
+    pieces = []
+    start = 0
+    for match in _SENTENCE_BOUNDARY.finditer(text):
+        if match.end() > start:
+            pieces.append(text[start:match.end()])
+            start = match.end()
+    pieces.append(text[start:])
+    
+    segments = []
+    for segment in normalize_source_batch(pieces, language):
+        if len(segment) > max_length:
+            segments.extend(split_into_chunks(segment, max_length))
+        elif segment:
+            segments.append(segment)
+    return segments
+
+
+def group_segments(segments: List[str], max_length: int = 3500) -> List[List[str]]:
+    """
+    Group consecutive segments into requests of at most max_length characters
+    
+    Each segment is counted with the [[#n]] marker it is sent behind; a
+    segment too long to share a request is grouped on its own.
+    """
+    groups = []
+    current: List[str] = []
+    current_size = 0
+    for segment in segments:
+        # Marker, space and segment, plus the newline joining it to the previous one
+        size = len(_PACK_MARKER.format(len(current))) + 1 + len(segment)
+        if current and current_size + 1 + size > max_length:
+            groups.append(current)
+            current = []
+            current_size = 0
+            size = len(_PACK_MARKER.format(0)) + 1 + len(segment)
+        current_size += size + (1 if current else 0)
+        current.append(segment)
+    if current:
+        groups.append(current)
+    return groups
+
+
+def group_missing_segments(segments: List[str], known: Dict[str, str],
+                           max_length: int = 3500) -> List[List[str]]:
+    """
+    Group segments in order so that each group's unknown segments fit in one request
+    
+    The segments missing from known are grouped with group_segments; the
+    segments in known, which need no request, join the group of the next
+    missing segment, or the last group. If every segment is known, they
+    form a single group.
+    """
+    requests = group_segments([segment for segment in segments if segment not in known], max_length)
+    # How many missing segments lie up to the end of each group
+    ends = list(itertools.accumulate(len(request) for request in requests))
+    groups = []
+    current: List[str] = []
+    missing = 0
+    for segment in segments:
+        current.append(segment)
+        if segment not in known:
+            missing += 1
+            if len(groups) < len(ends) - 1 and missing == ends[len(groups)]:
+                groups.append(current)
+                current = []
+    if current:
+        groups.append(current)
+    return groups
+
+
+def detect_script_language(text: str) -> Tuple[str, float]:
+    """
+    Guess whether text is Arabic, Urdu or English without a network call
+    
+    The script of the letters in a sample of the text separates Arabic
+    script from Latin; hits against small per-language n-gram profiles
+    then separate Arabic from Urdu. The confidence is the share of letters
+    in the winning script times the share of profile hits for the winning
+    language, scaled down for samples under _DETECTION_MIN_LETTERS letters.
+    
+    Returns:
+        Tuple of (language code, confidence from 0 to 1)
+    """
+    if len(text) > _DETECTION_SAMPLE:
+        start = len(text) // 4
+        text = text[start:start + _DETECTION_SAMPLE]
+    
+    letters = len(_LETTER.findall(text))
+    if not letters:
+        return 'ar', 0.0
+    size = min(1.0, letters / _DETECTION_MIN_LETTERS)
+    arabic = len(_ARABIC_LETTER.findall(text))
+    latin = len(_LATIN_LETTER.findall(text))
+    
+    padded = f" {' '.join(_ARABIC_MARKS.sub('', text).split())} "
+    if latin > arabic:
+        # Profile hits per word; about one word in five is a listed English one
+        hits = sum(padded.count(ngram) for ngram in _NGRAM_PROFILES['en'])
+        words = max(1, padded.count(' ') - 1)
+        return 'en', size * latin / letters * min(1.0, hits / words * 5)
+    
+    arabic_hits = sum(padded.count(ngram) for ngram in _NGRAM_PROFILES['ar'])
+    urdu_hits = (sum(padded.count(ngram) for ngram in _NGRAM_PROFILES['ur'])
+                 + len(_URDU_SPECIFIC.findall(text)))
+    if not arabic_hits and not urdu_hits:
+        return 'ar', 0.5 * size * arabic / letters
+    share = urdu_hits / (arabic_hits + urdu_hits)
+    language = 'ur' if share > 0.5 else 'ar'
+    return language, size * arabic / letters * max(share, 1.0 - share)
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket limiting the request rate to the provider
+    
+    Tokens refill continuously at `rate` per second up to `capacity`; every
+    request takes one token and waits if none is available. Background
+    requests only take a token while no foreground request is waiting.
+    """
+    
+    def __init__(self, rate: float, capacity: float = 1.0):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self._foreground_waiting = 0
+    
+    def acquire(self, background: bool = False) -> float:
+        """
+        Take one token, blocking until it is available
+        
+        Returns:
+            Seconds spent waiting
+        """
+        waited = 0.0
+        queued = False
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                    self._last = now
+                    
+                    if self._tokens >= 1.0 and not (background and self._foreground_waiting):
+                        self._tokens -= 1.0
+                        return waited
+                    
+                    if not background and not queued:
+                        self._foreground_waiting += 1
+                        queued = True
+                    # A background request giving way checks again a token later
+                    wait = max(1.0 - self._tokens, 1.0 if background else 0.0) / self.rate
+                
+                time.sleep(wait)
+                waited += wait
+        finally:
+            if queued:
+                with self._lock:
+                    self._foreground_waiting -= 1
+
+
+class BackgroundRateLimiter:
+    """
+    Rate limit for background requests: their own, lower rate, and then a
+    token from the shared limiter taken only when no foreground request
+    is waiting for one
+    """
+    
+    def __init__(self, shared: RateLimiter, rate: float):
+        self.shared = shared
+        self.own = RateLimiter(rate)
+    
+    def acquire(self) -> float:
+        waited = self.own.acquire()
+        return waited + self.shared.acquire(background=True)
+
+
+class TranslationBackendError(Exception):
+    """Raised by a backend when a request fails"""
+
+
+class TranslationBackend:
+    """
+    Interface for translation providers
+    
+    Subclasses declare the largest text they accept in one request and
+    translate a batch of texts; the translator takes care of chunking,
+    retries and rate limiting.
+    """
+    
+    name = 'base'
+    max_request_size = 3500
+    
+    def translate_batch(self, texts: List[str], source_lang: str, target_lang: str) -> List[str]:
+        """Translate each text, returning results in the same order"""
+        raise NotImplementedError
+    
+    def translate(self, text: str, source_lang: str, target_lang: str) -> str:
+        return self.translate_batch([text], source_lang, target_lang)[0]
+    
+    def detect(self, text: str) -> Optional[str]:
+        """Return a language code for the text, or None if unsupported"""
+        return None
+    
+    @classmethod
+    def from_env(cls) -> 'TranslationBackend':
+        """Build with settings from the environment; the defaults here"""
+        return cls()
+    
+    def close(self) -> None:
+        """Release any connections held by the backend"""
+
+
+class GoogleBackend(TranslationBackend):
+    """
+    Google Translate's web endpoint over one pooled keep-alive session
+    
+    deep-translator's GoogleTranslator opens a fresh connection for every
+    request; this backend sends the same request through a requests.Session
+    shared by all threads, so connections and TLS sessions are reused.
+    pool_size caps the open connections; extra threads wait for a free one.
+    """
+    
+    name = 'google'
+    max_request_size = 3500
+    
+    def __init__(self,
+                 pool_size: int = 8,
+                 connect_timeout: float = 5.0,
+                 read_timeout: float = 30.0):
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        # Retries are left to TafsirTranslator.translate_chunk
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+    
+    @classmethod
+    def from_env(cls) -> 'GoogleBackend':
+        """Build from TAFSIR_HTTP_* environment variables"""
+        return cls(
+            pool_size=int(os.environ.get('TAFSIR_HTTP_POOL_SIZE', 8)),
+            connect_timeout=float(os.environ.get('TAFSIR_HTTP_CONNECT_TIMEOUT', 5.0)),
+            read_timeout=float(os.environ.get('TAFSIR_HTTP_READ_TIMEOUT', 30.0)),
+        )
+    
+    def translate_batch(self, texts: List[str], source_lang: str, target_lang: str) -> List[str]:
+        return [self._translate_one(text, source_lang, target_lang) for text in texts]
+    
+    def _translate_one(self, text: str, source_lang: str, target_lang: str) -> str:
+        text = text.strip()
+        if not text or source_lang == target_lang:
+            return text
+        
+        response = self.session.get(
+            BASE_URLS['GOOGLE_TRANSLATE'],
+            params={'sl': source_lang, 'tl': target_lang, 'q': text},
+            timeout=self.timeout,
+        )
+        try:
+            if response.status_code == 429:
+                raise TranslationBackendError("Too many requests")
+            if response.status_code != 200:
+                raise TranslationBackendError(f"HTTP {response.status_code}")
+            soup = BeautifulSoup(response.text, 'html.parser')
+        finally:
+            response.close()
+        
+        element = soup.find('div', {'class': 't0'}) or soup.find('div', {'class': 'result-container'})
+        if element is None:
+            raise TranslationBackendError("No translation in response")
+        return element.get_text(strip=True)
+    
+    def detect(self, text: str) -> Optional[str]:
+        return single_detection(text, api_key=None)
+    
+    def close(self) -> None:
+        self.session.close()
+
+
+class OfflineBackend(TranslationBackend):
+    """
+    Deterministic local stand-in for benchmarks and load tests
+    
+    Translations are the input text tagged with the target language. Each
+    request sleeps for a configurable latency and fails with a configurable
+    probability; failures are drawn from a seeded generator so runs repeat.
+    """
+    
+    name = 'offline'
+    
+    def __init__(self,
+                 latency: float = 0.0,
+                 latency_per_char: float = 0.0,
+                 failure_rate: float = 0.0,
+                 max_request_size: int = 3500,
+                 seed: int = 0):
+        self.latency = latency
+        self.latency_per_char = latency_per_char
+        self.failure_rate = failure_rate
+        self.max_request_size = max_request_size
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_env(cls) -> 'OfflineBackend':
+        """Build from TAFSIR_OFFLINE_* environment variables"""
+        return cls(
+            latency=float(os.environ.get('TAFSIR_OFFLINE_LATENCY', 0.0)),
+            latency_per_char=float(os.environ.get('TAFSIR_OFFLINE_LATENCY_PER_CHAR', 0.0)),
+            failure_rate=float(os.environ.get('TAFSIR_OFFLINE_FAILURE_RATE', 0.0)),
+            max_request_size=int(os.environ.get('TAFSIR_OFFLINE_MAX_REQUEST_SIZE', 3500)),
+            seed=int(os.environ.get('TAFSIR_OFFLINE_SEED', 0)),
+        )
+    
+    def translate_batch(self, texts: List[str], source_lang: str, target_lang: str) -> List[str]:
+        results = []
+        for text in texts:
+            if len(text) > self.max_request_size:
+                raise TranslationBackendError(f"Request of {len(text)} chars exceeds {self.max_request_size}")
+            
+            with self._lock:
+                failed = self._random.random() < self.failure_rate
+            
+            delay = self.latency + self.latency_per_char * len(text)
+            if delay > 0:
+                time.sleep(delay)
+            if failed:
+                raise TranslationBackendError("Injected failure")
+            
+            results.append(f"{target_lang}: {text}")
+        return results
+
+
+BACKENDS = {
+    'google': GoogleBackend,
+    'offline': OfflineBackend,
+}
+
+
+def create_backend(name: Optional[str] = None) -> TranslationBackend:
+    """
+    Create a translation backend by name
+    
+    Args:
+        name: Key in BACKENDS; defaults to the TAFSIR_TRANSLATION_BACKEND
+            environment variable, then 'google'
+    """
+    name = name or os.environ.get('TAFSIR_TRANSLATION_BACKEND', 'google')
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown translation backend: {name}")
+    return BACKENDS[name].from_env()
+
 
 class TafsirTranslator:
-    def __init__(self, delay_between_requests: float = 3.0):
+    def __init__(self,
+                 delay_between_requests: float = 3.0,
+                 max_workers: int = 1,
+                 requests_per_second: Optional[float] = None,
+                 burst: int = 1,
+                 backend: Union[TranslationBackend, str, None] = None,
+                 memory=None):
         """
         Initialize the multi-language tafsir translator
         
         Args:
             delay_between_requests: Delay between API calls to respect rate limits
+            max_workers: Number of chunks translated concurrently (1 = sequential)
+            requests_per_second: Provider request rate; defaults to one request
+                per delay_between_requests
+            burst: Number of requests that may be sent back to back
+            backend: Backend instance or name; defaults to create_backend()
+            memory: Optional TranslationMemory; when given, text is split into
+                sentence and quote segments and stored segment translations
+                are reused instead of being requested again
         """
+        if backend is None or isinstance(backend, str):
+            backend = create_backend(backend)
+        self.backend = backend
+        self.memory = memory
         self.delay_between_requests = delay_between_requests
+        self.max_workers = max(1, max_workers)
+        if requests_per_second is None:
+            requests_per_second = 1.0 / delay_between_requests if delay_between_requests > 0 else float('inf')
+        self.rate_limiter = RateLimiter(requests_per_second, burst) if requests_per_second != float('inf') else None
         self.target_lang = 'en'  # English
         self.supported_languages = {
             'ar': 'Arabic',
             'ur': 'Urdu'
         }
         
+    def background(self, rate_share: float) -> 'TafsirTranslator':
+        """
+        A translator for background work sharing this one's backend and memory
+        
+        Its requests are sent one chunk at a time, at no more than rate_share
+        of this translator's rate, and give way to this translator's own
+        requests when both are waiting on the rate limit.
+        """
+        translator = copy.copy(self)
+        translator.max_workers = 1
+        if self.rate_limiter is not None:
+            translator.rate_limiter = BackgroundRateLimiter(self.rate_limiter, self.rate_limiter.rate * rate_share)
+        return translator
+    
     def detect_language(self, text: str, confidence_threshold: float = 0.8) -> Tuple[str, float, str]:
         """
         Detect the source language of the text
         
+        detect_script_language answers locally first; the backend is asked
+        only when the local confidence is below confidence_threshold, and the
+        local guess is kept if that request fails.
+        
         Returns:
             Tuple of (language_code, confidence, language_name)
         """
+        local_lang, local_confidence = detect_script_language(text)
+        if local_confidence >= confidence_threshold:
+            metrics.inc('tafsir_language_detections_total', method='local')
+            return local_lang, local_confidence, self.supported_languages.get(local_lang, 'English')
+        
+        metrics.inc('tafsir_language_detections_total', method='backend')
         try:
             # Clean text for better detection
             clean_text = self._clean_text_for_detection(text)
             
-            # Use single detection for better accuracy
-            detected_lang = single_detection(clean_text, api_key=None)
+            # Ask the backend when the local guess is unsure
+            detected_lang = self.backend.detect(clean_text)
             
             # Map detected language
             if detected_lang in self.supported_languages:
@@ -63,6 +692,8 @@ class TafsirTranslator:
             return detected_lang, confidence, lang_name
             
         except Exception as e:
+            if local_confidence > 0.5:
+                return local_lang, local_confidence, self.supported_languages.get(local_lang, 'English')
             return 'ar', 0.5, 'Arabic (default)'
     
     def _clean_text_for_detection(self, text: str) -> str:
@@ -75,143 +706,86 @@ class TafsirTranslator:
             text = text[start:end]
         
         # Remove excessive punctuation and numbers
-        text = re.sub(r'[0-9]+', '', text)
-        text = re.sub(r'[^\w\s\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF]', ' ', text)
-        text = re.sub(r'\s+', ' ', text.strip())
+        text = _DIGITS.sub('', text)
+        text = _DETECTION_NOISE.sub(' ', text)
+        text = _WHITESPACE.sub(' ', text.strip())
         
         return text
     
     def _has_arabic_script(self, text: str) -> bool:
         """Check if text contains Arabic script characters"""
-        arabic_pattern = re.compile(r'[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF]')
-        arabic_chars = len(arabic_pattern.findall(text))
-        total_chars = len(re.findall(r'\w', text))
+        arabic_chars = len(_ARABIC_SCRIPT.findall(text))
+        total_chars = len(_WORD_CHAR.findall(text))
         return arabic_chars > total_chars * 0.3 if total_chars > 0 else False
     
     def _has_urdu_script(self, text: str) -> bool:
         """Check if text contains Urdu-specific characters"""
         # Urdu uses additional characters beyond basic Arabic
-        urdu_specific = re.compile(r'[\u0679\u067E\u0686\u0688\u0691\u06BA\u06BE\u06C1\u06C3\u06CC\u06D2]')
-        return len(urdu_specific.findall(text)) > 0
+        return _URDU_SPECIFIC.search(text) is not None
     
     def preprocess_text(self, text: str, language: str) -> str:
         """
         Preprocess text based on detected language
         """
-        # Remove extra whitespaces
-        text = re.sub(r'\s+', ' ', text.strip())
-        
-        if language in ['ar', 'ur']:
-            # Handle Arabic/Urdu punctuation
-            text = re.sub(r'[«»]', '"', text)
-            text = re.sub(r'[،]', ',', text)
-            text = re.sub(r'[؛]', ';', text)
-            text = re.sub(r'[؟]', '?', text)
-            
-            # Handle Quranic verse markers
-            text = re.sub(r'[﴾﴿]', '', text)
-            text = re.sub(r'[۞]', '', text)  # Quranic markers
-            
-            # Convert Arabic-Indic numerals to Western numerals
-            arabic_nums = '٠١٢٣٤٥٦٧٨٩'
-            english_nums = '0123456789'
-            for ar_num, en_num in zip(arabic_nums, english_nums):
-                text = text.replace(ar_num, en_num)
-                
-            # Handle Urdu-specific formatting
-            if language == 'ur':
-                # Remove excessive Urdu punctuation
-                text = re.sub(r'[۔]+', '۔', text)  # Urdu full stop
-                
-        return text
+        return normalize_source_text(text, language)
     
     def split_text_intelligently(self, text: str, language: str, max_length: int = 3500) -> List[str]:
         """
         Split text into chunks based on language-specific sentence boundaries
         """
-        if len(text) <= max_length:
-            return [text]
-        
-        chunks = []
-        
-        # Split text into sentences using regex
-        # Language-specific sentence patterns
-        # if language in ['ar', 'ur']:
-        #     # Arabic/Urdu sentence markers
-        #     sentence_pattern = r'[.!?؟۔।]'
-        # else:
-        #     # Default English pattern
-        #     sentence_pattern = r'[.!?]'
-
-        #sentences = re.split(sentence_pattern, text)
-
-        # # Split text by words
-        # sentences = []
-        # chunk_size = max_length - 500
-        # for i in range(0, len(text), chunk_size):
-        #     sentences.append(text[i:i + chunk_size])
-
-        # Split sentences based on the words
-        words = text.split()
-        sentences = []
-
-        i = 0
-        while i < len(words):
-            sentence = []
-            while i < len(words) and len(' '.join(sentence + [words[i]])) <= 3000:
-                sentence.append(words[i])
-                i += 1
-            
-            if sentence:
-                sentences.append(' '.join(sentence))
-
-        current_chunk = ""
-        
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if not sentence:
-                continue
-            
-            potential_chunk = current_chunk + " " + sentence if current_chunk else sentence
-            
-            if len(potential_chunk) > max_length and current_chunk:
-                chunks.append(current_chunk.strip())
-                current_chunk = sentence
-            else:
-                current_chunk = potential_chunk
-        
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-        
-        return chunks
+        return split_into_chunks(text, max_length)
     
     def translate_chunk(self, text: str, source_lang: str, target_lang: str, retry_count: int = 3) -> str:
         """
         Translate a single chunk with retry logic
         """
+        return self.translate_chunk_detail(text, source_lang, target_lang, retry_count)[0]
+    
+    def translate_chunk_detail(self, text: str, source_lang: str, target_lang: str,
+                               retry_count: int = 3) -> Tuple[str, int, float]:
+        """
+        Translate a single chunk with retry logic
+        
+        Returns:
+            Tuple of (translation or failure marker, provider attempts, seconds taken)
+        """
+        started = time.perf_counter()
+        attempts = 0
+        translated = "[Translation failed after all retries]"
         for attempt in range(retry_count):
             try:
-                # Add delay for rate limiting
+                # Back off this chunk only; other workers keep going
                 if attempt > 0:
-                    time.sleep(self.delay_between_requests * (attempt + 1))
+                    metrics.inc('tafsir_chunk_retries_total', lang=target_lang)
+                    with metrics.span('retry_sleep'):
+                        time.sleep(self.delay_between_requests * (attempt + 1))
                 
-                # Create translator instance for this chunk
-                translator = GoogleTranslator(source=source_lang, target=target_lang)
+                if self.rate_limiter is not None:
+                    with metrics.span('rate_limit_wait'):
+                        self.rate_limiter.acquire()
                 
                 # Perform translation
-                result = translator.translate(text)
+                attempts += 1
+                with metrics.span('provider_request', backend=self.backend.name):
+                    result = self.backend.translate(text, source_lang, target_lang)
                 
                 if result and result.strip():
-                    return result.strip()
+                    translated = result.strip()
+                    break
                     
             except Exception as e:
                 if attempt == retry_count - 1:
-                    return f"[Translation failed: {str(e)}]"
+                    translated = f"[Translation failed: {str(e)}]"
+                    break
                 
                 # Wait longer before retry
-                time.sleep(self.delay_between_requests * 2)
-                
-        return "[Translation failed after all retries]"
+                with metrics.span('retry_sleep'):
+                    time.sleep(self.delay_between_requests * 2)
+        
+        metrics.inc('tafsir_chunk_attempts_total', attempts, lang=target_lang)
+        if translated.startswith("[Translation failed"):
+            metrics.inc('tafsir_chunk_failures_total', lang=target_lang)
+        return translated, attempts, time.perf_counter() - started
     
     def translate_tafsir(self, 
                         input_text: str, 
@@ -226,7 +800,24 @@ class TafsirTranslator:
             source_language: Optional manual language specification (ar/ur)
             preserve_structure: Whether to preserve text structure
         """
+        stream = self.translate_tafsir_stream(input_text, source_language, target_language, preserve_structure)
+        for _ in stream:
+            pass
+        return stream.result
+    
+    def translate_tafsir_stream(self,
+                                input_text: str,
+                                source_language: Optional[str] = None,
+                                target_language: str = "en",
+                                preserve_structure: bool = True) -> 'TranslationStream':
+        """
+        Translate tafsir text, yielding each chunk as soon as it is ready
         
+        Takes the same arguments as translate_tafsir. Iterating the returned
+        stream yields one dict per chunk (chunk_id, total_chunks, original,
+        translated, success) in order; once it is exhausted, stream.result
+        holds the translate_tafsir result.
+        """
         # Detect language if not specified
         if source_language is None:
             detected_lang, confidence, lang_name = self.detect_language(input_text)
@@ -235,84 +826,390 @@ class TafsirTranslator:
             confidence = 1.0
             lang_name = self.supported_languages.get(source_language, source_language)
         
+        if self.memory is not None:
+            # Chunks are built from whole segments so each one can be reused,
+            # and only the segments missing from the memory are grouped into
+            # requests
+            with metrics.span('split'):
+                segments = split_into_segments(input_text, detected_lang, self.backend.max_request_size)
+            known = self.memory.get_many(list(dict.fromkeys(segments)), detected_lang, target_language)
+            groups = group_missing_segments(segments, known, self.backend.max_request_size)
+            metrics.observe('tafsir_chunks_per_request', len(groups))
+            return TranslationStream(self, input_text, ' '.join(segments), [' '.join(group) for group in groups],
+                                     detected_lang, lang_name, confidence, target_language, preserve_structure,
+                                     segment_groups=groups, known_segments=known)
+        
+        # Split into chunks before normalizing, which removes the ﴿﴾ quote
+        # marks the chunker prefers to cut at; normalizing only shortens text,
+        # so every chunk still fits
+        with metrics.span('split'):
+            chunks = self.split_text_intelligently(' '.join(input_text.split()), detected_lang,
+                                                   self.backend.max_request_size)
+        
         # Preprocess text
-        processed_text = self.preprocess_text(input_text, detected_lang)
+        with metrics.span('preprocess'):
+            chunks = [chunk for chunk in normalize_source_batch(chunks, detected_lang) if chunk]
+            processed_text = ' '.join(chunks)
+        metrics.observe('tafsir_chunks_per_request', len(chunks))
         
-        # Split into chunks
-        chunks = self.split_text_intelligently(processed_text, detected_lang)
+        return TranslationStream(self, input_text, processed_text, chunks, detected_lang,
+                                 lang_name, confidence, target_language, preserve_structure)
+    
+    def translate_tafsir_batch(self,
+                               input_texts: List[str],
+                               source_language: str = "ar",
+                               target_language: str = "en") -> List[Dict[str, Union[str, int, List, float]]]:
+        """
+        Translate several tafsir texts, packing short ones into shared requests
         
-        translated_chunks = []
-        failed_chunks = []
+        Texts that fit in the backend's request size are packed together, each
+        preceded by a [[#n]] marker, and the translation is split back on the
+        markers. A request whose markers do not come back intact is retried
+        text by text; texts too long to share a request go through
+        translate_tafsir on their own. Repeated texts are translated once.
+        With a translation memory, the texts' segments are packed instead and
+        segments already in the memory are not requested.
         
-        for i, chunk in enumerate(chunks, 1):
-            
-            translated = self.translate_chunk(chunk, detected_lang, target_language)
-            translated_chunks.append(translated)
-            
+        Returns:
+            One translate_tafsir result per input text, in order
+        """
+        if self.memory is not None:
+            return self._translate_batch_segments(input_texts, source_language, target_language)
+        
+        lang_name = self.supported_languages.get(source_language, source_language)
+        processed_texts = normalize_source_batch(input_texts, source_language)
+        max_size = self.backend.max_request_size
+        results: List[Optional[Dict]] = [None] * len(input_texts)
+        
+        # Identical texts (grouped ayahs share one commentary) are translated once
+        first_seen: Dict[str, int] = {}
+        duplicates = {}
+        for i, text in enumerate(processed_texts):
+            if text in first_seen:
+                duplicates[i] = first_seen[text]
+            else:
+                first_seen[text] = i
+        
+        packs = []
+        singles = []
+        current = []
+        current_size = 0
+        for i, text in enumerate(processed_texts):
+            if i in duplicates:
+                continue
+            size = len(_PACK_MARKER.format(i)) + 1 + len(text)
+            if size > max_size or not text:
+                singles.append(i)
+                continue
+            if current and current_size + 1 + size > max_size:
+                packs.append(current)
+                current = []
+                current_size = 0
+            current.append(i)
+            current_size += size + (1 if current_size else 0)
+        if current:
+            packs.append(current)
+        
+        pending = [
+            '\n'.join(f"{_PACK_MARKER.format(i)} {processed_texts[i]}" for i in pack)
+            for pack in packs
+        ]
+        metrics.observe('tafsir_chunks_per_request', len(pending))
+        translations = self._translate_chunks(pending, source_language, target_language)
+        for pack, (translated, attempts, seconds) in zip(packs, translations):
             if translated.startswith("[Translation failed"):
-                failed_chunks.append(i)
-            
-            # Small delay between chunks
-            time.sleep(self.delay_between_requests)
+                pieces = [translated] * len(pack)
+            else:
+                pieces = _split_pack(translated, pack)
+            if pieces is None:
+                singles.extend(pack)
+                continue
+            for i, piece in zip(pack, pieces):
+                # The shared request's cost is reported against every text in it
+                results[i] = _build_result(self, input_texts[i], processed_texts[i], [processed_texts[i]],
+                                           [piece], [(attempts, seconds)], source_language, lang_name, 1.0)
         
-        # Combine translated chunks
-        if preserve_structure:
-            full_translation = " ".join(translated_chunks)
-        else:
-            full_translation = "\n\n".join(translated_chunks)
-        
-        # Post-process translation
-        full_translation = self._post_process_translation(full_translation)
-        
-        # Calculate success metrics
-        successful_chunks = len(chunks) - len(failed_chunks)
-        success_rate = (successful_chunks / len(chunks)) * 100 if chunks else 0
-        
-        result = {
-            'original_text': input_text,
-            'processed_text': processed_text,
-            'translated_text': full_translation,
-            'detected_language': detected_lang,
-            'language_name': lang_name,
-            'detection_confidence': confidence,
-            'total_chunks': len(chunks),
-            'successful_chunks': successful_chunks,
-            'failed_chunks': failed_chunks,
-            'success_rate': success_rate,
-            'translation_timestamp': datetime.now().isoformat(),
-            'chunks_detail': [
-                {
-                    'chunk_id': i,
-                    'original': chunk,
-                    'translated': trans,
-                    'success': not trans.startswith("[Translation failed")
-                }
-                for i, (chunk, trans) in enumerate(zip(chunks, translated_chunks), 1)
-            ]
-        }
+        for i in sorted(singles):
+            results[i] = self.translate_tafsir(input_texts[i], source_language, target_language)
+        
+        for i, first in duplicates.items():
+            results[i] = dict(results[first], original_text=input_texts[i])
         
-        return result
+        return results
     
-    def _post_process_translation(self, text: str) -> str:
-        """Post-process translation for better readability"""
-        # Remove extra spaces
-        text = re.sub(r'\s+', ' ', text)
-        
-        # Fix punctuation spacing
-        text = re.sub(r'\s+([.!?,:;])', r'\1', text)
-        text = re.sub(r'([.!?])\s*([A-Z])', r'\1 \2', text)
-        
-        # Capitalize sentences
-        sentences = re.split(r'([.!?]+)', text)
-        processed_sentences = []
-        
-        for i, sentence in enumerate(sentences):
-            if i % 2 == 0 and sentence.strip():
-                sentence = sentence.strip()
-                if sentence:
-                    sentence = sentence[0].upper() + sentence[1:] if len(sentence) > 1 else sentence.upper()
-                processed_sentences.append(sentence)
+    def _translate_batch_segments(self, input_texts: List[str], source_language: str,
+                                  target_language: str) -> List[Dict[str, Union[str, int, List, float]]]:
+        """translate_tafsir_batch through the translation memory"""
+        lang_name = self.supported_languages.get(source_language, source_language)
+        max_size = self.backend.max_request_size
+        with metrics.span('split'):
+            text_segments = [split_into_segments(text, source_language, max_size) for text in input_texts]
+        
+        # Each distinct segment is looked up once and requested at most once
+        unique = list(dict.fromkeys(segment for segments in text_segments for segment in segments))
+        known = self.memory.get_many(unique, source_language, target_language)
+        groups = group_segments([segment for segment in unique if segment not in known], max_size)
+        metrics.observe('tafsir_chunks_per_request', len(groups))
+        
+        translations = dict(known)
+        costs = []
+        group_of = {}
+        # Segments of requests whose markers came back altered
+        unmapped = set()
+        translate_group = partial(self._translate_segments, known={}, fallback=False)
+        for n, (group, (pieces, attempts, seconds)) in enumerate(zip(groups, self._translate_chunks(
+                groups, source_language, target_language, translate_group))):
+            if pieces is None:
+                unmapped.update(group)
             else:
-                processed_sentences.append(sentence)
+                translations.update(zip(group, pieces))
+            group_of.update((segment, n) for segment in group)
+            costs.append((attempts, seconds))
         
-        return ''.join(processed_sentences).strip()
+        results = []
+        for input_text, segments in zip(input_texts, text_segments):
+            processed_text = ' '.join(segments)
+            # Every request a text drew segments from is reported against it
+            shared = [costs[n] for n in {group_of[segment] for segment in segments if segment in group_of}]
+            attempts = sum(cost[0] for cost in shared)
+            seconds = sum(cost[1] for cost in shared)
+            if unmapped.intersection(segments):
+                # The text is requested again on its own as plain chunks, which
+                # are not stored in the memory
+                pieces = []
+                for group in group_segments(segments, max_size):
+                    translated, group_attempts, group_seconds = self.translate_chunk_detail(
+                        ' '.join(group), source_language, target_language)
+                    pieces.append(translated)
+                    attempts += group_attempts
+                    seconds += group_seconds
+            else:
+                pieces = [translations[segment] for segment in segments]
+            results.append(_build_result(self, input_text, processed_text, [processed_text],
+                                         [_join_segments(pieces)], [(attempts, seconds)],
+                                         source_language, lang_name, 1.0))
+        return results
+    
+    def _translate_segments(self, segments: List[str], source_lang: str, target_lang: str,
+                            known: Optional[Dict[str, str]] = None,
+                            fallback: bool = True) -> Tuple[Optional[List[str]], int, float]:
+        """
+        Translate a group of segments, reusing the memory where it can
+        
+        Segments missing from the memory are packed behind [[#n]] markers
+        into one request and stored once translated. known holds translations
+        already read from the memory; without it, the memory is read here.
+        If the markers come back altered, each run of consecutive missing
+        segments is requested again as one plain chunk, whose translation is
+        returned as the run's first piece (the rest of the run is empty) and
+        is not stored; with fallback=False, None is returned instead.
+        
+        Returns:
+            Tuple of (translation per segment or None, provider attempts, seconds taken)
+        """
+        started = time.perf_counter()
+        if known is None:
+            known = self.memory.get_many(segments, source_lang, target_lang)
+        missing = [segment for segment in dict.fromkeys(segments) if segment not in known]
+        attempts = 0
+        pieces = []
+        
+        if len(missing) > 1:
+            request = '\n'.join(f"{_PACK_MARKER.format(i)} {segment}" for i, segment in enumerate(missing))
+            translated, attempts, _ = self.translate_chunk_detail(request, source_lang, target_lang)
+            if translated.startswith("[Translation failed"):
+                pieces = [translated] * len(missing)
+            else:
+                pieces = _split_pack(translated, list(range(len(missing))))
+            if pieces is None:
+                metrics.inc('tafsir_memory_pack_mismatches_total')
+                if not fallback:
+                    return None, attempts, time.perf_counter() - started
+                pieces = []
+                for is_missing, run in itertools.groupby(segments, lambda segment: segment not in known):
+                    run = list(run)
+                    if not is_missing:
+                        pieces.extend(known[segment] for segment in run)
+                        continue
+                    translated, plain_attempts, _ = self.translate_chunk_detail(' '.join(run), source_lang, target_lang)
+                    pieces.extend([translated] + [''] * (len(run) - 1))
+                    attempts += plain_attempts
+                return pieces, attempts, time.perf_counter() - started
+        elif missing:
+            translated, attempts, _ = self.translate_chunk_detail(missing[0], source_lang, target_lang)
+            pieces = [translated]
+        
+        new = dict(zip(missing, pieces))
+        self.memory.put_many(new, source_lang, target_lang)
+        return [new.get(segment) or known[segment] for segment in segments], attempts, time.perf_counter() - started
+    
+    def _translate_chunks(self, chunks: List, source_lang: str, target_lang: str,
+                          translate_one=None) -> Iterator[Tuple]:
+        """
+        Yield translate_one(chunk, source_lang, target_lang) for each chunk, in order
+        
+        translate_one defaults to translate_chunk_detail, which gives
+        (translation, attempts, seconds).
+        """
+        translate_one = translate_one or self.translate_chunk_detail
+        # Requests are spaced by the rate limiter rather than a fixed sleep
+        if self.max_workers > 1 and len(chunks) > 1:
+            executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks)))
+            try:
+                futures = [
+                    executor.submit(translate_one, chunk, source_lang, target_lang)
+                    for chunk in chunks
+                ]
+                for future in futures:
+                    yield future.result()
+            finally:
+                # Drop queued chunks if the consumer stops early
+                executor.shutdown(wait=False, cancel_futures=True)
+        else:
+            for chunk in chunks:
+                yield translate_one(chunk, source_lang, target_lang)
+    
+    def _post_process_translation(self, text: str) -> str:
+        """Post-process translation for better readability"""
+        return normalize_translation(text)
+
+
+def _build_result(translator: 'TafsirTranslator', input_text: str, processed_text: str, chunks: List[str],
+                  translated_chunks: List[str], details: List[Tuple[int, float]], detected_lang: str,
+                  lang_name: str, confidence: float,
+                  preserve_structure: bool = True) -> Dict[str, Union[str, int, List, float]]:
+    """Assemble a translate_tafsir result from chunk translations and their (attempts, seconds)"""
+    failed_chunks = [
+        i for i, translated in enumerate(translated_chunks, 1)
+        if translated.startswith("[Translation failed")
+    ]
+    
+    # Combine translated chunks
+    if preserve_structure:
+        full_translation = " ".join(translated_chunks)
+    else:
+        full_translation = "\n\n".join(translated_chunks)
+    
+    # Post-process translation
+    full_translation = translator._post_process_translation(full_translation)
+    
+    # Calculate success metrics
+    successful_chunks = len(chunks) - len(failed_chunks)
+    success_rate = (successful_chunks / len(chunks)) * 100 if chunks else 0
+    
+    return {
+        'original_text': input_text,
+        'processed_text': processed_text,
+        'translated_text': full_translation,
+        'detected_language': detected_lang,
+        'language_name': lang_name,
+        'detection_confidence': confidence,
+        'backend': translator.backend.name,
+        'total_chunks': len(chunks),
+        'successful_chunks': successful_chunks,
+        'failed_chunks': failed_chunks,
+        'success_rate': success_rate,
+        'translation_timestamp': datetime.now().isoformat(),
+        'chunks_detail': [
+            {
+                'chunk_id': i,
+                'original': chunk,
+                'translated': trans,
+                'success': not trans.startswith("[Translation failed"),
+                'attempts': attempts,
+                'duration': seconds,
+            }
+            for i, (chunk, trans, (attempts, seconds)) in enumerate(zip(chunks, translated_chunks, details), 1)
+        ]
+    }
+
+
+def _join_segments(pieces: List[str]) -> str:
+    """Join segment translations, or return the first failure marker among them"""
+    for piece in pieces:
+        if piece.startswith("[Translation failed"):
+            return piece
+    return " ".join(piece for piece in pieces if piece)
+
+
+def _split_pack(translated: str, ids: List[int]) -> Optional[List[str]]:
+    """Split a packed translation on its markers, or None if they came back altered"""
+    markers = list(_PACK_MARKER_PATTERN.finditer(translated))
+    if [int(marker.group(1)) for marker in markers] != ids:
+        return None
+    
+    pieces = []
+    for n, marker in enumerate(markers):
+        end = markers[n + 1].start() if n + 1 < len(markers) else len(translated)
+        pieces.append(translated[marker.end():end].strip())
+    
+    # Anything the provider moved ahead of the first marker belongs to the first text
+    leading = translated[:markers[0].start()].strip()
+    if leading:
+        pieces[0] = f"{leading} {pieces[0]}"
+    
+    if not all(pieces):
+        return None
+    return pieces
+
+
+class TranslationStream:
+    """
+    Chunk-by-chunk progress of one translate_tafsir_stream call
+    
+    Iterating yields each chunk once it and every chunk before it are
+    translated. result is None until the iteration finishes, so a consumer
+    that stops early never sees a partial result.
+    """
+    
+    def __init__(self, translator: TafsirTranslator, input_text: str, processed_text: str,
+                 chunks: List[str], detected_lang: str, lang_name: str, confidence: float,
+                 target_language: str, preserve_structure: bool,
+                 segment_groups: Optional[List[List[str]]] = None,
+                 known_segments: Optional[Dict[str, str]] = None):
+        self.translator = translator
+        self.input_text = input_text
+        self.processed_text = processed_text
+        self.chunks = chunks
+        self.detected_lang = detected_lang
+        self.lang_name = lang_name
+        self.confidence = confidence
+        self.target_language = target_language
+        self.preserve_structure = preserve_structure
+        # The segments each chunk was built from, when translating through the memory
+        self.segment_groups = segment_groups
+        # Their translations already found in the memory
+        self.known_segments = known_segments
+        self.result: Optional[Dict[str, Union[str, int, List, float]]] = None
+    
+    @property
+    def total_chunks(self) -> int:
+        return len(self.chunks)
+    
+    def __iter__(self) -> Iterator[Dict[str, Union[str, int, bool, float]]]:
+        translated_chunks = []
+        details = []
+        if self.segment_groups is not None:
+            translations = (
+                (_join_segments(pieces), attempts, seconds)
+                for pieces, attempts, seconds in self.translator._translate_chunks(
+                    self.segment_groups, self.detected_lang, self.target_language,
+                    partial(self.translator._translate_segments, known=self.known_segments))
+            )
+        else:
+            translations = self.translator._translate_chunks(self.chunks, self.detected_lang, self.target_language)
+        for i, (chunk, (translated, attempts, seconds)) in enumerate(zip(self.chunks, translations), 1):
+            translated_chunks.append(translated)
+            details.append((attempts, seconds))
+            yield {
+                'chunk_id': i,
+                'total_chunks': len(self.chunks),
+                'original': chunk,
+                'translated': translated,
+                'success': not translated.startswith("[Translation failed"),
+                'attempts': attempts,
+                'duration': seconds,
+            }
+        self.result = _build_result(self.translator, self.input_text, self.processed_text, self.chunks,
+                                    translated_chunks, details, self.detected_lang, self.lang_name,
+                                    self.confidence, self.preserve_structure)
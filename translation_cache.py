@@ -0,0 +1,578 @@
+"""
+Translation Cache
+A single-file SQLite store for translated tafsir texts, keyed by
+(language, author, surah, ayah), with the translation stats kept alongside
+"""
+
+import errno
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+FAILURE_MARKER = '[Translation failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS translations (
+    lang TEXT NOT NULL,
+    author TEXT NOT NULL,
+    surah INTEGER NOT NULL,
+    ayah INTEGER NOT NULL,
+    text BLOB NOT NULL,
+    total_chunks INTEGER,
+    success_rate REAL,
+    failed_chunks TEXT NOT NULL DEFAULT '[]',
+    backend TEXT,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (lang, author, surah, ayah)
+) WITHOUT ROWID
+"""
+
+MEMORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    lang TEXT NOT NULL,
+    hash BLOB NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (lang, hash)
+) WITHOUT ROWID
+"""
+
+# SQLite's default limit on bound parameters is 999
+_MEMORY_QUERY_SIZE = 500
+
+# Byte-range lock slots in the translation lock file; keys that share a slot
+# take turns
+LOCK_SLOTS = 1 << 16
+
+# Backoff, in seconds, between retries of a lock the kernel refused with EDEADLK
+LOCK_RETRY_DELAY = 0.001
+LOCK_RETRY_MAX_DELAY = 0.05
+
+
+def _compress(text: str) -> bytes:
+    return zlib.compress(text.encode('utf-8'), 6)
+
+
+def _decompress(data: bytes) -> str:
+    return zlib.decompress(data).decode('utf-8')
+
+
+class TranslationLocks:
+    """
+    Per-ayah locks shared by every thread and process using one cache
+
+    A (lang, author, surah, ayah) key hashes to one of LOCK_SLOTS slots. A
+    slot is held by one thread of a process through a thread lock, and by
+    one process through an fcntl lock on that byte of the lock file, which
+    the system releases if the process dies. Several keys are taken in slot
+    order, so holders never wait on each other in a cycle. Without fcntl
+    (on Windows) the locks only cover the threads of one process.
+    """
+
+    _instances: Dict[Tuple[int, str], 'TranslationLocks'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+        self._guard = threading.Lock()
+        self._threads: Dict[int, threading.Lock] = {}
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644) if fcntl is not None else None
+
+    @classmethod
+    def for_path(cls, path: str) -> 'TranslationLocks':
+        """The process's instance for a lock file"""
+        # fcntl locks belong to the process, and closing any descriptor of the
+        # file drops all of them, so each process opens the file once
+        key = (os.getpid(), os.path.realpath(path))
+        with cls._instances_lock:
+            locks = cls._instances.get(key)
+            if locks is None:
+                locks = cls._instances[key] = cls(path)
+            return locks
+
+    @staticmethod
+    def slot(key: Tuple) -> int:
+        digest = hashlib.blake2b('\x1f'.join(map(str, key)).encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big') % LOCK_SLOTS
+
+    def acquire(self, keys: Iterable[Tuple], blocking: bool = True) -> Optional[List[int]]:
+        """
+        Take the locks for keys
+
+        Returns:
+            The slots held, to pass to release, or None if blocking is False
+            and another holder has one of them
+        """
+        slots = sorted({self.slot(key) for key in keys})
+        held = self._take_all(slots, blocking=False)
+        if held is None and blocking:
+            metrics.inc('tafsir_translation_lock_waits_total')
+            with metrics.span('translation_lock_wait'):
+                held = self._take_all(slots, blocking=True)
+        return held
+
+    def release(self, slots: List[int]) -> None:
+        for slot in reversed(slots):
+            try:
+                if self._fd is not None:
+                    fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, slot)
+            finally:
+                self._threads[slot].release()
+
+    @contextmanager
+    def hold(self, keys: Iterable[Tuple]) -> Iterator[None]:
+        held = self.acquire(keys)
+        try:
+            yield
+        finally:
+            self.release(held)
+
+    def _take_all(self, slots: List[int], blocking: bool) -> Optional[List[int]]:
+        held = []
+        try:
+            for slot in slots:
+                if not self._take(slot, blocking):
+                    break
+                held.append(slot)
+            else:
+                return held
+        except BaseException:
+            # e.g. a spurious EDEADLK from lockf; the slots taken so far must
+            # not stay held
+            self.release(held)
+            raise
+        self.release(held)
+        return None
+
+    def _take(self, slot: int, blocking: bool) -> bool:
+        with self._guard:
+            lock = self._threads.setdefault(slot, threading.Lock())
+        if not lock.acquire(blocking):
+            return False
+        if self._fd is not None:
+            try:
+                self._lock_byte(slot, blocking)
+            except BaseException as e:
+                lock.release()
+                if blocking or not isinstance(e, OSError):
+                    raise
+                return False
+        return True
+
+    def _lock_byte(self, slot: int, blocking: bool) -> None:
+        # fcntl locks belong to the process, so the kernel's deadlock check
+        # sees threads of two processes waiting on each other's slots as a
+        # cycle and fails with EDEADLK, though slots are taken in order and
+        # the holders will release them. Such waits are retried.
+        delay = LOCK_RETRY_DELAY
+        while True:
+            try:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB, 1, slot)
+                return
+            except OSError as e:
+                if not blocking or e.errno != errno.EDEADLK:
+                    raise
+            time.sleep(delay * (0.5 + random.random()))
+            delay = min(delay * 2, LOCK_RETRY_MAX_DELAY)
+
+
+class TranslationCache:
+    """
+    SQLite-backed translation cache
+
+    The database runs in WAL mode so readers never block the writer, and each
+    write is a single transaction. Only fully successful translations are
+    stored; results with failed chunks are left uncached so they are retried
+    on the next request. Entries from the legacy cache/<lang>/<author>/ tree
+    are imported on first lookup, or only read with store_legacy=False. The
+    locks attribute serializes translations of the same ayah through a lock
+    file next to the database.
+    """
+
+    def __init__(self, db_path: str = 'cache/translations.db', legacy_folder: Optional[str] = 'cache',
+                 store_legacy: bool = True):
+        self.db_path = db_path
+        self.legacy_folder = legacy_folder
+        self.store_legacy = store_legacy
+        self._local = threading.local()
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(SCHEMA)
+        conn.commit()
+        self.locks = TranslationLocks.for_path(f'{db_path}.lock')
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get_entry(self, lang: str, author: str, surah: int, ayah: int) -> Optional[Dict]:
+        """Return the cached translation with its stats, or None on a miss"""
+        with metrics.span('cache_read'):
+            entry = self._lookup(lang, author, surah, ayah)
+        metrics.inc('tafsir_cache_requests_total', lang=lang, result='hit' if entry is not None else 'miss')
+        return entry
+
+    def _lookup(self, lang: str, author: str, surah: int, ayah: int) -> Optional[Dict]:
+        row = self._connection().execute(
+            'SELECT text, total_chunks, success_rate, failed_chunks, backend, created_at '
+            'FROM translations WHERE lang = ? AND author = ? AND surah = ? AND ayah = ?',
+            (lang, author, surah, ayah)
+        ).fetchone()
+
+        if row is None:
+            return self._import_legacy(lang, author, surah, ayah)
+
+        text, total_chunks, success_rate, failed_chunks, backend, created_at = row
+        return {
+            'translated_text': _decompress(text),
+            'total_chunks': total_chunks,
+            'success_rate': success_rate,
+            'failed_chunks': json.loads(failed_chunks),
+            'backend': backend,
+            'translation_timestamp': created_at,
+        }
+
+    def get(self, lang: str, author: str, surah: int, ayah: int) -> Optional[str]:
+        """Return the cached translated text, or None on a miss"""
+        entry = self.get_entry(lang, author, surah, ayah)
+        return entry['translated_text'] if entry else None
+
+    def get_many(self, lang: str, author: str, surah: int, ayahs: Iterable[int]) -> Dict[int, str]:
+        """Return {ayah: translated text} for the cached ayahs among several of one surah"""
+        ayahs = list(ayahs)
+        if not ayahs:
+            return {}
+        with metrics.span('cache_read'):
+            placeholders = ', '.join('?' * len(ayahs))
+            rows = self._connection().execute(
+                'SELECT ayah, text FROM translations '
+                f'WHERE lang = ? AND author = ? AND surah = ? AND ayah IN ({placeholders})',
+                (lang, author, surah, *ayahs)
+            ).fetchall()
+            texts = {ayah: _decompress(text) for ayah, text in rows}
+
+            for ayah in ayahs:
+                if ayah not in texts:
+                    entry = self._import_legacy(lang, author, surah, ayah)
+                    if entry is not None:
+                        texts[ayah] = entry['translated_text']
+        metrics.inc('tafsir_cache_requests_total', len(texts), lang=lang, result='hit')
+        metrics.inc('tafsir_cache_requests_total', len(ayahs) - len(texts), lang=lang, result='miss')
+        return texts
+
+    def contains(self, lang: str, author: str, surah: int, ayah: int) -> bool:
+        """Whether an ayah is cached; a probe, not counted as a cache request"""
+        row = self._connection().execute(
+            'SELECT 1 FROM translations WHERE lang = ? AND author = ? AND surah = ? AND ayah = ?',
+            (lang, author, surah, ayah)
+        ).fetchone()
+        return row is not None or self._import_legacy(lang, author, surah, ayah) is not None
+
+    def put(self, lang: str, author: str, surah: int, ayah: int,
+            result: Dict, backend: Optional[str] = None) -> bool:
+        """
+        Store a translate_tafsir result
+
+        Args:
+            result: The dict returned by TafsirTranslator.translate_tafsir
+            backend: Name of the translation backend; defaults to result['backend']
+
+        Returns:
+            True if the result was stored, False if it had failed chunks
+        """
+        text = result['translated_text']
+        if result.get('failed_chunks') or FAILURE_MARKER in text:
+            return False
+
+        self._write(
+            lang, author, surah, ayah, text,
+            total_chunks=result.get('total_chunks'),
+            success_rate=result.get('success_rate'),
+            failed_chunks=result.get('failed_chunks', []),
+            backend=backend or result.get('backend'),
+            created_at=result.get('translation_timestamp') or datetime.now().isoformat(),
+        )
+        return True
+
+    def _write(self, lang: str, author: str, surah: int, ayah: int, text: str,
+               total_chunks: Optional[int], success_rate: Optional[float],
+               failed_chunks, backend: Optional[str], created_at: str) -> None:
+        conn = self._connection()
+        with metrics.span('cache_write'), conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO translations '
+                '(lang, author, surah, ayah, text, total_chunks, success_rate, failed_chunks, backend, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (lang, author, surah, ayah, _compress(text), total_chunks, success_rate,
+                 json.dumps(list(failed_chunks)), backend, created_at)
+            )
+
+    def legacy_path(self, lang: str, author: str, surah: int, ayah: int) -> Optional[str]:
+        if not self.legacy_folder:
+            return None
+        return os.path.join(self.legacy_folder, lang, author, f"{surah}_{ayah}.txt")
+
+    def _import_legacy(self, lang: str, author: str, surah: int, ayah: int) -> Optional[Dict]:
+        path = self.legacy_path(lang, author, surah, ayah)
+        if not path or not os.path.exists(path):
+            return None
+
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+
+        # Failed translations were written to the old tree as well
+        if FAILURE_MARKER in text:
+            return None
+
+        created_at = datetime.fromtimestamp(os.path.getmtime(path)).isoformat()
+        if self.store_legacy:
+            self._write(lang, author, surah, ayah, text, total_chunks=None, success_rate=None,
+                        failed_chunks=[], backend='legacy', created_at=created_at)
+        return {
+            'translated_text': text,
+            'total_chunks': None,
+            'success_rate': None,
+            'failed_chunks': [],
+            'backend': 'legacy',
+            'translation_timestamp': created_at,
+        }
+
+    def keys(self, lang: Optional[str] = None) -> Iterator[Tuple[str, str, int, int]]:
+        """Yield (lang, author, surah, ayah) for stored entries"""
+        query = 'SELECT lang, author, surah, ayah FROM translations'
+        params = ()
+        if lang is not None:
+            query += ' WHERE lang = ?'
+            params = (lang,)
+        yield from self._connection().execute(query, params)
+
+    def close(self) -> None:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class TranslationMemory:
+    """
+    Segment-level translation memory
+
+    Stores the translation of each normalized source segment (a sentence or
+    a ﴿...﴾ quote) keyed by the segment's hash and the target language, so
+    a quote or formula repeated across commentaries is sent to the provider
+    once per language. Lives in the translation cache's database and keeps
+    lookup counts for its hit rate.
+    """
+
+    def __init__(self, db_path: str = 'cache/translations.db'):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(MEMORY_SCHEMA)
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def segment_hash(segment: str, source_lang: str) -> bytes:
+        return hashlib.blake2b(f"{source_lang}\x00{segment}".encode('utf-8'), digest_size=16).digest()
+
+    def get_many(self, segments: Iterable[str], source_lang: str, lang: str) -> Dict[str, str]:
+        """Return {segment: translation} for the stored segments among several"""
+        hashes = {self.segment_hash(segment, source_lang): segment for segment in segments}
+        if not hashes:
+            return {}
+        found = {}
+        keys = list(hashes)
+        with metrics.span('memory_read'):
+            conn = self._connection()
+            for start in range(0, len(keys), _MEMORY_QUERY_SIZE):
+                batch = keys[start:start + _MEMORY_QUERY_SIZE]
+                rows = conn.execute(
+                    f"SELECT hash, text FROM segments WHERE lang = ? AND hash IN ({', '.join('?' * len(batch))})",
+                    (lang, *batch)
+                ).fetchall()
+                found.update((hashes[key], text) for key, text in rows)
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(hashes) - len(found)
+        metrics.inc('tafsir_memory_requests_total', len(found), lang=lang, result='hit')
+        metrics.inc('tafsir_memory_requests_total', len(hashes) - len(found), lang=lang, result='miss')
+        return found
+
+    def put_many(self, translations: Dict[str, str], source_lang: str, lang: str) -> None:
+        """Store {segment: translation}, skipping failed translations"""
+        rows = [
+            (lang, self.segment_hash(segment, source_lang), translated)
+            for segment, translated in translations.items()
+            if translated and FAILURE_MARKER not in translated
+        ]
+        if not rows:
+            return
+        conn = self._connection()
+        with metrics.span('memory_write'), conn:
+            conn.executemany('INSERT OR REPLACE INTO segments (lang, hash, text) VALUES (?, ?, ?)', rows)
+
+    def stats(self) -> Dict[str, float]:
+        """Lookup counts since this instance was created, with the hit rate"""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {'hits': hits, 'misses': misses, 'hit_rate': hits / total if total else 0.0}
+
+    def __len__(self) -> int:
+        return self._connection().execute('SELECT COUNT(*) FROM segments').fetchone()[0]
+
+    def close(self) -> None:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def translation_memory(db_path: str = 'cache/translations.db') -> Optional[TranslationMemory]:
+    """
+    The translation memory for db_path if TAFSIR_TRANSLATION_MEMORY=1, else None
+
+    The memory is off by default: on a random sample of ayahs it reuses few
+    segments and sends slightly more provider requests than plain chunking.
+    """
+    if os.environ.get('TAFSIR_TRANSLATION_MEMORY', '0') != '1':
+        return None
+    return TranslationMemory(db_path)
+
+
+def translate_and_store(cache: TranslationCache, translator, text: str, lang: str,
+                        author: str, surah: int, ayah: int,
+                        source_lang: str = 'ar',
+                        cancelled: Optional[Callable[[], bool]] = None) -> Tuple[Optional[Dict], bool]:
+    """
+    Translate an ayah's tafsir text and write it through the cache
+
+    The ayah's lock is held while it is translated, and the cache is checked
+    again once the lock is taken, so of several threads or processes asking
+    for the same ayah at once only the first translates; the others wait and
+    return the entry it stored. cancelled, when given, is called before each
+    chunk after the first; once it returns True the remaining chunks are
+    dropped and nothing is stored.
+
+    Returns:
+        Tuple of (translate_tafsir result or cached entry, whether it is
+        cached); the result is None if the translation was cancelled
+    """
+    with cache.locks.hold([(lang, author, surah, ayah)]):
+        entry = shared_entry(cache, lang, author, surah, ayah)
+        if entry is not None:
+            return entry, True
+        started = time.perf_counter()
+        if cancelled is None:
+            result = translator.translate_tafsir(text, source_lang, lang)
+        else:
+            stream = translator.translate_tafsir_stream(text, source_lang, lang)
+            for chunk in stream:
+                if chunk['chunk_id'] < chunk['total_chunks'] and cancelled():
+                    return None, False
+            result = stream.result
+        metrics.observe('tafsir_translation_seconds', time.perf_counter() - started, lang=lang, author=author)
+        stored = cache.put(lang, author, surah, ayah, result)
+    return result, stored
+
+
+def shared_entry(cache: TranslationCache, lang: str, author: str, surah: int, ayah: int) -> Optional[Dict]:
+    """
+    Look an ayah up again once its lock is held
+
+    An entry found now was stored by the translation the caller waited on.
+    """
+    with metrics.span('cache_read'):
+        entry = cache._lookup(lang, author, surah, ayah)
+    if entry is not None:
+        metrics.inc('tafsir_translations_shared_total', lang=lang)
+    return entry
+
+
+def translate_and_store_batch(cache: TranslationCache, translator, texts: Dict[int, str], lang: str,
+                              author: str, surah: int,
+                              source_lang: str = 'ar') -> Dict[int, Tuple[Dict, bool]]:
+    """
+    Translate several ayahs of one surah in shared requests and cache each ayah
+
+    Like translate_and_store, the ayahs' locks are held throughout, and
+    ayahs cached by the time they are taken are not translated again.
+
+    Returns:
+        {ayah: (translate_tafsir result or cached entry, whether it is cached)}
+    """
+    with cache.locks.hold([(lang, author, surah, ayah) for ayah in texts]):
+        done = {}
+        for ayah in texts:
+            entry = shared_entry(cache, lang, author, surah, ayah)
+            if entry is not None:
+                done[ayah] = (entry, True)
+        ayahs = [ayah for ayah in texts if ayah not in done]
+        if ayahs:
+            started = time.perf_counter()
+            with metrics.span('translate_batch', lang=lang, author=author):
+                results = translator.translate_tafsir_batch([texts[ayah] for ayah in ayahs], source_lang, lang)
+            # Every ayah of the batch waited for the whole batch
+            elapsed = time.perf_counter() - started
+            for ayah, result in zip(ayahs, results):
+                metrics.observe('tafsir_translation_seconds', elapsed, lang=lang, author=author)
+                done[ayah] = (result, cache.put(lang, author, surah, ayah, result))
+    return {ayah: done[ayah] for ayah in texts}
+
+
+def get_or_translate(cache: TranslationCache, translator, text: str, lang: str,
+                     author: str, surah: int, ayah: int,
+                     source_lang: str = 'ar') -> Tuple[str, Optional[Dict]]:
+    """
+    Return the translation of an ayah's tafsir, translating it on a cache miss
+
+    Returns:
+        Tuple of (translated text, translate_tafsir result or None on a cache hit)
+    """
+    cached = cache.get(lang, author, surah, ayah)
+    if cached is not None:
+        return cached, None
+    result, _ = translate_and_store(cache, translator, text, lang, author, surah, ayah, source_lang)
+    return result['translated_text'], result